@@ -1,3 +1,7 @@
+// Derived measures are written in terms of additive measures (sums and counts)
+// so Cube can answer them from the rollups below instead of scanning fct_orders.
+// meta.synonyms are matched by the Streamlit app and MCP server (cube_metrics.py)
+// to route metric questions to Cube.
 cube('Orders', {
   sql: `SELECT * FROM lakehouse.dbt_marts.fct_orders`,
   
@@ -7,33 +11,38 @@ cube('Orders', {
       sql: `revenue`,
       type: `sum`,
       format: `currency`,
-      description: 'Total revenue from all orders'
+      description: 'Total revenue from all orders',
+      meta: { synonyms: ['revenue', 'sales', 'turnover'] }
     },
     
     avgOrderValue: {
-      sql: `revenue`,
-      type: `avg`,
+      sql: `${totalRevenue} / NULLIF(${orderCount}, 0)`,
+      type: `number`,
       format: `currency`,
-      description: 'Average order value'
+      description: 'Average order value',
+      meta: { synonyms: ['aov', 'average order', 'average revenue per order'] }
     },
     
     // ========== BEHAVIORAL METRICS FROM LAKEHOUSE ==========
     totalPageViews: {
       sql: `customer_page_views`,
       type: `sum`,
-      description: 'Total page views from lakehouse data'
+      description: 'Total page views from lakehouse data',
+      meta: { synonyms: ['page views', 'views'] }
     },
     
     totalCartAdds: {
       sql: `customer_cart_adds`,
       type: `sum`,
-      description: 'Total items added to cart'
+      description: 'Total items added to cart',
+      meta: { synonyms: ['cart adds', 'add to cart'] }
     },
     
     totalPurchases: {
       sql: `customer_purchases`,
       type: `sum`,
-      description: 'Total purchase events'
+      description: 'Total purchase events',
+      meta: { synonyms: ['purchases'] }
     },
     
     // ========== COMPLEX CALCULATED METRICS ==========
@@ -41,69 +50,88 @@ cube('Orders', {
     conversionRate: {
       sql: `
         CASE 
-          WHEN SUM(${CUBE}.customer_page_views) > 0 
-          THEN (CAST(SUM(${CUBE}.customer_purchases) AS DOUBLE) / CAST(SUM(${CUBE}.customer_page_views) AS DOUBLE)) * 100
+          WHEN ${totalPageViews} > 0 
+          THEN (CAST(${totalPurchases} AS DOUBLE) / CAST(${totalPageViews} AS DOUBLE)) * 100
           ELSE 0 
         END
       `,
       type: `number`,
       format: `percent`,
-      description: 'Purchase conversion rate'
+      description: 'Purchase conversion rate',
+      meta: { synonyms: ['conversion', 'conversion rate'] }
     },
     
     cartConversionRate: {
       sql: `
         CASE 
-          WHEN SUM(${CUBE}.customer_cart_adds) > 0 
-          THEN (CAST(SUM(${CUBE}.customer_purchases) AS DOUBLE) / CAST(SUM(${CUBE}.customer_cart_adds) AS DOUBLE)) * 100
+          WHEN ${totalCartAdds} > 0 
+          THEN (CAST(${totalPurchases} AS DOUBLE) / CAST(${totalCartAdds} AS DOUBLE)) * 100
           ELSE 0 
         END
       `,
       type: `number`,
       format: `percent`,
-      description: 'Cart to purchase conversion'
+      description: 'Cart to purchase conversion',
+      meta: { synonyms: ['cart conversion', 'cart conversion rate'] }
     },
     
     revenuePerPageView: {
       sql: `
         CASE 
-          WHEN SUM(${CUBE}.customer_page_views) > 0 
-          THEN SUM(${CUBE}.revenue) / NULLIF(SUM(${CUBE}.customer_page_views), 0)
+          WHEN ${totalPageViews} > 0 
+          THEN ${totalRevenue} / NULLIF(${totalPageViews}, 0)
           ELSE 0 
         END
       `,
       type: `number`,
       format: `currency`,
-      description: 'Revenue per page view'
+      description: 'Revenue per page view',
+      meta: { synonyms: ['revenue per view'] }
     },
     
     // ========== SUSTAINABILITY METRICS ==========
     
-    avgSustainabilityScore: {
+    // Sum and count of scores so the average can be re-aggregated from rollups
+    sustainabilityScoreTotal: {
+      sql: `sustainability_score`,
+      type: `sum`,
+      shown: false
+    },
+    
+    sustainabilityScoreCount: {
       sql: `sustainability_score`,
-      type: `avg`,
+      type: `count`,
+      shown: false
+    },
+    
+    avgSustainabilityScore: {
+      sql: `CAST(${sustainabilityScoreTotal} AS DOUBLE) / NULLIF(${sustainabilityScoreCount}, 0)`,
+      type: `number`,
       format: `number`,
-      description: 'Average sustainability score'
+      description: 'Average sustainability score',
+      meta: { synonyms: ['sustainability score', 'sustainability', 'average sustainability'] }
     },
     
     sustainableRevenue: {
       sql: `CASE WHEN sustainability_score >= 80 THEN revenue ELSE 0 END`,
       type: `sum`,
       format: `currency`,
-      description: 'Revenue from sustainable suppliers'
+      description: 'Revenue from sustainable suppliers',
+      meta: { synonyms: ['sustainable revenue', 'sustainable sales'] }
     },
     
     sustainableRevenuePercent: {
       sql: `
         CASE 
-          WHEN SUM(${CUBE}.revenue) > 0 
-          THEN (SUM(CASE WHEN ${CUBE}.sustainability_score >= 80 THEN ${CUBE}.revenue ELSE 0 END) / SUM(${CUBE}.revenue)) * 100
+          WHEN ${totalRevenue} > 0 
+          THEN (${sustainableRevenue} / ${totalRevenue}) * 100
           ELSE 0 
         END
       `,
       type: `number`,
       format: `percent`,
-      description: 'Percent revenue from sustainable suppliers'
+      description: 'Percent revenue from sustainable suppliers',
+      meta: { synonyms: ['sustainable revenue share', 'sustainable share', 'share of sustainable revenue'] }
     },
     
     // ========== COUNT METRICS ==========
@@ -111,19 +139,23 @@ cube('Orders', {
     orderCount: {
       sql: `order_id`,
       type: `count`,
-      description: 'Number of orders'
+      description: 'Number of orders',
+      meta: { synonyms: ['number of orders', 'how many orders', 'order volume'] }
     },
     
+    // Distinct counts are not additive: only served from a rollup at its exact grain
     customerCount: {
       sql: `customer_id`,
       type: `countDistinct`,
-      description: 'Unique customers'
+      description: 'Unique customers',
+      meta: { synonyms: ['number of customers', 'how many customers', 'unique customers'] }
     },
     
     ordersPerCustomer: {
-      sql: `COUNT(${CUBE}.order_id) / NULLIF(COUNT(DISTINCT ${CUBE}.customer_id), 0)`,
+      sql: `CAST(${orderCount} AS DOUBLE) / NULLIF(${customerCount}, 0)`,
       type: `number`,
-      description: 'Orders per customer'
+      description: 'Orders per customer',
+      meta: { synonyms: ['orders per customer'] }
     }
   },
   
@@ -143,31 +175,36 @@ cube('Orders', {
     
     orderDate: {
       sql: `CAST(order_date AS TIMESTAMP)`,
-      type: `time`
+      type: `time`,
+      meta: { synonyms: ['date', 'order date'] }
     },
     
     // ========== PRODUCT DIMENSIONS ==========
     
     productName: {
       sql: `product_name`,
-      type: `string`
+      type: `string`,
+      meta: { synonyms: ['product', 'products'] }
     },
     
     productCategory: {
       sql: `product_category`,
-      type: `string`
+      type: `string`,
+      meta: { synonyms: ['category', 'categories'] }
     },
     
     // ========== SUPPLIER DIMENSIONS ==========
     
     supplierName: {
       sql: `supplier_name`,
-      type: `string`
+      type: `string`,
+      meta: { synonyms: ['supplier', 'suppliers'] }
     },
     
     supplierCountry: {
       sql: `supplier_country`,
-      type: `string`
+      type: `string`,
+      meta: { synonyms: ['country', 'countries'] }
     },
     
     // ========== SEGMENTS ==========
@@ -181,7 +218,8 @@ cube('Orders', {
           ELSE 'Needs Improvement'
         END
       `,
-      type: `string`
+      type: `string`,
+      meta: { synonyms: ['sustainability tier', 'tier'] }
     },
     
     revenueSegment: {
@@ -192,11 +230,14 @@ cube('Orders', {
           ELSE 'Low Value'
         END
       `,
-      type: `string`
+      type: `string`,
+      meta: { synonyms: ['revenue segment', 'segment', 'value segment'] }
     }
   },
   
   // ========== PRE-AGGREGATIONS ==========
+  // Only additive measures are stored; the derived measures above are computed
+  // from them, so e.g. avgOrderValue by quarter is served from the monthly rollup.
   
   preAggregations: {
     // Monthly rollup by country and category
@@ -207,7 +248,10 @@ cube('Orders', {
         orderCount,
         totalPageViews,
         totalCartAdds,
-        avgSustainabilityScore
+        totalPurchases,
+        sustainableRevenue,
+        sustainabilityScoreTotal,
+        sustainabilityScoreCount
       ],
       dimensions: [
         supplierCountry,
@@ -215,6 +259,30 @@ cube('Orders', {
       ],
       timeDimension: orderDate,
       granularity: `month`,
+      partitionGranularity: `year`,
+      refreshKey: {
+        every: `1 hour`
+      }
+    },
+    
+    // Monthly rollup by supplier and sustainability tier
+    supplierMonthly: {
+      type: `rollup`,
+      measures: [
+        totalRevenue,
+        orderCount,
+        sustainableRevenue,
+        sustainabilityScoreTotal,
+        sustainabilityScoreCount
+      ],
+      dimensions: [
+        supplierName,
+        supplierCountry,
+        sustainabilityTier
+      ],
+      timeDimension: orderDate,
+      granularity: `month`,
+      partitionGranularity: `year`,
       refreshKey: {
         every: `1 hour`
       }
@@ -224,6 +292,7 @@ cube('Orders', {
     conversionMetrics: {
       type: `rollup`,
       measures: [
+        totalRevenue,
         totalPageViews,
         totalCartAdds,
         totalPurchases,
@@ -0,0 +1,32 @@
+{#
+  Incremental window for order models, keyed on order_id / order_date.
+
+  Selects orders the target has not seen yet (order_id above its high-water
+  mark, whatever their order_date, so late-arriving orders are picked up)
+  plus every order dated within var('order_lookback_days') of the latest
+  order_date, so recent orders that changed are merged again.
+
+  The bounds are read from {{ this }} at compile time and rendered as
+  literals, so Trino pushes them down to the federated sources instead of
+  scanning their full history. Deleted or cancelled orders and changes
+  older than the lookback window are only picked up by a full refresh
+  (dbt run --full-refresh). The same holds for product and supplier
+  attributes joined in from stg_products / stg_suppliers: orders that were
+  already merged keep the names, category and sustainability_score they
+  were enriched with.
+#}
+{% macro incremental_orders_filter(order_id_column='order_id', order_date_column='order_date') %}
+    {%- if not is_incremental() -%}
+        1 = 1
+    {%- else -%}
+        {%- set bounds = run_query("SELECT max(order_id), max(order_date) FROM " ~ this) if execute else none -%}
+        {%- set max_order_id = bounds.columns[0].values()[0] if bounds else none -%}
+        {%- set max_order_date = bounds.columns[1].values()[0] if bounds else none -%}
+        {%- if max_order_id is none -%}
+            1 = 1
+        {%- else -%}
+            ({{ order_id_column }} > {{ max_order_id }}
+             OR {{ order_date_column }} >= DATE '{{ max_order_date }}' - INTERVAL '{{ var("order_lookback_days") }}' DAY)
+        {%- endif -%}
+    {%- endif -%}
+{% endmacro %}
@@ -1,10 +1,14 @@
 -- Federation query: Join PostgreSQL orders with MySQL products/suppliers
 {{ config(
-    materialized='table'
+    materialized='incremental',
+    incremental_strategy='merge',
+    unique_key='order_id',
+    on_schema_change='append_new_columns'
 ) }}
 
 WITH orders AS (
     SELECT * FROM {{ ref('stg_orders') }}
+    WHERE {{ incremental_orders_filter() }}
 ),
 
 products AS (
@@ -1,7 +1,13 @@
-{{ config(materialized='table') }}
+{{ config(
+    materialized='incremental',
+    incremental_strategy='merge',
+    unique_key='order_id',
+    on_schema_change='append_new_columns'
+) }}
 
 WITH orders AS (
     SELECT * FROM {{ ref('stg_orders') }}
+    WHERE {{ incremental_orders_filter() }}
 ),
 
 products AS (
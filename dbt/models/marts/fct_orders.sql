@@ -1,11 +1,18 @@
-{{ config(materialized='table') }}
+{{ config(
+    materialized='incremental',
+    incremental_strategy='merge',
+    unique_key='order_id',
+    on_schema_change='append_new_columns'
+) }}
 
 WITH enriched_orders AS (
     SELECT * FROM {{ ref('int_orders_enriched') }}
+    WHERE {{ incremental_orders_filter() }}
 ),
 
 behavior_orders AS (
     SELECT * FROM {{ ref('int_orders_with_behavior') }}
+    WHERE {{ incremental_orders_filter() }}
 )
 
 SELECT
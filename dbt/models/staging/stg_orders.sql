@@ -1,3 +1,11 @@
+-- Incremental: only new and recently dated orders are read from PostgreSQL
+{{ config(
+    materialized='incremental',
+    incremental_strategy='merge',
+    unique_key='order_id',
+    on_schema_change='append_new_columns'
+) }}
+
 SELECT
     order_id,
     customer_id,
@@ -8,3 +16,4 @@ SELECT
 FROM postgres.public.orders
 WHERE amount > 0
     AND status = 'completed'
+    AND {{ incremental_orders_filter() }}
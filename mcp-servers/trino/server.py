@@ -3,10 +3,28 @@
 Trino MCP Server - Enables Claude to query your lakehouse
 """
 import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 from mcp.server import Server
 from mcp.types import Tool, TextContent
 import trino.dbapi
 import logging
+from dotenv import load_dotenv
+
+# Shared helpers (connection pool, schema cache) live next to the Streamlit app
+APP_DIR = Path(__file__).resolve().parents[2] / "streamlit-app"
+sys.path.insert(0, str(APP_DIR))
+from trino_pool import TrinoConnectionPool
+from schema_cache import SchemaCache, default_cache_dir
+from cost_gate import estimate_cost, check_budget, describe_estimate
+from sql_guard import guard_sql
+from cube_metrics import CubeClient
+from table_profile import ProfileCache
 
 # Setup logging
 logging.basicConfig(
@@ -17,6 +35,115 @@ logger = logging.getLogger(__name__)
 
 app = Server("trino-lakehouse")
 
+# Configuration (set via the "env" block of the MCP client config, which takes
+# precedence over the Streamlit app's .env)
+load_dotenv(APP_DIR / ".env")
+TRINO_HOST = os.getenv("TRINO_HOST", "localhost")
+TRINO_PORT = int(os.getenv("TRINO_PORT", "8080"))
+TRINO_USER = os.getenv("TRINO_USER", "admin")
+TRINO_CATALOG = os.getenv("TRINO_CATALOG", "lakehouse")
+TRINO_SCHEMA = os.getenv("TRINO_SCHEMA", "dbt_marts")
+# Comma-separated Trino session properties, e.g. "query_max_run_time=5m,query_max_memory=2GB"
+TRINO_SESSION_PROPERTIES = os.getenv("TRINO_SESSION_PROPERTIES", "")
+TRINO_POOL_MAX_SIZE = int(os.getenv("TRINO_POOL_MAX_SIZE", "4"))
+TRINO_POOL_IDLE_TIMEOUT = float(os.getenv("TRINO_POOL_IDLE_TIMEOUT", "300"))
+TRINO_POOL_HEALTH_CHECK_INTERVAL = float(os.getenv("TRINO_POOL_HEALTH_CHECK_INTERVAL", "30"))
+# Tool calls run in worker threads; at most this many at once, each cancelled after the timeout
+MCP_MAX_CONCURRENT_CALLS = int(os.getenv("MCP_MAX_CONCURRENT_CALLS", str(TRINO_POOL_MAX_SIZE)))
+MCP_TOOL_TIMEOUT = float(os.getenv("MCP_TOOL_TIMEOUT", "120"))
+# Outer LIMIT injected into (or tightened on) every query_trino statement
+MCP_QUERY_LIMIT = int(os.getenv("MCP_QUERY_LIMIT", "1000"))
+# Pre-flight EXPLAIN budget for query_trino (same variables as the Streamlit app)
+COST_GATE_MAX_SCAN_GB = float(os.getenv("COST_GATE_MAX_SCAN_GB", "10"))
+COST_GATE_MAX_SCAN_ROWS = int(os.getenv("COST_GATE_MAX_SCAN_ROWS", "1000000000"))
+# Cube REST API for query_metrics (same variables as the Streamlit app)
+CUBE_API_URL = os.getenv("CUBE_API_URL", "http://localhost:4000/cubejs-api/v1")
+CUBE_API_SECRET = os.getenv("CUBE_API_SECRET", "")
+CUBE_API_TOKEN = os.getenv("CUBE_API_TOKEN", "")
+CUBE_TIMEOUT = float(os.getenv("CUBE_TIMEOUT", "10"))
+# sample_table: TABLESAMPLE BERNOULLI percentage and row cap
+MCP_SAMPLE_PERCENT = float(os.getenv("MCP_SAMPLE_PERCENT", "1"))
+MCP_SAMPLE_MAX_ROWS = int(os.getenv("MCP_SAMPLE_MAX_ROWS", "100"))
+# Sampling rate is raised so about this many times the requested rows are expected
+SAMPLE_OVERSAMPLING = 3
+# profile_table: profiles are reused until the Iceberg snapshot changes (non-Iceberg tables: this many seconds)
+MCP_PROFILE_TTL = float(os.getenv("MCP_PROFILE_TTL", "86400"))
+# Unknown table names reload the schema cache at most this often (seconds)
+MCP_SCHEMA_REFRESH_INTERVAL = float(os.getenv("MCP_SCHEMA_REFRESH_INTERVAL", "60"))
+
+# Created in main() and shared by every tool call
+pool = None
+executor = None
+call_slots = asyncio.Semaphore(MCP_MAX_CONCURRENT_CALLS)
+# Same on-disk cache file as the Streamlit app, so metadata is introspected once
+schema_cache = SchemaCache(TRINO_CATALOG, source=f"{TRINO_HOST}:{TRINO_PORT}")
+profile_cache = ProfileCache(TRINO_CATALOG, default_cache_dir() / "profiles.sqlite", ttl=MCP_PROFILE_TTL)
+cube_client = CubeClient(
+    CUBE_API_URL,
+    token=CUBE_API_TOKEN or None,
+    secret=CUBE_API_SECRET or None,
+    timeout=CUBE_TIMEOUT
+)
+last_forced_refresh = 0.0
+forced_refresh_lock = threading.Lock()
+
+def parse_session_properties(value: str) -> dict:
+    """Parse "key=value,key=value" into a dict"""
+    properties = {}
+    for item in value.split(","):
+        if "=" in item:
+            key, val = item.split("=", 1)
+            properties[key.strip()] = val.strip()
+    return properties
+
+def create_pool() -> TrinoConnectionPool:
+    """Long-lived, health-checked Trino connection pool for the server's lifetime"""
+    session_properties = parse_session_properties(TRINO_SESSION_PROPERTIES)
+    return TrinoConnectionPool(
+        lambda: trino.dbapi.connect(
+            host=TRINO_HOST,
+            port=TRINO_PORT,
+            user=TRINO_USER,
+            catalog=TRINO_CATALOG,
+            schema=TRINO_SCHEMA,
+            session_properties=session_properties
+        ),
+        max_size=TRINO_POOL_MAX_SIZE,
+        idle_timeout=TRINO_POOL_IDLE_TIMEOUT,
+        health_check_interval=TRINO_POOL_HEALTH_CHECK_INTERVAL
+    )
+
+class ToolCall:
+    """Cursors opened by one tool call, so a timeout can cancel their Trino queries"""
+
+    def __init__(self):
+        self.cancelled = False
+        self._cursors = []
+        self._lock = threading.Lock()
+
+    def cursor(self, conn):
+        cursor = conn.cursor()
+        with self._lock:
+            if self.cancelled:
+                raise TimeoutError("Tool call cancelled")
+            self._cursors.append(cursor)
+        return cursor
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            cursors = list(self._cursors)
+        for cursor in cursors:
+            try:
+                cursor.cancel()
+            except Exception as e:
+                logger.warning(f"Could not cancel query: {str(e)}")
+
+# query_trino shows MAX_DISPLAY_ROWS and peeks LOOKAHEAD_ROWS further to tell
+# whether there is more; anything beyond that is never downloaded
+MAX_DISPLAY_ROWS = 20
+LOOKAHEAD_ROWS = 80
+
 @app.list_tools()
 async def list_tools() -> list[Tool]:
     """Define tools available to Claude"""
@@ -30,11 +157,43 @@ async def list_tools() -> list[Tool]:
                     "sql": {
                         "type": "string",
                         "description": "SQL query to execute (SELECT statements only)"
+                    },
+                    "count_total": {
+                        "type": "boolean",
+                        "description": "Run an extra COUNT(*) to report the exact total when the result is larger than what is shown (default false)"
+                    },
+                    "allow_over_budget": {
+                        "type": "boolean",
+                        "description": "Run even if the estimated scan exceeds the cost budget. Only set this after the user has confirmed (default false)"
                     }
                 },
                 "required": ["sql"]
             }
         ),
+        Tool(
+            name="query_metrics",
+            description=(
+                "Answer a metric question (e.g. 'revenue by product category per month in 2024') from the "
+                "Cube semantic layer's pre-aggregations, usually in well under a second. Knows revenue, "
+                "average order value, number of orders/customers, conversion rates and sustainability "
+                "metrics by product, category, supplier, country, sustainability tier and order date. "
+                "Questions with filters or rankings are not metric questions: use query_trino for those."
+            ),
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "question": {
+                        "type": "string",
+                        "description": "The metric question in plain English"
+                    },
+                    "fallback_sql": {
+                        "type": "string",
+                        "description": "SQL to run on Trino (as query_trino would) if Cube cannot answer the question"
+                    }
+                },
+                "required": ["question"]
+            }
+        ),
         Tool(
             name="show_schemas",
             description="List all schemas in the lakehouse catalog",
@@ -56,99 +215,488 @@ async def list_tools() -> list[Tool]:
                 },
                 "required": ["schema"]
             }
+        ),
+        Tool(
+            name="describe_table",
+            description=(
+                "List a table's columns and types from cached metadata (no query). Includes null ratios, "
+                "distinct counts and min/max when the table has been profiled."
+            ),
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "table": {
+                        "type": "string",
+                        "description": f"Table name, optionally schema-qualified (default schema {TRINO_SCHEMA})"
+                    },
+                    "schema": {
+                        "type": "string",
+                        "description": "Schema name, if not part of table"
+                    }
+                },
+                "required": ["table"]
+            }
+        ),
+        Tool(
+            name="sample_table",
+            description=(
+                f"Return a few random rows of a table via TABLESAMPLE (at most {MCP_SAMPLE_MAX_ROWS}). "
+                "Use this instead of SELECT * to see what the data looks like."
+            ),
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "table": {
+                        "type": "string",
+                        "description": f"Table name, optionally schema-qualified (default schema {TRINO_SCHEMA})"
+                    },
+                    "schema": {
+                        "type": "string",
+                        "description": "Schema name, if not part of table"
+                    },
+                    "rows": {
+                        "type": "integer",
+                        "description": "Number of rows (default 10)"
+                    },
+                    "columns": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Only these columns (default all)"
+                    },
+                    "percent": {
+                        "type": "number",
+                        "description": f"Share of rows sampled, 0-100 (default {MCP_SAMPLE_PERCENT:g}, "
+                                       f"raised for small tables)"
+                    }
+                },
+                "required": ["table"]
+            }
+        ),
+        Tool(
+            name="profile_table",
+            description=(
+                "Row count and, per column, null ratio, approximate distinct count and min/max. Computed with "
+                "one aggregate query and cached until the table's next Iceberg snapshot, so repeated calls are free."
+            ),
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "table": {
+                        "type": "string",
+                        "description": f"Table name, optionally schema-qualified (default schema {TRINO_SCHEMA})"
+                    },
+                    "schema": {
+                        "type": "string",
+                        "description": "Schema name, if not part of table"
+                    },
+                    "allow_over_budget": {
+                        "type": "boolean",
+                        "description": "Profile even if the estimated scan exceeds the cost budget. Only set this after the user has confirmed (default false)"
+                    }
+                },
+                "required": ["table"]
+            }
         )
     ]
 
+def query_trino(arguments: dict, call: ToolCall) -> str:
+    """Run a SELECT and format at most MAX_DISPLAY_ROWS rows"""
+    # Security: exactly one read-only statement, with a bounded outer LIMIT
+    statement, _, error = guard_sql(arguments["sql"])
+    if error:
+        return f"Error: {error}"
+    sql, changes, _ = guard_sql(statement, max_limit=MCP_QUERY_LIMIT)
+    
+    logger.info(f"Executing SQL: {sql}")
+    with pool.connection() as conn:
+        cursor = call.cursor(conn)
+        try:
+            # Pre-flight: reject invalid SQL and hold expensive scans for confirmation
+            estimate = estimate_cost(cursor, sql)
+            reason = check_budget(
+                estimate,
+                max_scan_bytes=COST_GATE_MAX_SCAN_GB * 1024 ** 3,
+                max_scan_rows=COST_GATE_MAX_SCAN_ROWS
+            )
+            if not estimate["valid"]:
+                return f"Error: {reason}"
+            if reason and not arguments.get("allow_over_budget"):
+                logger.info(f"Query held by cost gate: {reason}")
+                return (
+                    f"Query not executed: {reason} ({describe_estimate(estimate)}).\n"
+                    f"Ask the user to confirm, then call query_trino again with allow_over_budget=true, "
+                    f"or add filters/aggregations to reduce the scan."
+                )
+            result = format_query_result(cursor, sql, statement, arguments.get("count_total", False))
+            header = f"Estimated cost: {describe_estimate(estimate)}\n"
+            if changes:
+                header += f"SQL rewritten: {'; '.join(changes)}\nExecuted SQL: {sql}\n"
+            return header + result
+        finally:
+            cursor.close()
+
+def format_query_result(cursor, sql: str, statement: str, count_total: bool) -> str:
+    cursor.execute(sql)
+    columns = [desc[0] for desc in cursor.description] if cursor.description else []
+    
+    # Only download what we show plus a bounded look-ahead, then stop the query
+    rows = cursor.fetchmany(MAX_DISPLAY_ROWS + LOOKAHEAD_ROWS)
+    exhausted = len(rows) < MAX_DISPLAY_ROWS + LOOKAHEAD_ROWS or cursor.fetchone() is None
+    if not exhausted:
+        cursor.cancel()
+    
+    # Format results
+    if not rows:
+        result = "Query returned no rows"
+    else:
+        # Limit to 20 rows
+        display_rows = rows[:MAX_DISPLAY_ROWS]
+        result = f"Columns: {', '.join(columns)}\n\n"
+        for row in display_rows:
+            result += f"{row}\n"
+        
+        if exhausted and len(rows) > MAX_DISPLAY_ROWS:
+            result += f"\n... and {len(rows) - MAX_DISPLAY_ROWS} more rows (total: {len(rows)})"
+        elif not exhausted:
+            if count_total:
+                # Count the statement as written, not capped by the injected LIMIT
+                cursor.execute(f"SELECT count(*) FROM ({statement})")
+                total = cursor.fetchone()[0]
+                result += f"\n... and {total - MAX_DISPLAY_ROWS} more rows (total: {total})"
+            else:
+                result += (
+                    f"\n... and more rows (total: more than {len(rows)}; "
+                    f"query stopped early, pass count_total=true for the exact count)"
+                )
+    
+    logger.info(f"Query returned {len(rows)} rows{'' if exhausted else ' (truncated)'}")
+    return result
+
+def query_metrics(arguments: dict, call: ToolCall) -> str:
+    """Answer a metric question through Cube, falling back to fallback_sql on Trino"""
+    answer = cube_client.answer(arguments["question"], limit=MAX_DISPLAY_ROWS + LOOKAHEAD_ROWS)
+    if answer is None or answer["df"] is None:
+        reason = answer["error"] if answer else "not a plain metric question, or Cube is unreachable"
+        logger.info(f"Cube could not answer: {reason}")
+        if arguments.get("fallback_sql"):
+            return f"Cube could not answer ({reason}); ran fallback_sql on Trino instead.\n" + query_trino(
+                {"sql": arguments["fallback_sql"]}, call
+            )
+        return (
+            f"Cube could not answer ({reason}). Use query_trino on "
+            f"{TRINO_CATALOG}.{TRINO_SCHEMA}.fct_orders instead, or pass fallback_sql."
+        )
+    
+    df = answer["df"]
+    for column in df.select_dtypes("datetime").columns:
+        df[column] = df[column].dt.strftime("%Y-%m-%d")
+    source = (
+        f"pre-aggregation {', '.join(answer['pre_aggregations'])}" if answer["pre_aggregations"]
+        else "Cube without a matching pre-aggregation"
+    )
+    result = f"Answered from {source} in {answer['elapsed']:.2f}s\nCube query: {json.dumps(answer['query'])}\n\n"
+    if df.empty:
+        return result + "Query returned no rows"
+    result += f"Columns: {', '.join(df.columns)}\n\n"
+    for row in df.head(MAX_DISPLAY_ROWS).itertuples(index=False, name=None):
+        result += f"{row}\n"
+    if len(df) > MAX_DISPLAY_ROWS:
+        more = "more than " if len(df) == MAX_DISPLAY_ROWS + LOOKAHEAD_ROWS else ""
+        result += f"\n... and more rows (total: {more}{len(df)})"
+    logger.info(f"Cube returned {len(df)} rows from {source}")
+    return result
+
+def show_schemas(arguments: dict, call: ToolCall) -> str:
+    with pool.connection() as conn:
+        cursor = call.cursor(conn)
+        cursor.execute(f"SHOW SCHEMAS IN {TRINO_CATALOG}")
+        rows = cursor.fetchall()
+        cursor.close()
+    schemas = [row[0] for row in rows]
+    logger.info(f"Found {len(schemas)} schemas")
+    return f"Schemas in {TRINO_CATALOG}:\n" + "\n".join(schemas)
+
+def show_tables(arguments: dict, call: ToolCall) -> str:
+    schema = arguments["schema"].strip().strip('"')
+    schema_context, _, _, _ = schema_cache.get(pool)
+    if match_name(schema, schema_context) is None:
+        # Created since the cache was loaded?
+        schema_context = refresh_schema_cache_throttled(schema_context)
+    resolved = match_name(schema, schema_context)
+    if resolved is None:
+        return f"Error: Unknown schema {TRINO_CATALOG}.{schema} (see show_schemas)"
+    schema = resolved
+    tables = sorted(schema_context[schema])
+    logger.info(f"Found {len(tables)} tables in {schema}")
+    return f"Tables in {TRINO_CATALOG}.{schema}:\n" + "\n".join(tables)
+
+def match_name(name: str, names) -> str:
+    """The entry of names equal to name, ignoring case unless there is an exact match (None if absent)"""
+    if name in names:
+        return name
+    folded = [candidate for candidate in names if candidate.lower() == name.lower()]
+    return folded[0] if len(folded) == 1 else None
+
+def refresh_schema_cache_throttled(schema_context: dict) -> dict:
+    """Reload the schema cache for a schema or table name it lacks, at most once per MCP_SCHEMA_REFRESH_INTERVAL"""
+    global last_forced_refresh
+    with forced_refresh_lock:
+        if time.time() - last_forced_refresh < MCP_SCHEMA_REFRESH_INTERVAL:
+            return schema_context
+        last_forced_refresh = time.time()
+    schema_context, _, _, _ = schema_cache.get(pool, force_refresh=True)
+    return schema_context
+
+def resolve_table(arguments: dict) -> tuple:
+    """(schema, table, columns, error) for a table named in the tool arguments, from cached metadata
+
+    Names are matched case-insensitively (Trino folds unquoted identifiers to lower case).
+    """
+    parts = [part.strip().strip('"') for part in arguments["table"].split(".")]
+    if len(parts) == 3 and parts[0].lower() == TRINO_CATALOG.lower():
+        parts = parts[1:]
+    if len(parts) > 2:
+        return None, None, None, f"Error: Tables must be in the {TRINO_CATALOG} catalog"
+    table = parts[-1]
+    schema = parts[0] if len(parts) == 2 else arguments.get("schema")
+    
+    schema_context, _, _, _ = schema_cache.get(pool)
+    if not any(match_name(table, tables) for tables in schema_context.values()):
+        # Created since the cache was loaded?
+        schema_context = refresh_schema_cache_throttled(schema_context)
+    if schema is None:
+        matches = [name for name, tables in schema_context.items() if match_name(table, tables)]
+        schema = TRINO_SCHEMA if TRINO_SCHEMA in matches or not matches else matches[0]
+        if len(matches) > 1 and TRINO_SCHEMA not in matches:
+            return None, None, None, f"Error: {table} exists in several schemas ({', '.join(matches)}); pass schema"
+    else:
+        schema = match_name(schema, schema_context) or schema
+    
+    table = match_name(table, schema_context.get(schema, {})) or table
+    columns = schema_context.get(schema, {}).get(table)
+    if columns is None:
+        return None, None, None, f"Error: Unknown table {TRINO_CATALOG}.{schema}.{table} (see show_tables)"
+    return schema, table, columns, None
+
+def format_column_profile(entry: dict) -> str:
+    text = f"nulls {entry['null_ratio']:.1%}"
+    if "distinct" in entry:
+        text += f", ~{entry['distinct']:,} distinct"
+        if entry["min"] is not None:
+            text += f", min {entry['min']}, max {entry['max']}"
+    return text
+
+def describe_table(arguments: dict, call: ToolCall) -> str:
+    """Columns and types from the schema cache, with a stored profile if there is one"""
+    schema, table, columns, error = resolve_table(arguments)
+    if error:
+        return error
+    
+    profile = profile_cache.peek(schema, table)
+    profiled = {entry["name"]: entry for entry in profile["columns"]} if profile else {}
+    result = f"Columns of {TRINO_CATALOG}.{schema}.{table} ({len(columns)}, from cached metadata):\n"
+    for column in columns:
+        result += f"{column['name']} {column['type']}"
+        if column["name"] in profiled:
+            result += f" · {format_column_profile(profiled[column['name']])}"
+        result += "\n"
+    if profile:
+        result += (
+            f"\nStats from the profile of snapshot {profile['snapshot_id'] or 'n/a'} "
+            f"({profile['rows']:,} rows); profile_table refreshes them if the table changed."
+        )
+    else:
+        result += "\nNo profile yet: profile_table adds null ratios, distinct counts and min/max."
+    return result
+
+def sample_table(arguments: dict, call: ToolCall) -> str:
+    """Random rows via TABLESAMPLE BERNOULLI, capped at MCP_SAMPLE_MAX_ROWS"""
+    schema, table, columns, error = resolve_table(arguments)
+    if error:
+        return error
+    rows = max(1, min(int(arguments.get("rows") or 10), MCP_SAMPLE_MAX_ROWS))
+    percent = min(100.0, max(0.0001, float(arguments.get("percent") or MCP_SAMPLE_PERCENT)))
+    profile = profile_cache.peek(schema, table)
+    if not arguments.get("percent") and profile and profile["rows"]:
+        # Rate that yields the requested rows from the last profiled row count
+        percent = min(100.0, max(percent, SAMPLE_OVERSAMPLING * rows * 100 / profile["rows"]))
+    
+    names = [column["name"] for column in columns]
+    selected = arguments.get("columns") or names
+    unknown = [name for name in selected if name not in names]
+    if unknown:
+        return f"Error: Unknown columns {', '.join(unknown)} (table has {', '.join(names)})"
+    select = ", ".join('"' + name.replace('"', '""') + '"' for name in selected)
+    source = f'"{schema}"."{table}"'
+    
+    with pool.connection() as conn:
+        cursor = call.cursor(conn)
+        
+        def fetch_sample(percent):
+            # LIMIT stops the scan as soon as enough sampled rows have arrived
+            cursor.execute(f"SELECT {select} FROM {source} TABLESAMPLE BERNOULLI ({percent:g}) LIMIT {rows}")
+            return cursor.fetchall()
+        
+        try:
+            sample = fetch_sample(percent)
+            if len(sample) < rows and percent < 100 and not arguments.get("percent"):
+                # Smaller table than the rate assumed: retry at the rate the returned rows suggest
+                scale = SAMPLE_OVERSAMPLING * rows / len(sample) if sample else 100
+                percent = min(100.0, percent * scale)
+                sample = fetch_sample(percent)
+            note = f"{percent:g}% Bernoulli sample"
+            if len(sample) < rows and percent < 100:
+                # Still too few: a small table, whose first rows are cheap
+                cursor.execute(f"SELECT {select} FROM {source} LIMIT {rows}")
+                sample = cursor.fetchall()
+                note = "small table, first rows instead of a sample"
+        finally:
+            cursor.close()
+    
+    logger.info(f"Sampled {len(sample)} rows from {schema}.{table}")
+    if not sample:
+        return f"{TRINO_CATALOG}.{schema}.{table} is empty"
+    result = f"{len(sample)} rows of {TRINO_CATALOG}.{schema}.{table} ({note})\nColumns: {', '.join(selected)}\n\n"
+    for row in sample:
+        result += f"{tuple(row)}\n"
+    return result
+
+class OverBudget(Exception):
+    """The profile query's estimated scan exceeds the cost budget"""
+
+def profile_table(arguments: dict, call: ToolCall) -> str:
+    """Table profile, cached per Iceberg snapshot"""
+    schema, table, columns, error = resolve_table(arguments)
+    if error:
+        return error
+    
+    with pool.connection() as conn:
+        cursor = call.cursor(conn)
+        
+        def check(sql):
+            estimate = estimate_cost(cursor, sql)
+            reason = check_budget(
+                estimate,
+                max_scan_bytes=COST_GATE_MAX_SCAN_GB * 1024 ** 3,
+                max_scan_rows=COST_GATE_MAX_SCAN_ROWS
+            )
+            # Invalid SQL is left to fail with Trino's own error
+            if reason and estimate["valid"] and not arguments.get("allow_over_budget"):
+                raise OverBudget(f"{reason} ({describe_estimate(estimate)})")
+        
+        try:
+            profile, cached = profile_cache.get(cursor, schema, table, columns, check=check)
+        except OverBudget as e:
+            return (
+                f"Profile not computed: {e}.\n"
+                f"Ask the user to confirm, then call profile_table again with allow_over_budget=true, "
+                f"or use sample_table instead."
+            )
+        finally:
+            cursor.close()
+    
+    source = (
+        f"cached, profiled {time.strftime('%Y-%m-%d %H:%M', time.localtime(profile['profiled_at']))}"
+        if cached else f"computed in {profile['elapsed']:.2f}s"
+    )
+    logger.info(f"Profile of {schema}.{table}: {source}")
+    result = (
+        f"Profile of {TRINO_CATALOG}.{schema}.{table}: {profile['rows']:,} rows · "
+        f"snapshot {profile['snapshot_id'] or 'n/a'} · {source}\n\n"
+    )
+    for entry in profile["columns"]:
+        result += f"{entry['name']} {entry['type']}: {format_column_profile(entry)}\n"
+    return result
+
+TOOL_HANDLERS = {
+    "query_trino": query_trino,
+    "query_metrics": query_metrics,
+    "show_schemas": show_schemas,
+    "show_tables": show_tables,
+    "describe_table": describe_table,
+    "sample_table": sample_table,
+    "profile_table": profile_table
+}
+
 @app.call_tool()
 async def call_tool(name: str, arguments: dict) -> list[TextContent]:
     """Execute tool calls from Claude"""
     
     logger.info(f"Tool called: {name} with args: {arguments}")
     
-    try:
-        # Connect to Trino
-        conn = trino.dbapi.connect(
-            host='localhost',
-            port=8080,
-            user='admin',
-            catalog='lakehouse',
-            schema='dbt_marts'
-        )
-        cursor = conn.cursor()
+    handler = TOOL_HANDLERS.get(name)
+    if handler is None:
+        return [TextContent(
+            type="text",
+            text=f"Unknown tool: {name}"
+        )]
+    
+    # Trino work runs in the executor so a slow query never blocks other tool calls
+    async with call_slots:
+        call = ToolCall()
+        loop = asyncio.get_running_loop()
+        started = asyncio.Event()
         
-        if name == "query_trino":
-            sql = arguments["sql"]
-            
-            # Security: Only allow SELECT
-            if not sql.strip().upper().startswith('SELECT'):
-                return [TextContent(
-                    type="text",
-                    text="Error: Only SELECT queries are allowed"
-                )]
-            
-            logger.info(f"Executing SQL: {sql}")
-            cursor.execute(sql)
-            rows = cursor.fetchall()
-            columns = [desc[0] for desc in cursor.description] if cursor.description else []
-            
-            # Format results
-            if not rows:
-                result = "Query returned no rows"
-            else:
-                # Limit to 20 rows
-                display_rows = rows[:20]
-                result = f"Columns: {', '.join(columns)}\n\n"
-                for row in display_rows:
-                    result += f"{row}\n"
-                
-                if len(rows) > 20:
-                    result += f"\n... and {len(rows) - 20} more rows (total: {len(rows)})"
-            
-            logger.info(f"Query returned {len(rows)} rows")
-            return [TextContent(type="text", text=result)]
+        def run():
+            loop.call_soon_threadsafe(started.set)
+            return handler(arguments, call)
         
-        elif name == "show_schemas":
-            cursor.execute("SHOW SCHEMAS IN lakehouse")
-            rows = cursor.fetchall()
-            schemas = [row[0] for row in rows]
-            result = "Schemas in lakehouse:\n" + "\n".join(schemas)
-            logger.info(f"Found {len(schemas)} schemas")
+        future = loop.run_in_executor(executor, run)
+        try:
+            # The timeout covers the call itself, not time spent waiting for a worker
+            await started.wait()
+            result = await asyncio.wait_for(future, timeout=MCP_TOOL_TIMEOUT)
             return [TextContent(type="text", text=result)]
         
-        elif name == "show_tables":
-            schema = arguments["schema"]
-            cursor.execute(f"SHOW TABLES IN lakehouse.{schema}")
-            rows = cursor.fetchall()
-            tables = [row[0] for row in rows]
-            result = f"Tables in lakehouse.{schema}:\n" + "\n".join(tables)
-            logger.info(f"Found {len(tables)} tables in {schema}")
-            return [TextContent(type="text", text=result)]
+        except asyncio.TimeoutError:
+            logger.warning(f"Tool {name} timed out after {MCP_TOOL_TIMEOUT:.0f}s, cancelling query")
+            await loop.run_in_executor(None, call.cancel)
+            return [TextContent(
+                type="text",
+                text=f"Error: Query timed out after {MCP_TOOL_TIMEOUT:.0f}s and was cancelled"
+            )]
         
-        else:
+        except Exception as e:
+            logger.error(f"Error: {str(e)}", exc_info=True)
             return [TextContent(
                 type="text",
-                text=f"Unknown tool: {name}"
+                text=f"Error: {str(e)}\n\nMake sure Trino is running: docker compose ps trino"
             )]
-    
-    except Exception as e:
-        logger.error(f"Error: {str(e)}", exc_info=True)
-        return [TextContent(
-            type="text",
-            text=f"Error: {str(e)}\n\nMake sure Trino is running: docker compose ps trino"
-        )]
 
 async def main():
     """Run the MCP server"""
     from mcp.server.stdio import stdio_server
     
+    global pool, executor
+    
     logger.info("Starting Trino MCP server...")
     
-    async with stdio_server() as (read_stream, write_stream):
-        await app.run(
-            read_stream,
-            write_stream,
-            app.create_initialization_options()
-        )
+    pool = create_pool()
+    # call_slots bounds the running calls; the extra workers absorb timed-out calls
+    # that are still winding down, so they cannot hold up new ones
+    executor = ThreadPoolExecutor(max_workers=2 * MCP_MAX_CONCURRENT_CALLS, thread_name_prefix="trino-tool")
+    try:
+        # Warm one connection so the first tool call does not pay for the handshake
+        with pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchall()
+            cursor.close()
+        logger.info(f"Connected to Trino at {TRINO_HOST}:{TRINO_PORT} (catalog {TRINO_CATALOG})")
+    except Exception as e:
+        logger.warning(f"Trino not reachable yet at {TRINO_HOST}:{TRINO_PORT}: {str(e)}")
+    
+    try:
+        async with stdio_server() as (read_stream, write_stream):
+            await app.run(
+                read_stream,
+                write_stream,
+                app.create_initialization_options()
+            )
+    finally:
+        logger.info("Closing Trino connections...")
+        executor.shutdown(wait=False, cancel_futures=True)
+        pool.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
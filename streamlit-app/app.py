@@ -1,22 +1,44 @@
 import streamlit as st
-import ollama
 from trino.dbapi import connect
 from trino.exceptions import TrinoUserError
 import pandas as pd
 import time
 from datetime import datetime
-from anthropic import Anthropic
-from mistralai import Mistral
 import os
 from dotenv import load_dotenv
 import json
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+import threading
+from trino_pool import TrinoConnectionPool
+from schema_cache import SchemaCache, default_cache_dir
+from generation_cache import GenerationCache, make_generation_key
+from result_cache import ResultCache
+from cost_gate import estimate_cost, check_budget, describe_estimate, format_bytes
+from result_frame import FrameBuilder
+from metrics_store import MetricsStore
+from query_timing import QueryTiming, latency_stages
+from provider_race import Cancelled, race
+from cube_metrics import CubeClient
+from result_export import EXPORT_FORMATS, export_cursor, export_frame, readable_file
+from sql_generation import (
+    CLAUDE_MODEL,
+    MISTRAL_MODEL,
+    OLLAMA_MODEL,
+    OLLAMA_HOST,
+    ollama_client,
+    schema_prompt_for,
+    generate_sql_with_claude,
+    generate_sql_with_mistral,
+    generate_sql_with_ollama
+)
 
 
 # Load environment variables
 load_dotenv()
 
-
-
 # Configuration
 TRINO_HOST = os.getenv("TRINO_HOST", "localhost")
 TRINO_PORT = int(os.getenv("TRINO_PORT", "8080"))
@@ -24,25 +46,55 @@ TRINO_USER = os.getenv("TRINO_USER", "admin")
 TRINO_CATALOG = os.getenv("TRINO_CATALOG", "lakehouse")
 TRINO_SCHEMA = os.getenv("TRINO_SCHEMA", "dbt_marts")
 
-OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "qwen2.5-coder:7b")
-OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+TRINO_POOL_MAX_SIZE = int(os.getenv("TRINO_POOL_MAX_SIZE", "8"))
+TRINO_POOL_IDLE_TIMEOUT = float(os.getenv("TRINO_POOL_IDLE_TIMEOUT", "300"))
+TRINO_POOL_HEALTH_CHECK_INTERVAL = float(os.getenv("TRINO_POOL_HEALTH_CHECK_INTERVAL", "30"))
+
+SCHEMA_CACHE_DIR = default_cache_dir()
+SCHEMA_CACHE_TTL = float(os.getenv("SCHEMA_CACHE_TTL", "900"))
+
+GENERATION_CACHE_MAX_ENTRIES = int(os.getenv("GENERATION_CACHE_MAX_ENTRIES", "256"))
+GENERATION_CACHE_TTL = float(os.getenv("GENERATION_CACHE_TTL", "86400"))
+GENERATION_CACHE_DISK = os.getenv("GENERATION_CACHE_DISK", "true").lower() == "true"
+
+# Every provider run is persisted here with incrementally updated aggregates
+METRICS_DB_PATH = Path(os.getenv("METRICS_DB_PATH", SCHEMA_CACHE_DIR / "metrics.sqlite")).expanduser()
+METRICS_RETENTION_DAYS = float(os.getenv("METRICS_RETENTION_DAYS", "90"))
+
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "300"))
+RESULT_CACHE_MAX_MB = int(os.getenv("RESULT_CACHE_MAX_MB", "256"))
 
-CLAUDE_MODEL = os.getenv("CLAUDE_MODEL", "claude-sonnet-4-20250514")
-ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
+RESULT_MAX_ROWS = int(os.getenv("RESULT_MAX_ROWS", "100000"))
+RESULT_MAX_MB = int(os.getenv("RESULT_MAX_MB", "64"))
+RESULT_FETCH_SIZE = int(os.getenv("RESULT_FETCH_SIZE", "1000"))
+RESULT_PAGE_SIZE = int(os.getenv("RESULT_PAGE_SIZE", "500"))
 
-MISTRAL_MODEL = os.getenv("MISTRAL_MODEL", "mistral-small-latest")
-MISTRAL_API_KEY = os.getenv("MISTRAL_API_KEY")
+# CSV/Parquet exports of the full result, written in chunks to a spooled file
+EXPORT_MAX_MB = int(os.getenv("EXPORT_MAX_MB", "128"))
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "50000"))
 
-# Initialize clients
-if ANTHROPIC_API_KEY:
-    anthropic_client = Anthropic(api_key=ANTHROPIC_API_KEY)
-else:
-    anthropic_client = None
+# Pre-flight EXPLAIN (TYPE VALIDATE / IO) before running generated SQL
+COST_GATE_ENABLED = os.getenv("COST_GATE_ENABLED", "true").lower() == "true"
+COST_GATE_MAX_SCAN_GB = float(os.getenv("COST_GATE_MAX_SCAN_GB", "10"))
+COST_GATE_MAX_SCAN_ROWS = int(os.getenv("COST_GATE_MAX_SCAN_ROWS", "1000000000"))
 
-if MISTRAL_API_KEY:
-    mistral_client = Mistral(api_key=MISTRAL_API_KEY)
-else:
-    mistral_client = None
+# Metric questions are answered from Cube pre-aggregations when possible (see cube_metrics)
+CUBE_METRICS_ENABLED = os.getenv("CUBE_METRICS_ENABLED", "true").lower() == "true"
+CUBE_API_URL = os.getenv("CUBE_API_URL", "http://localhost:4000/cubejs-api/v1")
+CUBE_API_SECRET = os.getenv("CUBE_API_SECRET", "")
+CUBE_API_TOKEN = os.getenv("CUBE_API_TOKEN", "")
+CUBE_TIMEOUT = float(os.getenv("CUBE_TIMEOUT", "10"))
+# Cube rejects queries whose limit exceeds CUBEJS_DB_QUERY_LIMIT (50000 by default)
+CUBE_MAX_LIMIT = int(os.getenv("CUBE_MAX_LIMIT", "50000"))
+
+# Race mode: first valid answer wins, the other providers are cancelled
+RACE_PREFERRED_PROVIDER = os.getenv("RACE_PREFERRED_PROVIDER", "ollama")
+RACE_PREFERENCE_GRACE = float(os.getenv("RACE_PREFERENCE_GRACE", "1.0"))
+RACE_TIMEOUTS = {
+    "claude": float(os.getenv("RACE_TIMEOUT_CLAUDE", "30")),
+    "mistral": float(os.getenv("RACE_TIMEOUT_MISTRAL", "30")),
+    "ollama": float(os.getenv("RACE_TIMEOUT_OLLAMA", "60"))
+}
 
 # Page config
 st.set_page_config(
@@ -86,31 +138,14 @@ if 'comparison_history' not in st.session_state:
     st.session_state.comparison_history = []
 if 'schema_context' not in st.session_state:
     st.session_state.schema_context = None
+if 'schema_fingerprint' not in st.session_state:
+    st.session_state.schema_fingerprint = None
 if 'connection_tested' not in st.session_state:
     st.session_state.connection_tested = False
 
 
 
 
-def test_trino_connection():
-    """Test Trino connection and return status"""
-    try:
-        conn = connect(
-            host=TRINO_HOST,
-            port=TRINO_PORT,
-            user=TRINO_USER,
-            catalog=TRINO_CATALOG,
-            http_scheme='http'
-        )
-        cursor = conn.cursor()
-        cursor.execute("SELECT 1 as test")
-        result = cursor.fetchone()
-        cursor.close()
-        conn.close()
-        return True, "Connection successful"
-    except Exception as e:
-        return False, str(e)
-
 def get_trino_connection():
     """Create Trino connection with error handling"""
     try:
@@ -130,54 +165,103 @@ def get_trino_connection():
             f"Error: {str(e)}"
         )
 
-def get_schema_context():
-    """Fetch schema information from Trino"""
+@st.cache_resource
+def get_trino_pool():
+    """Process-wide Trino connection pool shared by every Streamlit session"""
+    return TrinoConnectionPool(
+        get_trino_connection,
+        max_size=TRINO_POOL_MAX_SIZE,
+        idle_timeout=TRINO_POOL_IDLE_TIMEOUT,
+        health_check_interval=TRINO_POOL_HEALTH_CHECK_INTERVAL
+    )
+
+def test_trino_connection():
+    """Test Trino connection and return status"""
     try:
-        conn = get_trino_connection()
-        cursor = conn.cursor()
-        
-        # Get schemas
-        cursor.execute("SHOW SCHEMAS")
-        schemas = [row[0] for row in cursor.fetchall()]
-        
-        schema_info = {}
-        skipped_schemas = []
-        
-        for schema in schemas:
-            # Skip system schemas
-            if schema in ['information_schema', 'system']:
-                continue
-            
-            try:
-                cursor.execute(f"SHOW TABLES FROM {schema}")
-                tables = [row[0] for row in cursor.fetchall()]
-                
-                if not tables:
-                    continue
-                
-                schema_info[schema] = {}
-                
-                for table in tables:
-                    try:
-                        cursor.execute(f"DESCRIBE {schema}.{table}")
-                        columns = cursor.fetchall()
-                        schema_info[schema][table] = [
-                            {"name": col[0], "type": col[1]} for col in columns
-                        ]
-                    except Exception as e:
-                        st.warning(f"Could not describe {schema}.{table}: {str(e)}")
-                        continue
-                        
-            except Exception as e:
-                skipped_schemas.append(f"{schema} ({str(e)})")
-                continue
+        with get_trino_pool().connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1 as test")
+            result = cursor.fetchone()
+            cursor.close()
+        return True, "Connection successful"
+    except Exception as e:
+        return False, str(e)
+
+@st.cache_resource
+def get_schema_cache():
+    """On-disk schema cache shared by every session (and the MCP server)"""
+    return SchemaCache(
+        TRINO_CATALOG,
+        source=f"{TRINO_HOST}:{TRINO_PORT}",
+        cache_dir=SCHEMA_CACHE_DIR,
+        ttl=SCHEMA_CACHE_TTL
+    )
+
+@st.cache_resource
+def get_generation_cache():
+    """Generated-SQL cache shared by every session, optionally persisted to disk"""
+    return GenerationCache(
+        max_entries=GENERATION_CACHE_MAX_ENTRIES,
+        ttl=GENERATION_CACHE_TTL,
+        disk_path=SCHEMA_CACHE_DIR / "generations.sqlite" if GENERATION_CACHE_DISK else None
+    )
+
+@st.cache_resource
+def get_result_cache():
+    """Query result cache shared by every session"""
+    return ResultCache(ttl=RESULT_CACHE_TTL, max_bytes=RESULT_CACHE_MAX_MB * 1024 * 1024)
+
+@st.cache_resource
+def get_metrics_store():
+    """Persistent provider metrics shared by every session and the dashboard page"""
+    return MetricsStore(METRICS_DB_PATH, retention_days=METRICS_RETENTION_DAYS)
+
+@st.cache_resource
+def get_cube_client():
+    """Cube REST API client with its /meta cached across sessions"""
+    return CubeClient(CUBE_API_URL, token=CUBE_API_TOKEN or None, secret=CUBE_API_SECRET or None, timeout=CUBE_TIMEOUT)
+
+def record_provider_runs(comparison_result: dict, providers: list):
+    """Persist each provider's part of a comparison to the metrics store"""
+    for provider in providers:
+        if f'{provider}_total_time' not in comparison_result:
+            continue
+        try:
+            get_metrics_store().record({
+                "provider": provider,
+                "model": PROVIDERS[provider]["model"],
+                "question": comparison_result["query"],
+                "success": comparison_result.get(f'{provider}_success'),
+                "blocked": bool(comparison_result.get(f'{provider}_blocked')),
+                "error": comparison_result.get(f'{provider}_error') or comparison_result.get(f'{provider}_exec_error'),
+                "gen_time": comparison_result.get(f'{provider}_gen_time'),
+                "exec_time": comparison_result.get(f'{provider}_exec_time'),
+                "total_time": comparison_result[f'{provider}_total_time'],
+                "rows": comparison_result.get(f'{provider}_rows'),
+                "input_tokens": comparison_result.get(f'{provider}_input_tokens'),
+                "cached_tokens": comparison_result.get(f'{provider}_cached_tokens'),
+                "generation_cached": comparison_result.get(f'{provider}_cache_hit'),
+                "result_cache": comparison_result.get(f'{provider}_result_cache')
+            })
+        except Exception as e:
+            # Metrics must never break a query
+            st.warning(f"Could not record metrics: {str(e)}")
+
+def get_schema_context(force_refresh: bool = False):
+    """Fetch schema information from the persistent cache, refreshing from Trino when stale"""
+    try:
+        schema_info, fingerprint, skipped_schemas, warnings = get_schema_cache().get(
+            get_trino_pool(),
+            force_refresh=force_refresh
+        )
         
-        cursor.close()
-        conn.close()
+        for warning in warnings:
+            st.warning(warning)
         
         if skipped_schemas:
             st.info(f"Skipped schemas: {', '.join(skipped_schemas)}")
         
+        st.session_state.schema_fingerprint = fingerprint
         return schema_info
         
     except ConnectionError as e:
@@ -187,261 +271,563 @@ def get_schema_context():
         st.error(f"Error loading schema: {str(e)}")
         return None
 
-def format_schema_for_prompt(schema_context: dict, max_tables_per_schema: int = 10) -> str:
-    """Format schema context for LLM prompt with limits"""
-    if not schema_context:
-        return "No schema information available."
-    
-    schema_desc = "Available schemas and tables in the Trino lakehouse:\n\n"
+def execute_sql(sql: str, max_rows: int = None, max_bytes: int = None, cancel=None) -> tuple:
+    """Execute SQL query against Trino and return DataFrame with timing
+
+    Rows are fetched in chunks of RESULT_FETCH_SIZE and converted to typed
+    columns as they arrive (see result_frame.FrameBuilder). Once the row or
+    memory ceiling is reached the Trino query is cancelled and the DataFrame
+    is marked with df.attrs["truncated"] = True. The Trino query stats and
+    client-side spans are in df.attrs["timing"] (see query_timing).
+    Cancelling ``cancel`` (a provider_race.CancelToken) cancels the running
+    Trino query and returns an error instead of a partial result.
+    """
+    max_rows = max_rows or RESULT_MAX_ROWS
+    max_bytes = max_bytes or RESULT_MAX_MB * 1024 * 1024
+    start_time = time.time()
+    timing = QueryTiming()
     
-    for schema, tables in schema_context.items():
-        schema_desc += f"Schema: {schema}\n"
-        
-        table_count = 0
-        for table, columns in tables.items():
-            if table_count >= max_tables_per_schema:
-                schema_desc += f"  ... and {len(tables) - table_count} more tables\n"
-                break
-                
-            schema_desc += f"  Table: {table}\n"
+    try:
+        checkout_start = time.perf_counter()
+        with get_trino_pool().connection() as conn:
+            timing.spans["checkout"] = time.perf_counter() - checkout_start
+            cursor = conn.cursor()
+            
+            # Returns once Trino has accepted the query and sent the first response
+            with timing.span("submit"):
+                cursor.execute(sql)
+            unregister = cancel.on_cancel(cursor.cancel) if cancel is not None else lambda: None
             
-            # Limit columns shown
-            for col in columns[:15]:
-                schema_desc += f"    - {col['name']} ({col['type']})\n"
+            # Column names and Trino types drive the per-column conversion
+            builder = FrameBuilder(cursor.description)
             
-            if len(columns) > 15:
-                schema_desc += f"    ... and {len(columns) - 15} more columns\n"
+            # Fetch results chunk by chunk so a missing LIMIT cannot exhaust memory
+            truncated = False
+            
+            while True:
+                with timing.span("fetch"):
+                    rows = cursor.fetchmany(min(RESULT_FETCH_SIZE, max_rows - builder.rows))
+                if not rows:
+                    break
+                
+                with timing.span("build"):
+                    builder.add(rows)
+                
+                if builder.nbytes >= max_bytes:
+                    truncated = True
+                    break
+                if builder.rows >= max_rows:
+                    # Only truncated if Trino still has rows for us
+                    with timing.span("fetch"):
+                        truncated = cursor.fetchone() is not None
+                    break
             
-            table_count += 1
+            unregister()
+            timing.capture(cursor)
+            if truncated:
+                cursor.cancel()
+            cursor.close()
         
-        schema_desc += "\n"
-    
-    return schema_desc
+        if cancel is not None:
+            # A cancelled query may have returned a partial result without an error
+            cancel.raise_if_cancelled()
+        
+        with timing.span("build"):
+            df = builder.build()
+        df.attrs["truncated"] = truncated
+        df.attrs["row_limit"] = max_rows
+        df.attrs["timing"] = timing.as_dict()
+        
+        elapsed_time = time.time() - start_time
+        return df, elapsed_time, None
+        
+    except Cancelled as e:
+        elapsed_time = time.time() - start_time
+        return None, elapsed_time, str(e)
+    except Exception as e:
+        elapsed_time = time.time() - start_time
+        if cancel is not None and cancel.cancelled:
+            # Cancelling from another thread makes the pending fetch fail
+            return None, elapsed_time, f"Cancelled: {cancel.reason}"
+        if isinstance(e, TrinoUserError):
+            return None, elapsed_time, f"Trino Error: {str(e)}"
+        return None, elapsed_time, f"Execution Error: {str(e)}"
 
-def generate_sql_with_ollama(user_query: str, schema_context: dict) -> tuple:
-    """Use Ollama to generate SQL from natural language"""
-    start_time = time.time()
+def estimate_sql_cost(sql: str) -> dict:
+    """Validate sql and estimate the data it would scan, without executing it"""
+    with get_trino_pool().connection() as conn:
+        cursor = conn.cursor()
+        try:
+            return estimate_cost(cursor, sql)
+        finally:
+            cursor.close()
+
+@st.fragment
+def render_result_pages(df: pd.DataFrame, key: str):
+    """Show one page of a result at a time; only this fragment reruns when the page changes"""
+    total_pages = max(1, -(-len(df) // RESULT_PAGE_SIZE))
     
-    schema_desc = format_schema_for_prompt(schema_context)
+    if total_pages > 1:
+        page = st.number_input(
+            f"Page (of {total_pages})",
+            min_value=1,
+            max_value=total_pages,
+            value=1,
+            key=f"{key}_page"
+        )
+    else:
+        page = 1
+    
+    start = (page - 1) * RESULT_PAGE_SIZE
+    # Trino dates are stored as datetime64; show them without a time part
+    column_config = {
+        column: st.column_config.DateColumn(column, format="YYYY-MM-DD")
+        for column, type_name in df.attrs.get("trino_types", {}).items()
+        if type_name == "date"
+    }
+    st.dataframe(df.iloc[start:start + RESULT_PAGE_SIZE], use_container_width=True, column_config=column_config)
     
-    prompt = f"""You are a SQL expert specializing in Trino SQL. Based on the user's question, provide:
-1. A brief explanation of what you'll query (1 sentence)
-2. The SQL query
+    if total_pages > 1:
+        st.caption(f"Rows {start + 1}-{min(start + RESULT_PAGE_SIZE, len(df))} of {len(df)}")
 
-{schema_desc}
+def export_result(pool, sql: str, df: pd.DataFrame, fmt: str):
+    """Full result of sql as a CSV or Parquet file
 
-User question: {user_query}
+    Runs when a download button is clicked, outside the script run. A
+    complete displayed result (df not truncated) is written from memory;
+    otherwise sql is re-run and its rows are streamed to the file chunk by
+    chunk. Exports over EXPORT_MAX_MB fail and cancel the Trino query.
+    Returns a file object so the export is not copied into bytes here.
+    """
+    max_bytes = EXPORT_MAX_MB * 1024 * 1024
+    if df is not None and not df.attrs.get("truncated"):
+        file, _ = export_frame(df, fmt, chunk_rows=EXPORT_CHUNK_ROWS, max_bytes=max_bytes)
+    else:
+        with pool.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(sql)
+                file, _ = export_cursor(cursor, fmt, chunk_rows=EXPORT_CHUNK_ROWS, max_bytes=max_bytes)
+            except BaseException:
+                cursor.cancel()
+                raise
+            finally:
+                cursor.close()
+    return readable_file(file)
 
-Format your response exactly like this:
-EXPLANATION: [one sentence explaining the query approach]
-SQL:
-[the SQL query without any markdown or code blocks]
+def render_export_buttons(sql: str, df: pd.DataFrame, key: str, export_sql: str = None):
+    """CSV/Parquet download buttons for the full result of a query
 
-Requirements for SQL:
-- Use proper Trino SQL syntax
-- Always specify schema.table format (e.g., dbt_marts.customers)
-- Return only SELECT statements
-- Use appropriate WHERE clauses, JOINs, and aggregations as needed
-- Limit results to 100 rows unless user specifies otherwise
+    ``export_sql`` is the query without the guard's display LIMIT; the shown
+    result is only reused when it is the same query and was not truncated.
+    """
+    export_sql = export_sql or sql
+    reuse = df if export_sql == sql and not df.attrs.get("truncated") else None
+    stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    columns = st.columns([1, 1, 4])
+    for column, (fmt, info) in zip(columns, EXPORT_FORMATS.items()):
+        with column:
+            st.download_button(
+                f"⬇️ {info['label']}",
+                data=partial(export_result, get_trino_pool(), export_sql, reuse, fmt),
+                file_name=f"{key}_{stamp}.{info['extension']}",
+                mime=info["mime"],
+                key=f"{key}_export_{fmt}",
+                on_click="ignore"
+            )
+    with columns[-1]:
+        if reuse is not None:
+            st.caption(f"Exports the {len(df):,} rows above (up to {EXPORT_MAX_MB} MB)")
+        else:
+            st.caption(f"Exports re-run the query without the display limit (up to {EXPORT_MAX_MB} MB)")
 
-Response:"""
+def render_timing_breakdown(timing: dict, gen_time: float = None, from_cache: bool = False):
+    """Where the time went for one answer: LLM, Trino (from its query stats) or the app"""
+    stages = latency_stages(timing, gen_time)
+    total = sum(seconds for _, seconds in stages)
+    slowest, slowest_time = max(stages, key=lambda stage: stage[1])
+    note = " · timings of the original run (cached result)" if from_cache else ""
+    st.caption(f"🔬 Slowest stage: {slowest} ({slowest_time:.2f}s of {total:.2f}s){note}")
+    
+    with st.expander("Latency breakdown"):
+        st.table(pd.DataFrame([
+            {"Stage": name, "Time": f"{seconds:.3f}s", "Share": f"{seconds / total * 100:.0f}%" if total else "N/A"}
+            for name, seconds in stages
+        ]))
+        trino = timing.get("trino", {})
+        if trino:
+            st.caption(
+                f"Trino query `{timing.get('query_id')}` ({timing.get('state')}): "
+                f"CPU {trino.get('cpu', 0):.3f}s · "
+                f"{trino.get('processed_rows', 0):,} rows / {format_bytes(trino.get('processed_bytes', 0))} processed · "
+                f"peak memory {format_bytes(trino.get('peak_memory_bytes', 0))}"
+                + (f" · spilled {format_bytes(trino['spilled_bytes'])}" if trino.get("spilled_bytes") else "")
+            )
+        if timing.get("info_uri"):
+            st.markdown(f"[Open in Trino UI]({timing['info_uri']})")
 
-    try:
-        response = ollama.generate(
-            model=OLLAMA_MODEL,
-            prompt=prompt,
-            options={
-                "temperature": 0.1,
-                "num_predict": 500
-            }
-        )
-        
-        full_response = response['response'].strip()
-        
-        # Parse explanation and SQL
-        explanation = ""
-        sql = ""
-        
-        if "EXPLANATION:" in full_response and "SQL:" in full_response:
-            parts = full_response.split("SQL:")
-            explanation = parts[0].replace("EXPLANATION:", "").strip()
-            sql = parts[1].strip()
-        else:
-            # Fallback if format not followed
-            sql = full_response
-        
-        # Clean up SQL
-        sql = sql.replace('```sql', '').replace('```', '').strip().rstrip(';')
-        
-        # Remove any explanatory text before/after the SQL
-        lines = sql.split('\n')
-        sql_lines = []
-        in_sql = False
-        
-        for line in lines:
-            line_upper = line.strip().upper()
-            if line_upper.startswith(('SELECT', 'WITH')):
-                in_sql = True
-            if in_sql:
-                sql_lines.append(line)
-            if line_upper.endswith(';'):
-                break
-        
-        sql = '\n'.join(sql_lines).strip().rstrip(';')
-        
-        elapsed_time = time.time() - start_time
-        return sql, elapsed_time, None, explanation
-        
-    except Exception as e:
-        elapsed_time = time.time() - start_time
-        return None, elapsed_time, str(e), None
+PROVIDERS = {
+    "claude": {
+        "label": "Claude",
+        "name": "Claude",
+        "title": "### 🤖 Claude API",
+        "model": CLAUDE_MODEL,
+        "generate": generate_sql_with_claude
+    },
+    "mistral": {
+        "label": "Mistral",
+        "name": "Mistral",
+        "title": "### 🇫🇷 Mistral AI",
+        "model": MISTRAL_MODEL,
+        "generate": generate_sql_with_mistral
+    },
+    "ollama": {
+        "label": "Ollama",
+        "name": OLLAMA_MODEL,
+        "title": "### 🦙 Local Ollama",
+        "model": OLLAMA_MODEL,
+        "generate": generate_sql_with_ollama
+    }
+}
 
-def generate_sql_with_claude(user_query: str, schema_context: dict) -> tuple:
-    """Use Claude to generate SQL from natural language"""
+def make_stream_preview(placeholder):
+    """on_token callback that renders the partial explanation and SQL into a placeholder"""
+    last_update = [0.0]
     
-    if not anthropic_client:
-        return None, 0, "Anthropic API key not configured", None
+    def on_token(explanation, sql):
+        # Throttle redraws; tokens arrive much faster than the browser needs them
+        now = time.time()
+        if now - last_update[0] < 0.1:
+            return
+        last_update[0] = now
+        with placeholder.container():
+            if explanation:
+                st.info(f"💭 {explanation}")
+            if sql:
+                st.code(sql, language="sql")
     
+    return on_token
+
+def generate_sql_cached(provider: str, user_query: str, schema_context: dict,
+                        stream: bool = False, on_token=None, use_cache: bool = True, cancel=None) -> tuple:
+    """Serve generated SQL from the generation cache, falling back to the provider
+
+    With use_cache=False the provider is always called and the cache entry refreshed.
+    A hit reports a generation time of 0 (the lookup time is in metrics["lookup_time"]).
+    """
     start_time = time.time()
+    cache = get_generation_cache()
+    # The same schema description the provider would be sent, so hits match what a miss stores
+    core_desc, extra_desc, prompt_stats = schema_prompt_for(provider, schema_context, user_query)
+    cache_key = make_generation_key(
+        provider,
+        PROVIDERS[provider]["model"],
+        user_query,
+        core_desc + extra_desc
+    )
     
-    schema_desc = format_schema_for_prompt(schema_context)
+    cached = cache.get(cache_key) if use_cache else None
+    if cached:
+        metrics = {
+            "cached": True,
+            "ttft": None,
+            "time_to_sql": None,
+            "lookup_time": time.time() - start_time,
+            "schema_prompt": prompt_stats,
+            "guard": cached.get("guard", {})
+        }
+        return cached["sql"], 0.0, None, cached["explanation"], metrics
     
-    try:
-        response = anthropic_client.messages.create(
-            model=CLAUDE_MODEL,
-            max_tokens=1000,
-            temperature=0.1,
-            system=f"""You are a SQL expert specializing in Trino SQL. Based on user questions, provide:
-1. A brief explanation of your query approach (1 sentence)
-2. The SQL query
-
-{schema_desc}
-
-Format your response exactly like this:
-EXPLANATION: [one sentence explaining the query approach]
-SQL:
-[the SQL query without markdown or code blocks]
-
-Always use schema.table format. Return only SELECT statements.""",
-            messages=[
-                {"role": "user", "content": user_query}
-            ]
+    sql, gen_time, gen_error, explanation, metrics = PROVIDERS[provider]["generate"](
+        user_query,
+        schema_context,
+        stream=stream,
+        on_token=on_token,
+        cancel=cancel
+    )
+    if not gen_error and sql:
+        cache_key = make_generation_key(
+            provider,
+            PROVIDERS[provider]["model"],
+            user_query,
+            metrics["schema_desc"]
         )
-        
-        full_response = response.content[0].text.strip()
-        
-        # Parse explanation and SQL
-        explanation = ""
-        sql = ""
-        
-        if "EXPLANATION:" in full_response and "SQL:" in full_response:
-            parts = full_response.split("SQL:")
-            explanation = parts[0].replace("EXPLANATION:", "").strip()
-            sql = parts[1].strip()
-        else:
-            sql = full_response
-        
-        # Clean up formatting
-        sql = sql.replace('```sql', '').replace('```', '').strip().rstrip(';')
-        
-        elapsed_time = time.time() - start_time
-        return sql, elapsed_time, None, explanation
-        
-    except Exception as e:
-        elapsed_time = time.time() - start_time
-        return None, elapsed_time, str(e), None
+        cache.put(cache_key, {
+            "sql": sql,
+            "explanation": explanation,
+            "gen_time": gen_time,
+            "guard": metrics.get("guard", {})
+        })
+    return sql, gen_time, gen_error, explanation, metrics
+
+def run_provider_pipeline(provider: str, user_query: str, schema_context: dict,
+                          stream: bool = False, on_token=None, use_cache: bool = True, cancel=None) -> dict:
+    """Generate SQL with one provider and execute it (safe to run on a worker thread)
 
-def generate_sql_with_mistral(user_query: str, schema_context: dict) -> tuple:
-    """Use Mistral to generate SQL from natural language"""
+    ``cancel`` (a provider_race.CancelToken) stops token streaming and the Trino query.
+    """
+    start_time = time.time()
     
-    if not mistral_client:
-        return None, 0, "Mistral API key not configured", None
+    sql, gen_time, gen_error, explanation, metrics = generate_sql_cached(
+        provider,
+        user_query,
+        schema_context,
+        stream=stream,
+        on_token=on_token,
+        use_cache=use_cache,
+        cancel=cancel
+    )
+    outcome = {
+        "sql": sql,
+        "gen_time": gen_time,
+        "gen_error": gen_error,
+        "explanation": explanation,
+        "metrics": metrics
+    }
     
-    start_time = time.time()
+    cost = None
+    if not gen_error and COST_GATE_ENABLED and not get_result_cache().contains(sql):
+        try:
+            cost = estimate_sql_cost(sql)
+        except Exception:
+            # Trino unreachable: let execute_sql report the connection error
+            cost = None
+        outcome["cost"] = cost
     
-    schema_desc = format_schema_for_prompt(schema_context)
+    blocked = check_budget(
+        cost,
+        max_scan_bytes=COST_GATE_MAX_SCAN_GB * 1024 ** 3,
+        max_scan_rows=COST_GATE_MAX_SCAN_ROWS
+    ) if cost else None
     
-    system_prompt = f"""You are a SQL expert specializing in Trino SQL. Based on user questions, provide:
-1. A brief explanation of your query approach (1 sentence)
-2. The SQL query
+    if blocked:
+        # Invalid or over-budget SQL never reaches execution
+        outcome.update({
+            "df": None,
+            "exec_time": 0,
+            "exec_error": None if cost["valid"] else f"Validation Error: {cost['error']}",
+            "blocked": blocked if cost["valid"] else None,
+            "result_cache": None
+        })
+    elif not gen_error:
+        exec_start = time.time()
+        (df, exec_time, exec_error), result_cache = get_result_cache().get_or_execute(
+            sql,
+            lambda sql: execute_sql(sql, cancel=cancel),
+            cancel=cancel
+        )
+        if result_cache != "miss":
+            # Time actually spent waiting, not the original execution time
+            exec_time = time.time() - exec_start
+        outcome.update({
+            "df": df,
+            "exec_time": exec_time,
+            "exec_error": exec_error,
+            "result_cache": result_cache
+        })
+    
+    outcome["total_time"] = time.time() - start_time
+    return outcome
 
-{schema_desc}
+def run_providers_concurrently(providers: list, user_query: str, schema_context: dict,
+                               stream: bool = False, on_tokens: dict = None, use_cache: bool = True):
+    """Run several provider pipelines in parallel, yielding (provider, outcome) as each finishes"""
+    ctx = get_script_run_ctx()
+    on_tokens = on_tokens or {}
+    
+    def task(provider):
+        # Let worker threads use st.cache_resource (connection pool, caches) and update placeholders
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return run_provider_pipeline(
+            provider,
+            user_query,
+            schema_context,
+            stream=stream,
+            on_token=on_tokens.get(provider),
+            use_cache=use_cache
+        )
+    
+    with ThreadPoolExecutor(max_workers=len(providers)) as executor:
+        futures = {executor.submit(task, provider): provider for provider in providers}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
 
-Format your response exactly like this:
-EXPLANATION: [one sentence explaining the query approach]
-SQL:
-[the SQL query without markdown or code blocks]
+def run_providers_race(providers: list, user_query: str, schema_context: dict,
+                       preferred: str = None, use_cache: bool = True) -> dict:
+    """Run provider pipelines in parallel and keep the first answer that executes successfully
 
-Always use schema.table format. Return only SELECT statements."""
+    Always streams: closing a token stream is what stops a losing provider mid-generation.
+    """
+    ctx = get_script_run_ctx()
     
-    try:
-        response = mistral_client.chat.complete(
-            model=MISTRAL_MODEL,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_query}
-            ],
-            temperature=0.1,
-            max_tokens=1000
+    def task(provider, cancel):
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return run_provider_pipeline(
+            provider,
+            user_query,
+            schema_context,
+            stream=True,
+            use_cache=use_cache,
+            cancel=cancel
         )
-        
-        full_response = response.choices[0].message.content.strip()
-        
-        # Parse explanation and SQL
-        explanation = ""
-        sql = ""
-        
-        if "EXPLANATION:" in full_response and "SQL:" in full_response:
-            parts = full_response.split("SQL:")
-            explanation = parts[0].replace("EXPLANATION:", "").strip()
-            sql = parts[1].strip()
-        else:
-            sql = full_response
-        
-        # Clean up formatting
-        sql = sql.replace('```sql', '').replace('```', '').strip().rstrip(';')
-        
-        elapsed_time = time.time() - start_time
-        return sql, elapsed_time, None, explanation
-        
-    except Exception as e:
-        elapsed_time = time.time() - start_time
-        return None, elapsed_time, str(e), None
+    
+    def is_valid(outcome):
+        return not outcome["gen_error"] and outcome.get("df") is not None and not outcome.get("exec_error")
+    
+    return race(
+        task,
+        providers,
+        is_valid,
+        timeouts=RACE_TIMEOUTS,
+        preferred=preferred,
+        grace=RACE_PREFERENCE_GRACE
+    )
 
-def execute_sql(sql: str) -> tuple:
-    """Execute SQL query against Trino and return DataFrame with timing"""
-    start_time = time.time()
+def regenerate_query(user_query: str):
+    """Button callback: ask the providers again on the next script run, skipping the generation cache"""
+    st.session_state.example_query = user_query
+    st.session_state.regenerate_query = user_query
+
+def confirm_over_budget(provider: str, sql: str, export_sql: str = None):
+    """Button callback: run an over-budget query on the next script run"""
+    st.session_state.confirmed_query = {"provider": provider, "sql": sql, "export_sql": export_sql}
+
+def render_provider_outcome(provider: str, outcome: dict, comparison_result: dict):
+    """Display one provider's generated SQL and results, and record them in comparison_result"""
+    comparison_result[f'{provider}_total_time'] = outcome["total_time"]
     
-    try:
-        conn = get_trino_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute(sql)
-        
-        # Get column names
-        columns = [desc[0] for desc in cursor.description] if cursor.description else []
-        
-        # Fetch results
-        rows = cursor.fetchall()
-        
-        cursor.close()
-        conn.close()
-        
-        elapsed_time = time.time() - start_time
-        
-        if rows:
-            df = pd.DataFrame(rows, columns=columns)
+    if outcome["gen_error"]:
+        st.error(f"❌ Generation Error: {outcome['gen_error']}")
+        comparison_result[f'{provider}_error'] = outcome["gen_error"]
+        comparison_result[f'{provider}_success'] = False
+        return
+    
+    # Show explanation
+    if outcome["explanation"]:
+        st.info(f"💭 {outcome['explanation']}")
+    
+    st.code(outcome["sql"], language="sql")
+    metrics = outcome["metrics"]
+    guard = metrics.get("guard") or {}
+    if guard.get("changes"):
+        st.caption(f"🛡️ SQL rewritten: {'; '.join(guard['changes'])}")
+        with st.expander("Show rewrite diff"):
+            st.code(guard["diff"], language="diff")
+    if metrics.get("cached"):
+        st.caption(f"⏱️ Generation: ⚡ from cache (lookup {metrics['lookup_time'] * 1000:.0f}ms)")
+    elif metrics.get("streamed"):
+        ttft = metrics["ttft"]
+        st.caption(
+            f"⏱️ Generation: {outcome['gen_time']:.2f}s · "
+            f"first token {ttft:.2f}s · SQL ready {metrics['time_to_sql']:.2f}s"
+            if ttft is not None else f"⏱️ Generation: {outcome['gen_time']:.2f}s"
+        )
+    else:
+        st.caption(f"⏱️ Generation: {outcome['gen_time']:.2f}s")
+    prompt_stats = metrics.get("schema_prompt")
+    if prompt_stats:
+        st.caption(
+            f"📉 Schema prompt: {prompt_stats['tables']}/{prompt_stats['total_tables']} tables, "
+            f"~{prompt_stats['tokens']:,} tokens (full schema ~{prompt_stats['full_tokens']:,}, "
+            f"{prompt_stats['saved_pct']:.0f}% saved)"
+        )
+    usage = metrics.get("usage")
+    if usage:
+        if usage.get("cached_tokens") is None:
+            st.caption(
+                f"🗄️ Prompt: {usage['input_tokens']:,} tokens evaluated in {usage['prompt_eval_ms']:.0f}ms "
+                f"(model kept loaded, shared prefix reused)"
+            )
         else:
-            df = pd.DataFrame(columns=columns)
-        
-        return df, elapsed_time, None
+            st.caption(
+                f"🗄️ Prompt: {usage['input_tokens']:,} input tokens · "
+                f"{usage['cached_tokens']:,} read from cache · {usage['cache_write_tokens']:,} written to cache"
+            )
+    
+    comparison_result[f'{provider}_sql'] = outcome["sql"]
+    comparison_result[f'{provider}_gen_time'] = outcome["gen_time"]
+    comparison_result[f'{provider}_explanation'] = outcome["explanation"]
+    comparison_result[f'{provider}_ttft'] = metrics.get("ttft")
+    comparison_result[f'{provider}_time_to_sql'] = metrics.get("time_to_sql")
+    comparison_result[f'{provider}_cache_hit'] = bool(metrics.get("cached"))
+    comparison_result[f'{provider}_sql_rewrites'] = guard.get("changes", [])
+    if prompt_stats:
+        comparison_result[f'{provider}_prompt_tokens'] = prompt_stats['tokens']
+        comparison_result[f'{provider}_prompt_full_tokens'] = prompt_stats['full_tokens']
+    if usage:
+        comparison_result[f'{provider}_input_tokens'] = usage['input_tokens']
+        comparison_result[f'{provider}_cached_tokens'] = usage['cached_tokens']
+    
+    cost = outcome.get("cost")
+    if cost:
+        st.caption(f"🧮 Estimate: {describe_estimate(cost)}")
+        comparison_result[f'{provider}_scan_bytes'] = cost['scan_bytes']
+    
+    if outcome.get("blocked"):
+        st.warning(f"🛑 Not executed: {outcome['blocked']}")
+        st.button(
+            "▶️ Run anyway",
+            key=f"run_anyway_{provider}",
+            on_click=confirm_over_budget,
+            args=(provider, outcome["sql"], guard.get("export_sql"))
+        )
+        comparison_result[f'{provider}_blocked'] = outcome["blocked"]
+        comparison_result[f'{provider}_success'] = False
+        return
+    
+    if outcome["exec_error"]:
+        st.error(f"❌ {outcome['exec_error']}")
+        comparison_result[f'{provider}_exec_error'] = outcome["exec_error"]
+        comparison_result[f'{provider}_success'] = False
+    else:
+        df = outcome["df"]
+        render_result_pages(df, key=f"{provider}_results")
+        cache_note = {
+            "hit": " · ⚡ cached result",
+            "shared": " · 🔗 shared with identical query"
+        }.get(outcome["result_cache"], "")
+        st.success(f"✅ {len(df)} rows in {outcome['exec_time']:.2f}s{cache_note}")
+        if "memory_bytes" in df.attrs:
+            st.caption(f"🧠 Result memory: {format_bytes(df.attrs['memory_bytes'])}")
+        if "timing" in df.attrs:
+            render_timing_breakdown(
+                df.attrs["timing"],
+                outcome["gen_time"],
+                from_cache=outcome["result_cache"] == "hit"
+            )
+        if df.attrs.get("truncated"):
+            st.warning(
+                f"⚠️ Result truncated at {len(df):,} rows "
+                f"(limit {df.attrs['row_limit']:,} rows / {RESULT_MAX_MB} MB); the Trino query was cancelled"
+            )
+        render_export_buttons(outcome["sql"], df, key=f"{provider}_results", export_sql=guard.get("export_sql"))
         
-    except TrinoUserError as e:
-        elapsed_time = time.time() - start_time
-        return None, elapsed_time, f"Trino Error: {str(e)}"
-    except Exception as e:
-        elapsed_time = time.time() - start_time
-        return None, elapsed_time, f"Execution Error: {str(e)}"
+        comparison_result[f'{provider}_exec_time'] = outcome["exec_time"]
+        comparison_result[f'{provider}_rows'] = len(df)
+        comparison_result[f'{provider}_truncated'] = bool(df.attrs.get("truncated"))
+        comparison_result[f'{provider}_memory_bytes'] = df.attrs.get("memory_bytes")
+        comparison_result[f'{provider}_timing'] = df.attrs.get("timing")
+        comparison_result[f'{provider}_success'] = True
+    
+    comparison_result[f'{provider}_result_cache'] = outcome["result_cache"]
+
+def render_cube_answer(answer: dict, comparison_result: dict):
+    """Display a metric question answered by Cube and record it in comparison_result"""
+    st.markdown("### 📐 Cube Semantic Layer")
+    st.code(json.dumps(answer["query"], indent=2), language="json")
+    
+    df = answer["df"]
+    render_result_pages(df, key="cube_results")
+    st.success(f"✅ {len(df)} rows in {answer['elapsed']:.2f}s")
+    if answer["pre_aggregations"]:
+        st.caption(f"📐 Served from pre-aggregation {', '.join(f'`{name}`' for name in answer['pre_aggregations'])} · no LLM call")
+    else:
+        st.caption("📐 No matching pre-aggregation: Cube queried Trino directly · no LLM call")
+    
+    comparison_result['cube_query'] = answer["query"]
+    comparison_result['cube_time'] = answer["elapsed"]
+    comparison_result['cube_rows'] = len(df)
+    comparison_result['cube_pre_aggregations'] = answer["pre_aggregations"]
 
 # Sidebar
 with st.sidebar:
@@ -453,7 +839,7 @@ with st.sidebar:
     # Create clickable options with custom styling
     backend_mode = st.radio(
     "Select Backend:",
-    ["🦙 Local Ollama", "🤖 Claude API", "🇫🇷 Mistral AI", "⚖️ Compare All"],
+    ["🦙 Local Ollama", "🤖 Claude API", "🇫🇷 Mistral AI", "⚖️ Compare All", "🏁 Race"],
     index=0,  # Ollama as default
     help="Choose which AI backend to use for SQL generation"
 )
@@ -462,6 +848,26 @@ with st.sidebar:
         st.caption("✅ Data stays on your Mac - GDPR compliant")
     elif backend_mode == "🇫🇷 Mistral AI":
         st.caption("🇪🇺 European AI sovereignty")
+    elif backend_mode == "🏁 Race":
+        st.caption("First answer that executes successfully wins; the other providers are cancelled")
+        race_preferred = st.selectbox(
+            "Preferred provider",
+            list(PROVIDERS),
+            index=list(PROVIDERS).index(RACE_PREFERRED_PROVIDER) if RACE_PREFERRED_PROVIDER in PROVIDERS else 0,
+            format_func=lambda provider: PROVIDERS[provider]["label"],
+            help=f"Wins if it answers within {RACE_PREFERENCE_GRACE:.1f}s of a faster provider"
+        )
+    
+    stream_tokens = st.toggle(
+        "Stream tokens",
+        value=True,
+        help="Show the explanation and SQL as they are generated and stop as soon as the SQL is complete"
+    )
+    use_cube_metrics = st.toggle(
+        "Metric questions via Cube",
+        value=CUBE_METRICS_ENABLED,
+        help="Answer questions like 'revenue by category per month' from Cube pre-aggregations, without an LLM call"
+    )
     
     st.divider()
     
@@ -485,7 +891,7 @@ with st.sidebar:
     with col2:
         # Check Ollama
         try:
-            ollama.list()
+            ollama_client.list()
             st.success("✅ Ollama OK")
         except:
             st.error("❌ Ollama Down")
@@ -498,6 +904,19 @@ with st.sidebar:
         st.code(f"Schema: {TRINO_SCHEMA}")
         st.code(f"Ollama: {OLLAMA_HOST}")
     
+    # Connection pool metrics
+    with st.expander("Connection Pool"):
+        pool_stats = get_trino_pool().stats()
+        col1, col2 = st.columns(2)
+        with col1:
+            st.metric("In Use", f"{pool_stats['in_use']}/{pool_stats['max_size']}")
+            st.metric("Checkouts", pool_stats['checkouts'])
+            st.metric("Reconnects", pool_stats['reconnects'])
+        with col2:
+            st.metric("Idle", pool_stats['idle'])
+            st.metric("Avg Wait", f"{pool_stats['avg_wait_time']*1000:.0f}ms")
+            st.metric("Evicted", pool_stats['evicted'])
+    
     st.divider()
     
     # Model information
@@ -516,10 +935,11 @@ with st.sidebar:
     with col1:
         if st.button("🔄 Refresh", use_container_width=True):
             with st.spinner("Loading schema..."):
-                schema = get_schema_context()
+                schema = get_schema_context(force_refresh=True)
                 if schema:
                     st.session_state.schema_context = schema
-                    st.success(f"✅ Loaded")
+                    refresh = get_schema_cache().last_refresh
+                    st.success(f"✅ {refresh.get('reloaded_tables', 0)} tables added or changed")
     
     with col2:
         if st.session_state.schema_context:
@@ -531,39 +951,82 @@ with st.sidebar:
         with st.expander("Schema Summary"):
             for schema, tables in st.session_state.schema_context.items():
                 st.write(f"**{schema}**: {len(tables)} tables")
+            cache_age = get_schema_cache().age()
+            if cache_age is not None:
+                st.caption(f"Cache age: {cache_age/60:.0f} min · fingerprint `{st.session_state.schema_fingerprint}`")
     
     st.divider()
     
     # Statistics
     st.subheader("📈 Statistics")
     
-    if st.session_state.comparison_history:
-        total_queries = len(st.session_state.comparison_history)
-        st.metric("Total Queries", total_queries)
-        
-        # Calculate averages
-        claude_times = [q.get('claude_gen_time', 0) for q in st.session_state.comparison_history if 'claude_gen_time' in q]
-        mistral_times = [q.get('mistral_gen_time', 0) for q in st.session_state.comparison_history if 'mistral_gen_time' in q]
-        ollama_times = [q.get('ollama_gen_time', 0) for q in st.session_state.comparison_history if 'ollama_gen_time' in q]
+    # All-time aggregates from the metrics store (see the Provider Metrics page for more)
+    provider_summary = {
+        row["provider"]: row for row in get_metrics_store().summary()
+        if row["provider"] in PROVIDERS and row["model"] == PROVIDERS[row["provider"]]["model"]
+    }
+    if provider_summary:
+        st.metric("Total Runs", sum(row["runs"] for row in provider_summary.values()))
         
-        if claude_times:
-            st.metric("Avg Claude Time", f"{sum(claude_times)/len(claude_times):.2f}s")
-        if mistral_times:
-            st.metric("Avg Mistral Time", f"{sum(mistral_times)/len(mistral_times):.2f}s")
-        if ollama_times:
-            st.metric("Avg Ollama Time", f"{sum(ollama_times)/len(ollama_times):.2f}s")
+        for provider, row in provider_summary.items():
+            st.metric(
+                f"{PROVIDERS[provider]['label']} p50 / p95",
+                f"{row['gen_p50']:.2f}s / {row['gen_p95']:.2f}s" if row["gen_p50"] is not None else "N/A",
+                f"{(1 - row['error_rate'])*100:.0f}% success · {row['runs']} runs",
+                delta_color="off"
+            )
+    
+    # Generation cache
+    generation_stats = get_generation_cache().stats()
+    with st.expander("🧠 Generation Cache"):
+        col1, col2 = st.columns(2)
+        with col1:
+            st.metric("Hits", generation_stats['hits'])
+            st.metric("Hit Rate", f"{generation_stats['hit_rate']*100:.0f}%")
+        with col2:
+            st.metric("Misses", generation_stats['misses'])
+            st.metric("Entries", generation_stats['entries'])
+        if st.button("Clear cache", use_container_width=True):
+            get_generation_cache().clear()
+    
+    # Provider-side prompt caching: latency of requests that did / did not hit the cache
+    prompt_cache_rows = []
+    for provider, info in PROVIDERS.items():
+        runs = [
+            q for q in st.session_state.comparison_history
+            if q.get(f'{provider}_input_tokens') is not None and not q.get(f'{provider}_cache_hit')
+        ]
+        if not runs:
+            continue
+        hits = [q for q in runs if q.get(f'{provider}_cached_tokens')]
+        misses = [q for q in runs if not q.get(f'{provider}_cached_tokens')]
         
-        # Success rates
-        claude_success = sum(1 for q in st.session_state.comparison_history if q.get('claude_success'))
-        mistral_success = sum(1 for q in st.session_state.comparison_history if q.get('mistral_success'))
-        ollama_success = sum(1 for q in st.session_state.comparison_history if q.get('ollama_success'))
+        def avg_time(rows):
+            return f"{sum(q[f'{provider}_gen_time'] for q in rows)/len(rows):.2f}s" if rows else "N/A"
         
-        if claude_times:
-            st.metric("Claude Success", f"{(claude_success/len(claude_times)*100):.0f}%")
-        if mistral_times:
-            st.metric("Mistral Success", f"{(mistral_success/len(mistral_times)*100):.0f}%")
-        if ollama_times:
-            st.metric("Ollama Success", f"{(ollama_success/len(ollama_times)*100):.0f}%")
+        prompt_cache_rows.append({
+            "Provider": info["label"],
+            "Cached Tokens": sum(q.get(f'{provider}_cached_tokens') or 0 for q in runs),
+            "Uncached Tokens": sum(
+                q[f'{provider}_input_tokens'] - (q.get(f'{provider}_cached_tokens') or 0) for q in runs
+            ),
+            "Avg (cache hit)": avg_time(hits),
+            "Avg (no hit)": avg_time(misses)
+        })
+    if prompt_cache_rows:
+        with st.expander("🗄️ Prompt Cache"):
+            st.dataframe(pd.DataFrame(prompt_cache_rows), hide_index=True)
+    
+    # Result cache
+    result_stats = get_result_cache().stats()
+    with st.expander("📦 Result Cache"):
+        col1, col2 = st.columns(2)
+        with col1:
+            st.metric("Hits", result_stats['hits'])
+            st.metric("Merged In-Flight", result_stats['shared'])
+        with col2:
+            st.metric("Trino Runs", result_stats['misses'])
+            st.metric("Memory", f"{result_stats['bytes']/1024/1024:.1f} MB")
     
     st.divider()
     
@@ -604,6 +1067,28 @@ if st.session_state.schema_context is None:
             st.error("❌ Failed to load schema. Check Trino connection.")
             st.stop()
 
+# Over-budget query the user chose to run anyway
+confirmed_query = st.session_state.pop('confirmed_query', None)
+if confirmed_query:
+    st.subheader(f"▶️ Running over-budget query from {PROVIDERS[confirmed_query['provider']]['name']}")
+    st.code(confirmed_query["sql"], language="sql")
+    with st.spinner("Executing query..."):
+        df, exec_time, exec_error = execute_sql(confirmed_query["sql"])
+    if exec_error:
+        st.error(f"❌ {exec_error}")
+    else:
+        render_result_pages(df, key="confirmed_results")
+        st.success(f"✅ {len(df)} rows in {exec_time:.2f}s")
+        st.caption(f"🧠 Result memory: {format_bytes(df.attrs['memory_bytes'])}")
+        render_timing_breakdown(df.attrs["timing"])
+        render_export_buttons(
+            confirmed_query["sql"],
+            df,
+            key="confirmed_results",
+            export_sql=confirmed_query.get("export_sql")
+        )
+    st.divider()
+
 # Query input
 user_query = st.chat_input("Ask a question about your data...") or st.session_state.get('example_query')
 
@@ -615,188 +1100,182 @@ if user_query:
     st.subheader(f"📝 Query: *{user_query}*")
     st.divider()
     
+    # Only the question the Regenerate button was clicked for skips the generation cache
+    bypass_generation_cache = st.session_state.pop('regenerate_query', None) == user_query
+    
     comparison_result = {
         "timestamp": datetime.now().isoformat(),
         "query": user_query
     }
     
-    # Determine which backends to run
-    run_claude = backend_mode in ["🤖 Claude API", "⚖️ Compare All"]
-    run_mistral = backend_mode in ["🇫🇷 Mistral AI", "⚖️ Compare All"]
-    run_ollama = backend_mode in ["🦙 Local Ollama", "⚖️ Compare All"]
+    cube_answer = None
+    if use_cube_metrics:
+        with st.spinner("Checking the Cube semantic layer..."):
+            cube_answer = get_cube_client().answer(user_query, limit=min(RESULT_MAX_ROWS, CUBE_MAX_LIMIT))
     
-    # Create columns based on mode
-    if backend_mode == "⚖️ Compare All":
-        claude_col, mistral_col, ollama_col = st.columns(3)
+    if cube_answer and cube_answer["df"] is not None:
+        # Metric question served by Cube: no LLM call and no fact-table scan
+        selected = []
+        render_cube_answer(cube_answer, comparison_result)
     else:
-        claude_col = mistral_col = ollama_col = st.container()
-    
-    # Claude API
-    if run_claude:
-        with claude_col:
-            st.markdown("### 🤖 Claude API")
+        if cube_answer:
+            st.caption(f"📐 Cube could not answer ({cube_answer['error']}); falling back to SQL on Trino")
+        
+        # Determine which backends to run
+        run_claude = backend_mode in ["🤖 Claude API", "⚖️ Compare All", "🏁 Race"]
+        run_mistral = backend_mode in ["🇫🇷 Mistral AI", "⚖️ Compare All", "🏁 Race"]
+        run_ollama = backend_mode in ["🦙 Local Ollama", "⚖️ Compare All", "🏁 Race"]
+        
+        # Create columns based on mode
+        if backend_mode == "⚖️ Compare All":
+            claude_col, mistral_col, ollama_col = st.columns(3)
+        else:
+            claude_col = mistral_col = ollama_col = st.container()
+        
+        selected = [
+            provider for provider, enabled in
+            [("claude", run_claude), ("mistral", run_mistral), ("ollama", run_ollama)]
+            if enabled
+        ]
+        columns = {"claude": claude_col, "mistral": mistral_col, "ollama": ollama_col}
+        
+        if backend_mode == "⚖️ Compare All":
+            # All three pipelines run in parallel; each column fills in as soon as its provider finishes
+            placeholders = {}
+            for provider in selected:
+                with columns[provider]:
+                    st.markdown(PROVIDERS[provider]["title"])
+                    placeholders[provider] = st.empty()
+                    placeholders[provider].info(f"⏳ Generating SQL with {PROVIDERS[provider]['name']}...")
             
-            with st.spinner("Generating SQL with Claude..."):
-                claude_sql, claude_gen_time, claude_error, claude_explanation = generate_sql_with_claude(
-                    user_query,
-                    st.session_state.schema_context
-                )
-                
-                if claude_error:
-                    st.error(f"❌ Generation Error: {claude_error}")
-                    comparison_result['claude_error'] = claude_error
-                    comparison_result['claude_success'] = False
-                else:
-                    # Show explanation
-                    if claude_explanation:
-                        st.info(f"💭 {claude_explanation}")
-                    
-                    st.code(claude_sql, language="sql")
-                    st.caption(f"⏱️ Generation: {claude_gen_time:.2f}s")
-                    
-                    comparison_result['claude_sql'] = claude_sql
-                    comparison_result['claude_gen_time'] = claude_gen_time
-                    comparison_result['claude_explanation'] = claude_explanation
-                    
-                    # Execute query
-                    with st.spinner("Executing..."):
-                        df, exec_time, exec_error = execute_sql(claude_sql)
-                        
-                        if exec_error:
-                            st.error(f"❌ {exec_error}")
-                            comparison_result['claude_exec_error'] = exec_error
-                            comparison_result['claude_success'] = False
-                        else:
-                            st.dataframe(df, use_container_width=True)
-                            st.success(f"✅ {len(df)} rows in {exec_time:.2f}s")
-                            
-                            comparison_result['claude_exec_time'] = exec_time
-                            comparison_result['claude_rows'] = len(df)
-                            comparison_result['claude_success'] = True
-    
-    # Mistral AI
-    if run_mistral:
-        with mistral_col:
-            st.markdown("### 🇫🇷 Mistral AI")
+            wall_start = time.time()
+            for provider, outcome in run_providers_concurrently(
+                selected,
+                user_query,
+                st.session_state.schema_context,
+                stream=stream_tokens,
+                on_tokens={provider: make_stream_preview(placeholders[provider]) for provider in selected},
+                use_cache=not bypass_generation_cache
+            ):
+                with placeholders[provider].container():
+                    render_provider_outcome(provider, outcome, comparison_result)
+            comparison_result['wall_time'] = time.time() - wall_start
+        elif backend_mode == "🏁 Race":
+            race_status = st.empty()
+            race_status.info(f"🏁 Racing {', '.join(PROVIDERS[provider]['label'] for provider in selected)}...")
+            race_result = run_providers_race(
+                selected,
+                user_query,
+                st.session_state.schema_context,
+                preferred=race_preferred,
+                use_cache=not bypass_generation_cache
+            )
+            race_status.empty()
             
-            with st.spinner("Generating SQL with Mistral..."):
-                mistral_sql, mistral_gen_time, mistral_error, mistral_explanation = generate_sql_with_mistral(
-                    user_query,
-                    st.session_state.schema_context
-                )
-                
-                if mistral_error:
-                    st.error(f"❌ Generation Error: {mistral_error}")
-                    comparison_result['mistral_error'] = mistral_error
-                    comparison_result['mistral_success'] = False
-                else:
-                    # Show explanation
-                    if mistral_explanation:
-                        st.info(f"💭 {mistral_explanation}")
-                    
-                    st.code(mistral_sql, language="sql")
-                    st.caption(f"⏱️ Generation: {mistral_gen_time:.2f}s")
-                    
-                    comparison_result['mistral_sql'] = mistral_sql
-                    comparison_result['mistral_gen_time'] = mistral_gen_time
-                    comparison_result['mistral_explanation'] = mistral_explanation
-                    
-                    # Execute query
-                    with st.spinner("Executing..."):
-                        df, exec_time, exec_error = execute_sql(mistral_sql)
-                        
-                        if exec_error:
-                            st.error(f"❌ {exec_error}")
-                            comparison_result['mistral_exec_error'] = exec_error
-                            comparison_result['mistral_success'] = False
-                        else:
-                            st.dataframe(df, use_container_width=True)
-                            st.success(f"✅ {len(df)} rows in {exec_time:.2f}s")
-                            
-                            comparison_result['mistral_exec_time'] = exec_time
-                            comparison_result['mistral_rows'] = len(df)
-                            comparison_result['mistral_success'] = True
-    
-    # Local Ollama
-    if run_ollama:
-        with ollama_col:
-            st.markdown("### 🦙 Local Ollama")
+            winner = race_result["winner"]
+            comparison_result['wall_time'] = race_result["wall_time"]
+            comparison_result['race_winner'] = winner
+            comparison_result['race_status'] = race_result["status"]
             
-            with st.spinner(f"Generating SQL with {OLLAMA_MODEL}..."):
-                ollama_sql, ollama_gen_time, ollama_error, ollama_explanation  = generate_sql_with_ollama(
-                    user_query,
-                    st.session_state.schema_context
-                )
-                
-                if ollama_error:
-                    st.error(f"❌ Generation Error: {ollama_error}")
-                    comparison_result['ollama_error'] = ollama_error
-                    comparison_result['ollama_success'] = False
-                else:
-                    # Show explanation
-                    if ollama_explanation:
-                        st.info(f"💭 {ollama_explanation}")
-
-                    st.code(ollama_sql, language="sql")
-                    st.caption(f"⏱️ Generation: {ollama_gen_time:.2f}s")
-                    
-                    comparison_result['ollama_sql'] = ollama_sql
-                    comparison_result['ollama_gen_time'] = ollama_gen_time
-                    comparison_result['ollama_explanation'] = ollama_explanation
+            if winner:
+                st.markdown(PROVIDERS[winner]["title"])
+                st.caption(f"🏁 First valid answer after {race_result['finished'][winner]:.2f}s")
+                render_provider_outcome(winner, race_result["outcomes"][winner], comparison_result)
+            else:
+                st.error("❌ No provider produced SQL that executed successfully")
+            
+            st.table(pd.DataFrame([
+                {
+                    "Provider": PROVIDERS[provider]["label"],
+                    "Status": {
+                        "won": "🏆 won",
+                        "outranked": "🥈 valid, preferred provider won",
+                        "failed": "❌ failed",
+                        "timeout": f"⏱️ timed out ({RACE_TIMEOUTS[provider]:.0f}s)",
+                        "cancelled": "✂️ cancelled"
+                    }[race_result["status"][provider]],
+                    "After": f"{race_result['finished'][provider]:.2f}s"
+                }
+                for provider in sorted(selected, key=lambda provider: race_result["finished"][provider])
+            ]))
+            
+            # Providers that finished without winning are still shown (and recorded in the metrics)
+            finished = [provider for provider in selected if provider != winner and provider in race_result["outcomes"]]
+            if finished:
+                tabs = st.tabs([PROVIDERS[provider]["label"] for provider in finished])
+                for tab, provider in zip(tabs, finished):
+                    with tab:
+                        render_provider_outcome(provider, race_result["outcomes"][provider], comparison_result)
+        else:
+            for provider in selected:
+                with columns[provider]:
+                    st.markdown(PROVIDERS[provider]["title"])
                     
-                    # Execute query
-                    with st.spinner("Executing..."):
-                        df, exec_time, exec_error = execute_sql(ollama_sql)
-                        
-                        if exec_error:
-                            st.error(f"❌ {exec_error}")
-                            comparison_result['ollama_exec_error'] = exec_error
-                            comparison_result['ollama_success'] = False
-                        else:
-                            st.dataframe(df, use_container_width=True)
-                            st.success(f"✅ {len(df)} rows in {exec_time:.2f}s")
-                            
-                            comparison_result['ollama_exec_time'] = exec_time
-                            comparison_result['ollama_rows'] = len(df)
-                            comparison_result['ollama_success'] = True
+                    preview = st.empty()
+                    with st.spinner(f"Generating SQL with {PROVIDERS[provider]['name']}..."):
+                        outcome = run_provider_pipeline(
+                            provider,
+                            user_query,
+                            st.session_state.schema_context,
+                            stream=stream_tokens,
+                            on_token=make_stream_preview(preview),
+                            use_cache=not bypass_generation_cache
+                        )
+                    preview.empty()
+                    render_provider_outcome(provider, outcome, comparison_result)
+    
+    if any(comparison_result.get(f'{provider}_cache_hit') for provider in selected):
+        st.button(
+            "🔄 Regenerate",
+            key="regenerate",
+            on_click=regenerate_query,
+            args=(user_query,),
+            help="Ask the providers again for this question instead of reusing cached SQL"
+        )
     
     # Save comparison
     st.session_state.comparison_history.append(comparison_result)
+    record_provider_runs(comparison_result, selected)
     
     # Comparison summary (only in Compare All mode)
-    if backend_mode == "⚖️ Compare All":
+    if backend_mode == "⚖️ Compare All" and selected:
         st.divider()
         st.markdown("### 📊 Comparison Summary")
         
         # Show all pairwise comparisons if multiple succeeded
         results_table = []
         
-        if 'claude_gen_time' in comparison_result:
-            results_table.append({
-                "Provider": "Claude",
-                "Gen Time": f"{comparison_result['claude_gen_time']:.2f}s",
-                "Rows": comparison_result.get('claude_rows', 'N/A'),
-                "Status": "✅" if comparison_result.get('claude_success') else "❌"
-            })
-        
-        if 'mistral_gen_time' in comparison_result:
-            results_table.append({
-                "Provider": "Mistral",
-                "Gen Time": f"{comparison_result['mistral_gen_time']:.2f}s",
-                "Rows": comparison_result.get('mistral_rows', 'N/A'),
-                "Status": "✅" if comparison_result.get('mistral_success') else "❌"
-            })
-        
-        if 'ollama_gen_time' in comparison_result:
+        for provider, info in PROVIDERS.items():
+            if f'{provider}_gen_time' not in comparison_result:
+                continue
+            exec_time = comparison_result.get(f'{provider}_exec_time')
             results_table.append({
-                "Provider": "Ollama",
-                "Gen Time": f"{comparison_result['ollama_gen_time']:.2f}s",
-                "Rows": comparison_result.get('ollama_rows', 'N/A'),
-                "Status": "✅" if comparison_result.get('ollama_success') else "❌"
+                "Provider": info["label"],
+                "Gen Time": f"{comparison_result[f'{provider}_gen_time']:.2f}s",
+                "Exec Time": f"{exec_time:.2f}s" if exec_time is not None else "N/A",
+                "Rows": comparison_result.get(f'{provider}_rows', 'N/A'),
+                "Memory": format_bytes(comparison_result[f'{provider}_memory_bytes'])
+                if comparison_result.get(f'{provider}_memory_bytes') is not None else "N/A",
+                "Result": {
+                    "hit": "⚡ cached",
+                    "shared": "🔗 shared",
+                    "miss": "Trino"
+                }.get(comparison_result.get(f'{provider}_result_cache'), "N/A"),
+                "Status": "✅" if comparison_result.get(f'{provider}_success')
+                else "🛑" if comparison_result.get(f'{provider}_blocked') else "❌"
             })
         
         if results_table:
             st.table(pd.DataFrame(results_table))
+        
+        if 'wall_time' in comparison_result:
+            sequential_time = sum(
+                comparison_result.get(f'{provider}_total_time', 0) for provider in PROVIDERS
+            )
+            st.caption(
+                f"⚡ Wall time {comparison_result['wall_time']:.2f}s "
+                f"(sequential would be ~{sequential_time:.2f}s)"
+            )
 
 # Query History
 if st.session_state.comparison_history:
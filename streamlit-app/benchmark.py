@@ -0,0 +1,419 @@
+"""
+Offline NL-to-SQL benchmark
+
+Drives the app's generate_sql_with_* functions over a versioned question set
+and runs the generated SQL on a local DuckDB stand-in for the lakehouse,
+built from the init-scripts seed data, the lakehouse-data parquet files and
+the dbt models. By default providers are replaced by stub clients replaying
+recorded replies, so runs need no API keys, Ollama or Trino.
+
+    python benchmark.py                              # replay recorded replies
+    python benchmark.py --live --providers ollama    # call the real providers
+    python benchmark.py --output run.json --compare baseline.json
+
+Requires duckdb (pip install duckdb).
+"""
+import argparse
+import datetime
+import decimal
+import json
+import math
+import re
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+
+import sql_generation
+from schema_index import estimate_tokens
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+BENCHMARK_DIR = Path(__file__).resolve().parent / "benchmarks"
+DEFAULT_QUESTIONS = BENCHMARK_DIR / "questions.json"
+DEFAULT_RESPONSES = BENCHMARK_DIR / "responses.json"
+
+PROVIDERS = {
+    "claude": sql_generation.generate_sql_with_claude,
+    "mistral": sql_generation.generate_sql_with_mistral,
+    "ollama": sql_generation.generate_sql_with_ollama,
+}
+
+# Seed scripts loaded into catalogs named like the Trino catalogs the dbt models read from
+SEED_SCRIPTS = [
+    ("postgres", "public", REPO_ROOT / "init-scripts" / "postgres" / "01-init-greencard-data.sql"),
+    ("mysql", "catalog_db", REPO_ROOT / "init-scripts" / "mysql" / "01-init-catalog-data.sql"),
+]
+DBT_MODELS_DIR = REPO_ROOT / "dbt" / "models"
+DBT_TARGET_SCHEMA = "dbt"
+DBT_LAYERS = ["staging", "intermediate", "marts"]
+
+PERCENTILES = (50, 95, 99)
+FLOAT_DIGITS = 2
+# Latency changes smaller than this (seconds) are timer noise, not regressions
+LATENCY_NOISE_FLOOR = 0.01
+
+
+# -- Local engine ---------------------------------------------------------
+
+def _run_script(conn, sql: str):
+    for statement in sql.split(";"):
+        if statement.strip():
+            conn.execute(statement)
+
+
+def _render_dbt_model(sql: str) -> str:
+    """Strip config() and resolve ref() to the dbt_<layer> schema the model was built in
+
+    Models are built from scratch, so incremental filters render as a full refresh.
+    """
+    sql = re.sub(r"\{\{\s*config\(.*?\)\s*\}\}", "", sql, flags=re.S)
+    sql = re.sub(r"\{\{\s*incremental_orders_filter\(.*?\)\s*\}\}", "1 = 1", sql)
+
+    def ref(match):
+        name = match.group(1)
+        layer = next(
+            (layer for layer in DBT_LAYERS if (DBT_MODELS_DIR / layer / f"{name}.sql").exists()),
+            DBT_LAYERS[0]
+        )
+        return f"lakehouse.{DBT_TARGET_SCHEMA}_{layer}.{name}"
+
+    return re.sub(r"\{\{\s*ref\(\s*['\"](\w+)['\"]\s*\)\s*\}\}", ref, sql)
+
+
+def build_engine():
+    """In-memory DuckDB database mirroring the postgres, mysql and lakehouse catalogs"""
+    conn = duckdb.connect()
+    for catalog, schema, path in SEED_SCRIPTS:
+        conn.execute(f"ATTACH ':memory:' AS {catalog}")
+        conn.execute(f"CREATE SCHEMA IF NOT EXISTS {catalog}.{schema}")
+        conn.execute(f"USE {catalog}.{schema}")
+        conn.execute("CREATE SEQUENCE IF NOT EXISTS serial_ids")
+        sql = Path(path).read_text()
+        # PostgreSQL SERIAL columns become sequence-backed integers
+        sql = re.sub(r"\bSERIAL\b", "INTEGER DEFAULT nextval('serial_ids')", sql, flags=re.I)
+        _run_script(conn, sql)
+
+    conn.execute("ATTACH ':memory:' AS lakehouse")
+    conn.execute("CREATE SCHEMA lakehouse.raw_data")
+    for table_dir in sorted((REPO_ROOT / "lakehouse-data").iterdir()):
+        if table_dir.is_dir() and any(table_dir.glob("*.parquet")):
+            conn.execute(
+                f"CREATE TABLE lakehouse.raw_data.{table_dir.name} AS "
+                f"SELECT * FROM read_parquet('{table_dir.as_posix()}/*.parquet')"
+            )
+
+    for layer in DBT_LAYERS:
+        schema = f"lakehouse.{DBT_TARGET_SCHEMA}_{layer}"
+        conn.execute(f"CREATE SCHEMA {schema}")
+        for model in sorted((DBT_MODELS_DIR / layer).glob("*.sql")):
+            sql = _render_dbt_model(model.read_text())
+            conn.execute(f"CREATE TABLE {schema}.{model.stem} AS {sql}")
+
+    conn.execute(f"USE lakehouse.{sql_generation.TRINO_SCHEMA}")
+    return conn
+
+
+def engine_schema_context(conn) -> dict:
+    """Schema context in the same shape schema_loader builds from Trino"""
+    rows = conn.execute("""
+        SELECT table_schema, table_name, column_name, lower(data_type)
+        FROM information_schema.columns
+        WHERE table_catalog = 'lakehouse' AND table_schema <> 'information_schema'
+        ORDER BY table_schema, table_name, ordinal_position
+    """).fetchall()
+    schema_context = {}
+    for schema, table, column, data_type in rows:
+        schema_context.setdefault(schema, {}).setdefault(table, []).append(
+            {"name": column, "type": data_type}
+        )
+    return schema_context
+
+
+# -- Stub providers -------------------------------------------------------
+
+class ReplayProvider:
+    """Stands in for a provider client, answering with the reply set for the current question
+
+    Input token counts are estimated from the actual request, so changes to
+    the prompts show up in the benchmark even though replies are recorded.
+    """
+
+    def __init__(self):
+        self.reply = None
+        self.messages = SimpleNamespace(create=self._claude_create)
+        self.chat = SimpleNamespace(complete=self._mistral_complete)
+
+    def _next_reply(self) -> str:
+        if self.reply is None:
+            raise LookupError("No recorded reply for this question")
+        return self.reply
+
+    def _claude_create(self, system, messages, **kwargs):
+        prompt = "".join(block["text"] for block in system) + "".join(m["content"] for m in messages)
+        return SimpleNamespace(
+            content=[SimpleNamespace(text=self._next_reply())],
+            usage=SimpleNamespace(
+                input_tokens=estimate_tokens(prompt),
+                cache_read_input_tokens=0,
+                cache_creation_input_tokens=0
+            )
+        )
+
+    def _mistral_complete(self, messages, **kwargs):
+        prompt = "".join(m["content"] for m in messages)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=self._next_reply()))],
+            usage=SimpleNamespace(prompt_tokens=estimate_tokens(prompt))
+        )
+
+    def generate(self, prompt, **kwargs):
+        return {
+            "response": self._next_reply(),
+            "done": True,
+            "prompt_eval_count": estimate_tokens(prompt),
+            "prompt_eval_duration": 0
+        }
+
+
+def install_replay_clients() -> ReplayProvider:
+    """Point every generator at one replay stub"""
+    stub = ReplayProvider()
+    sql_generation.anthropic_client = stub
+    sql_generation.mistral_client = stub
+    sql_generation.ollama_client = stub
+    return stub
+
+
+# -- Scoring --------------------------------------------------------------
+
+def _normalize(value):
+    if value is None:
+        return "NULL"
+    if isinstance(value, float) and math.isnan(value):
+        return "NULL"
+    if isinstance(value, (decimal.Decimal, float, np.floating)):
+        value = round(float(value), FLOAT_DIGITS)
+        return str(int(value)) if value.is_integer() else f"{value:.{FLOAT_DIGITS}f}"
+    if isinstance(value, (bool, np.bool_)):
+        return str(bool(value)).lower()
+    if isinstance(value, (int, np.integer)):
+        return str(int(value))
+    if isinstance(value, datetime.datetime) and value.time() == datetime.time():
+        return value.date().isoformat()
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+def _row_keys(rows: list) -> list:
+    # Column names and order are ignored: each row becomes its sorted normalized values
+    return [tuple(sorted(_normalize(v) for v in row)) for row in rows]
+
+
+def results_match(actual: list, expected: list, ordered: bool = False) -> bool:
+    """Compare result rows; floats are rounded and row order only matters when ``ordered``"""
+    actual_keys, expected_keys = _row_keys(actual), _row_keys(expected)
+    if ordered:
+        return actual_keys == expected_keys
+    return Counter(actual_keys) == Counter(expected_keys)
+
+
+def percentiles(values: list) -> dict:
+    values = [v for v in values if v is not None]
+    if not values:
+        return {f"p{p}": None for p in PERCENTILES}
+    return {f"p{p}": float(np.percentile(values, p)) for p in PERCENTILES}
+
+
+# -- Runner ---------------------------------------------------------------
+
+def execute(conn, sql: str) -> tuple:
+    """(rows, seconds, error) for sql on the local engine"""
+    start = time.perf_counter()
+    try:
+        rows = conn.execute(sql).fetchall()
+        return rows, time.perf_counter() - start, None
+    except duckdb.Error as e:
+        return None, time.perf_counter() - start, str(e)
+
+
+def run_question(provider: str, question: dict, conn, schema_context: dict, stub, responses: dict) -> dict:
+    if stub is not None:
+        stub.reply = responses.get(provider, {}).get(question["id"])
+
+    sql, gen_time, gen_error, _, metrics = PROVIDERS[provider](question["question"], schema_context)
+    record = {
+        "id": question["id"],
+        "provider": provider,
+        "sql": sql,
+        "gen_time": gen_time,
+        "gen_error": gen_error,
+        "prompt_tokens": (metrics.get("usage") or {}).get("input_tokens"),
+        "schema_prompt_tokens": (metrics.get("schema_prompt") or {}).get("tokens"),
+        "sql_rewrites": (metrics.get("guard") or {}).get("changes", []),
+        "exec_time": None,
+        "exec_error": None,
+        "rows": None,
+        "correct": False,
+    }
+    if gen_error:
+        return record
+
+    rows, record["exec_time"], record["exec_error"] = execute(conn, sql)
+    if rows is not None:
+        record["rows"] = len(rows)
+        expected, _, expected_error = execute(conn, question["sql"])
+        if expected_error:
+            raise ValueError(f"Reference SQL for {question['id']} failed: {expected_error}")
+        record["correct"] = results_match(rows, expected, ordered=question.get("ordered", False))
+    return record
+
+
+def summarize(records: list) -> dict:
+    """Per-provider accuracy, latency percentiles and token usage"""
+    summary = {}
+    for provider in dict.fromkeys(r["provider"] for r in records):
+        runs = [r for r in records if r["provider"] == provider]
+        prompt_tokens = [r["prompt_tokens"] for r in runs if r["prompt_tokens"] is not None]
+        summary[provider] = {
+            "questions": len(runs),
+            "correct": sum(r["correct"] for r in runs),
+            "accuracy": sum(r["correct"] for r in runs) / len(runs),
+            "gen_errors": sum(1 for r in runs if r["gen_error"]),
+            "exec_errors": sum(1 for r in runs if r["exec_error"]),
+            "gen_time": percentiles([r["gen_time"] for r in runs if not r["gen_error"]]),
+            "exec_time": percentiles([r["exec_time"] for r in runs]),
+            "prompt_tokens_mean": sum(prompt_tokens) / len(prompt_tokens) if prompt_tokens else None,
+            "prompt_tokens_total": sum(prompt_tokens),
+        }
+    return summary
+
+
+def run_benchmark(questions: dict, responses: dict, providers: list, live: bool = False) -> dict:
+    conn = build_engine()
+    schema_context = engine_schema_context(conn)
+    stub = None if live else install_replay_clients()
+
+    records = [
+        run_question(provider, question, conn, schema_context, stub, responses)
+        for provider in providers
+        for question in questions["questions"]
+    ]
+    return {
+        "question_set": questions.get("version"),
+        "mode": "live" if live else "replay",
+        "started_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "models": {
+            "claude": sql_generation.CLAUDE_MODEL,
+            "mistral": sql_generation.MISTRAL_MODEL,
+            "ollama": sql_generation.OLLAMA_MODEL,
+        },
+        "summary": summarize(records),
+        "questions": records,
+    }
+
+
+def compare_runs(current: dict, baseline: dict, max_latency_regression: float = 0.2) -> list:
+    """Regressions of current against baseline: accuracy drops, p95 latency and token growth"""
+    regressions = []
+    if current.get("question_set") != baseline.get("question_set"):
+        regressions.append(
+            f"question set changed ({baseline.get('question_set')} -> {current.get('question_set')}); "
+            "results are not comparable"
+        )
+        return regressions
+
+    for provider, now in current["summary"].items():
+        before = baseline["summary"].get(provider)
+        if not before:
+            continue
+        if now["accuracy"] < before["accuracy"]:
+            regressions.append(
+                f"{provider}: accuracy {before['accuracy']:.0%} -> {now['accuracy']:.0%}"
+            )
+        for metric in ("gen_time", "exec_time"):
+            old, new = before[metric]["p95"], now[metric]["p95"]
+            if old and new and new > old * (1 + max_latency_regression) and new - old > LATENCY_NOISE_FLOOR:
+                regressions.append(f"{provider}: {metric} p95 {old:.3f}s -> {new:.3f}s")
+        old, new = before["prompt_tokens_mean"], now["prompt_tokens_mean"]
+        if old and new and new > old * (1 + max_latency_regression):
+            regressions.append(f"{provider}: mean prompt tokens {old:.0f} -> {new:.0f}")
+    return regressions
+
+
+def _latencies(stats: dict) -> str:
+    return "/".join(f"{stats[f'p{p}'] * 1000:.1f}" if stats[f"p{p}"] is not None else "-" for p in PERCENTILES)
+
+
+def print_report(run: dict):
+    print(f"Question set {run['question_set']} · {run['mode']} mode · {run['started_at']}")
+    print(f"{'provider':<9} {'correct':>8} {'accuracy':>9} {'errors':>7} "
+          f"{'gen ms p50/p95/p99':>22} {'exec ms p50/p95/p99':>22} {'prompt tok':>11}")
+    for provider, s in run["summary"].items():
+        tokens = f"{s['prompt_tokens_mean']:.0f}" if s["prompt_tokens_mean"] is not None else "-"
+        print(f"{provider:<9} {s['correct']:>4}/{s['questions']:<3} {s['accuracy']:>9.0%} "
+              f"{s['gen_errors'] + s['exec_errors']:>7} {_latencies(s['gen_time']):>22} "
+              f"{_latencies(s['exec_time']):>22} {tokens:>11}")
+    for record in run["questions"]:
+        if not record["correct"]:
+            reason = record["gen_error"] or record["exec_error"] or "wrong result"
+            print(f"  ✗ {record['provider']}/{record['id']}: {reason.splitlines()[0][:120]}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", default=DEFAULT_QUESTIONS, type=Path, help="question set JSON")
+    parser.add_argument("--responses", default=DEFAULT_RESPONSES, type=Path, help="recorded replies JSON")
+    parser.add_argument("--providers", default=",".join(PROVIDERS), help="comma-separated providers")
+    parser.add_argument("--live", action="store_true", help="call the configured providers instead of replaying")
+    parser.add_argument("--output", type=Path, help="write the full run as JSON")
+    parser.add_argument("--compare", type=Path, help="baseline run JSON; exit 1 on regressions")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="tolerated relative growth of p95 latency and prompt tokens (default 0.2)")
+    args = parser.parse_args(argv)
+
+    if duckdb is None:
+        print("The benchmark needs duckdb: pip install duckdb", file=sys.stderr)
+        return 2
+
+    providers = [p.strip() for p in args.providers.split(",") if p.strip()]
+    unknown = [p for p in providers if p not in PROVIDERS]
+    if unknown:
+        parser.error(f"unknown providers: {', '.join(unknown)}")
+
+    questions = json.loads(args.questions.read_text())
+    responses = {} if args.live else json.loads(args.responses.read_text())
+    if not args.live and responses.get("question_set") != questions.get("version"):
+        print(
+            f"Recorded replies are for question set {responses.get('question_set')}, "
+            f"not {questions.get('version')}",
+            file=sys.stderr
+        )
+        return 2
+
+    run = run_benchmark(questions, responses.get("responses", {}), providers, live=args.live)
+    print_report(run)
+
+    if args.output:
+        args.output.write_text(json.dumps(run, indent=2))
+
+    if args.compare:
+        regressions = compare_runs(run, json.loads(args.compare.read_text()), args.max_regression)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+        print(f"No regressions against {args.compare}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
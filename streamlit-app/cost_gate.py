@@ -0,0 +1,121 @@
+"""
+Pre-flight cost estimation for generated SQL
+
+Runs EXPLAIN (TYPE VALIDATE) to catch invalid statements without executing
+them, then EXPLAIN (TYPE IO, FORMAT JSON) to estimate how many rows and
+bytes the query would read, so expensive queries can be rejected or held for
+confirmation before they reach the cluster.
+"""
+import json
+import math
+
+
+def _number(value):
+    """Trino reports unknown estimates as NaN (or omits them)"""
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(value) or math.isinf(value) else value
+
+
+def _fetch_one(cursor, sql: str):
+    cursor.execute(sql)
+    rows = cursor.fetchall()
+    return rows[0][0] if rows else None
+
+
+def estimate_cost(cursor, sql: str) -> dict:
+    """Validate sql and estimate its input size using a DB-API cursor
+
+    Returns a dict with ``valid``, ``error``, ``scan_rows``, ``scan_bytes``,
+    ``output_rows`` (None when Trino has no statistics), ``unknown`` (True if
+    any scanned table lacks statistics) and ``tables``.
+    """
+    sql = sql.strip().rstrip(';')
+    estimate = {
+        "valid": True,
+        "error": None,
+        "scan_rows": None,
+        "scan_bytes": None,
+        "output_rows": None,
+        "unknown": True,
+        "tables": [],
+    }
+
+    try:
+        _fetch_one(cursor, f"EXPLAIN (TYPE VALIDATE) {sql}")
+    except (ConnectionError, OSError):
+        raise
+    except Exception as e:
+        estimate["valid"] = False
+        estimate["error"] = str(e)
+        return estimate
+
+    try:
+        plan = json.loads(_fetch_one(cursor, f"EXPLAIN (TYPE IO, FORMAT JSON) {sql}") or "{}")
+    except (ConnectionError, OSError):
+        raise
+    except Exception as e:
+        # The query is valid; only the estimate is unavailable (e.g. connector without IO plans)
+        estimate["error"] = f"No IO estimate: {str(e)}"
+        return estimate
+
+    scan_rows = scan_bytes = 0.0
+    unknown = False
+    for info in plan.get("inputTableColumnInfos", []):
+        table = info.get("table", {})
+        schema_table = table.get("schemaTable", {})
+        name = ".".join(filter(None, [
+            table.get("catalog"), schema_table.get("schema"), schema_table.get("table")
+        ]))
+        rows = _number(info.get("estimate", {}).get("outputRowCount"))
+        size = _number(info.get("estimate", {}).get("outputSizeInBytes"))
+        estimate["tables"].append({"table": name, "rows": rows, "bytes": size})
+        if rows is None or size is None:
+            unknown = True
+        scan_rows += rows or 0
+        scan_bytes += size or 0
+
+    estimate["scan_rows"] = scan_rows
+    estimate["scan_bytes"] = scan_bytes
+    estimate["output_rows"] = _number(plan.get("estimate", {}).get("outputRowCount"))
+    estimate["unknown"] = unknown
+    return estimate
+
+
+def check_budget(estimate: dict, max_scan_bytes: float = None, max_scan_rows: float = None) -> str:
+    """Return the reason the estimate exceeds the budget, or None if it is within it
+
+    Estimates Trino could not compute never block a query.
+    """
+    if not estimate.get("valid"):
+        return f"Invalid SQL: {estimate['error']}"
+    scan_bytes = estimate.get("scan_bytes")
+    scan_rows = estimate.get("scan_rows")
+    if max_scan_bytes and scan_bytes and scan_bytes > max_scan_bytes:
+        return f"estimated scan of {format_bytes(scan_bytes)} exceeds the {format_bytes(max_scan_bytes)} budget"
+    if max_scan_rows and scan_rows and scan_rows > max_scan_rows:
+        return f"estimated scan of {scan_rows:,.0f} rows exceeds the {max_scan_rows:,.0f} row budget"
+    return None
+
+
+def format_bytes(size: float) -> str:
+    for unit in ("B", "KB", "MB", "GB", "TB"):
+        if abs(size) < 1024 or unit == "TB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def describe_estimate(estimate: dict) -> str:
+    """One-line human readable summary of an estimate"""
+    if not estimate.get("valid"):
+        return "invalid SQL"
+    if estimate.get("scan_bytes") is None:
+        return "no estimate available"
+    text = f"~{format_bytes(estimate['scan_bytes'])} / {estimate['scan_rows']:,.0f} rows scanned"
+    if estimate.get("output_rows") is not None:
+        text += f", ~{estimate['output_rows']:,.0f} rows returned"
+    if estimate.get("unknown"):
+        text += " (some tables lack statistics)"
+    return text
@@ -0,0 +1,300 @@
+"""
+Answer metric questions from the Cube semantic layer
+
+Questions such as "revenue by category per month in 2024" map directly onto
+Cube measures, dimensions and a time granularity. They are translated into a
+Cube REST query and sent to the Cube API, where they are served from the
+pre-aggregations in cube/model instead of scanning the fact table in Trino.
+
+Matching is deliberately strict. Every word of the question must be a measure
+or dimension phrase (member names, titles and meta.synonyms from /meta), a
+granularity or date range, or a filler word. Anything else, such as "top 5",
+a filter value or "where", means the question is not a plain metric question
+and the caller falls back to generated SQL on Trino.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import re
+import threading
+import time
+
+import pandas as pd
+import requests
+
+# Seconds to wait for Cube to connect; each request (including "Continue wait" polling) is bounded by timeout
+CONNECT_TIMEOUT = 2
+CONTINUE_WAIT_INTERVAL = 0.5
+# After a failed /meta request, questions skip Cube for this long
+UNAVAILABLE_BACKOFF = 30
+
+GRANULARITY_PHRASES = {
+    "day": ["by day", "per day", "each day", "daily"],
+    "week": ["by week", "per week", "each week", "weekly"],
+    "month": ["by month", "per month", "each month", "monthly", "month over month"],
+    "quarter": ["by quarter", "per quarter", "each quarter", "quarterly"],
+    "year": ["by year", "per year", "each year", "yearly", "annual", "annually", "year over year"],
+}
+
+# Words that may appear in a metric question without changing its meaning
+FILLER_WORDS = {
+    "a", "across", "all", "along", "an", "and", "are", "as", "breakdown", "broken", "by", "can",
+    "did", "do", "does", "down", "each", "evolution", "for", "from", "get", "give", "group",
+    "grouped", "had", "has", "have", "how", "i", "in", "is", "it", "its", "make", "made", "me",
+    "metric", "metrics", "much", "of", "our", "over", "overall", "per", "please", "report", "see",
+    "show", "split", "sum", "summary", "tell", "the", "time", "to", "total", "trend", "trends",
+    "us", "was", "we", "were", "what", "whats", "with", "you",
+}
+
+
+def cube_token(secret: str, ttl: float = 3600) -> str:
+    """HS256 JWT for the Cube API, signed with CUBEJS_API_SECRET"""
+    def encode(data) -> bytes:
+        raw = data if isinstance(data, bytes) else json.dumps(data, separators=(",", ":")).encode()
+        return base64.urlsafe_b64encode(raw).rstrip(b"=")
+
+    signing_input = encode({"alg": "HS256", "typ": "JWT"}) + b"." + encode({"exp": int(time.time() + ttl)})
+    signature = hmac.new(secret.encode(), signing_input, hashlib.sha256).digest()
+    return (signing_input + b"." + encode(signature)).decode()
+
+
+def _words(text: str) -> list:
+    return re.findall(r"[a-z0-9]+", text.lower().replace("'", ""))
+
+
+def member_phrases(member: dict) -> set:
+    """Phrases that refer to a measure or dimension: its name, short title and meta.synonyms"""
+    name = member["name"].split(".", 1)[-1]
+    phrases = {" ".join(_words(re.sub(r"(?<=[a-z0-9])(?=[A-Z])", " ", name)))}
+    if member.get("shortTitle"):
+        phrases.add(" ".join(_words(member["shortTitle"])))
+    for synonym in (member.get("meta") or {}).get("synonyms", []):
+        phrases.add(" ".join(_words(synonym)))
+    # "avg order value" is also asked as "average order value"
+    phrases |= {re.sub(r"\bavg\b", "average", phrase) for phrase in phrases}
+    return {phrase for phrase in phrases if phrase}
+
+
+def _take(text: str, pattern: str):
+    """Remove the first match of pattern from text; returns (match or None, remaining text)"""
+    match = re.search(pattern, text)
+    if not match:
+        return None, text
+    return match, f"{text[:match.start()]} {text[match.end():]}"
+
+
+def _date_range(text: str) -> tuple:
+    """(Cube dateRange or None, text without the date expression)"""
+    match, text = _take(text, r"\b(?:between|from) (20\d\d) (?:and|to) (20\d\d)\b")
+    if match:
+        return [f"{match.group(1)}-01-01", f"{match.group(2)}-12-31"], text
+    match, text = _take(text, r"\b(this|last|previous) (year|quarter|month|week)\b")
+    if match:
+        return f"{'this' if match.group(1) == 'this' else 'last'} {match.group(2)}", text
+    match, text = _take(text, r"\b(?:last|past) (\d+) (day|week|month|year)s?\b")
+    if match:
+        return f"last {match.group(1)} {match.group(2)}s", text
+    match, text = _take(text, r"\b(today|yesterday)\b")
+    if match:
+        return match.group(1), text
+    match, text = _take(text, r"\b(20\d\d)\b")
+    if match:
+        return [f"{match.group(1)}-01-01", f"{match.group(1)}-12-31"], text
+    return None, text
+
+
+def match_metric_question(question: str, meta: list, limit: int = 10000):
+    """Cube query for a plain metric question, or None if it is not one
+
+    ``meta`` is the "cubes" list of the Cube /meta response. Only members of
+    a single cube are combined.
+    """
+    text = " ".join(_words(question))
+    date_range, text = _date_range(text)
+
+    granularity = None
+    for candidate, phrases in GRANULARITY_PHRASES.items():
+        for phrase in phrases:
+            match, text = _take(text, rf"\b{phrase}\b")
+            if match:
+                granularity = granularity or candidate
+    if granularity is None and re.search(r"\b(over time|trend|trends|evolution)\b", text):
+        granularity = "month"
+
+    phrases = []
+    for cube in meta:
+        for kind in ("measures", "dimensions"):
+            for member in cube.get(kind, []):
+                if member.get("isVisible") is False or member.get("public") is False:
+                    continue
+                for phrase in member_phrases(member):
+                    phrases.append((phrase, kind, member))
+
+    # Longest phrases first, so "sustainable revenue" is not read as "revenue"
+    measures, dimensions, time_dimension = [], [], None
+    for phrase, kind, member in sorted(phrases, key=lambda item: -len(item[0])):
+        match, text = _take(text, rf"\b{re.escape(phrase)}\b")
+        if not match:
+            continue
+        if kind == "measures":
+            if member["name"] not in measures:
+                measures.append(member["name"])
+        elif member.get("type") == "time":
+            time_dimension = member["name"]
+        elif member["name"] not in dimensions:
+            dimensions.append(member["name"])
+
+    leftover = [word for word in text.split() if word not in FILLER_WORDS]
+    if leftover or not measures:
+        return None
+    members = measures + dimensions + ([time_dimension] if time_dimension else [])
+    cube_names = {member.split(".", 1)[0] for member in members}
+    if len(cube_names) > 1:
+        return None
+
+    query = {"measures": measures, "dimensions": dimensions, "limit": limit}
+    if time_dimension and granularity is None:
+        # "revenue by date"
+        granularity = "day"
+    if granularity or date_range:
+        if time_dimension is None:
+            cube = next(cube for cube in meta if cube["name"] in cube_names)
+            time_dimension = next(
+                (member["name"] for member in cube.get("dimensions", []) if member.get("type") == "time"),
+                None
+            )
+            if time_dimension is None:
+                return None
+        entry = {"dimension": time_dimension}
+        if granularity:
+            entry["granularity"] = granularity
+            query["order"] = {time_dimension: "asc"}
+        if date_range:
+            entry["dateRange"] = date_range
+        query["timeDimensions"] = [entry]
+    elif dimensions:
+        query["order"] = {measures[0]: "desc"}
+    return query
+
+
+def result_frame(response: dict) -> pd.DataFrame:
+    """DataFrame from a /load response: short titles as columns, numeric measures, datetime time columns"""
+    annotation = response.get("annotation", {})
+    columns = {}
+    for kind in ("timeDimensions", "dimensions", "measures"):
+        for key, info in annotation.get(kind, {}).items():
+            columns[key] = (kind, info.get("shortTitle") or key)
+    # Time dimensions are annotated with and without granularity; keep the granular one
+    columns = {
+        key: value for key, value in columns.items()
+        if not (value[0] == "timeDimensions" and any(other.startswith(f"{key}.") for other in columns))
+    }
+
+    data = response.get("data", [])
+    df = pd.DataFrame({key: [row.get(key) for row in data] for key in columns})
+    for key, (kind, _) in columns.items():
+        if kind == "measures":
+            df[key] = pd.to_numeric(df[key], errors="coerce")
+        elif kind == "timeDimensions":
+            df[key] = pd.to_datetime(df[key], errors="coerce")
+    df.columns = [
+        f"{title} ({key.rsplit('.', 1)[-1]})" if kind == "timeDimensions" and key.count(".") > 1 else title
+        for key, (kind, title) in columns.items()
+    ]
+    return df
+
+
+class CubeClient:
+    """Thread-safe Cube REST API client with a cached /meta"""
+
+    def __init__(self, api_url: str, token: str = None, secret: str = None,
+                 timeout: float = 10.0, meta_ttl: float = 300.0):
+        self.api_url = api_url.rstrip("/")
+        self.token = token
+        self.secret = secret
+        self.timeout = timeout
+        self.meta_ttl = meta_ttl
+        self._meta = None
+        self._meta_time = 0.0
+        self._unavailable_until = 0.0
+        self._lock = threading.Lock()
+
+    def _headers(self) -> dict:
+        token = self.token or (cube_token(self.secret) if self.secret else None)
+        return {"Authorization": token} if token else {}
+
+    @staticmethod
+    def _error(response) -> str:
+        try:
+            return response.json().get("error") or response.text
+        except ValueError:
+            return response.text or f"HTTP {response.status_code}"
+
+    def meta(self) -> list:
+        """Cubes with their measures and dimensions (cached for meta_ttl seconds)"""
+        with self._lock:
+            now = time.time()
+            if self._meta is not None and now - self._meta_time < self.meta_ttl:
+                return self._meta
+            if now < self._unavailable_until:
+                raise ConnectionError("Cube API unavailable (retrying shortly)")
+            try:
+                response = requests.get(
+                    f"{self.api_url}/meta",
+                    headers=self._headers(),
+                    timeout=(CONNECT_TIMEOUT, self.timeout)
+                )
+                if response.status_code != 200:
+                    raise ConnectionError(f"Cube /meta failed: {self._error(response)}")
+            except (requests.RequestException, ConnectionError):
+                self._unavailable_until = now + UNAVAILABLE_BACKOFF
+                raise
+            self._meta = response.json().get("cubes", [])
+            self._meta_time = now
+            return self._meta
+
+    def load(self, query: dict) -> dict:
+        """Run a query, polling while Cube builds the pre-aggregation ("Continue wait")"""
+        deadline = time.time() + self.timeout
+        while True:
+            response = requests.post(
+                f"{self.api_url}/load",
+                json={"query": query},
+                headers=self._headers(),
+                timeout=(CONNECT_TIMEOUT, self.timeout)
+            )
+            if response.status_code == 200:
+                body = response.json()
+                if body.get("error") != "Continue wait":
+                    return body
+            elif self._error(response) != "Continue wait":
+                raise RuntimeError(f"Cube query failed: {self._error(response)}")
+            if time.time() + CONTINUE_WAIT_INTERVAL > deadline:
+                raise TimeoutError(f"Cube did not answer within {self.timeout:.0f}s")
+            time.sleep(CONTINUE_WAIT_INTERVAL)
+
+    def answer(self, question: str, limit: int = 10000):
+        """Answer a metric question through Cube, or None if it is not one (or Cube is unreachable)
+
+        Returns {"query", "df", "pre_aggregations", "elapsed", "error"}; on a
+        failed load "df" is None and "error" explains why.
+        """
+        start_time = time.time()
+        try:
+            meta = self.meta()
+        except Exception:
+            return None
+        query = match_metric_question(question, meta, limit=limit)
+        if query is None:
+            return None
+
+        answer = {"query": query, "df": None, "pre_aggregations": [], "error": None}
+        try:
+            response = self.load(query)
+            answer["df"] = result_frame(response)
+            answer["pre_aggregations"] = sorted(response.get("usedPreAggregations") or {})
+        except Exception as e:
+            answer["error"] = str(e)
+        answer["elapsed"] = time.time() - start_time
+        return answer
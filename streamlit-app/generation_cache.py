@@ -0,0 +1,135 @@
+"""
+Cache of generated SQL keyed by question, provider/model and schema prompt
+
+An in-process LRU with TTL sits in front of an optional SQLite file so that
+cached generations survive restarts and are shared across sessions.
+"""
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+
+
+def normalize_question(question: str) -> str:
+    """Case-fold, collapse whitespace and drop trailing punctuation"""
+    question = re.sub(r"\s+", " ", question.strip().lower())
+    return question.rstrip(" ?.!;")
+
+
+def make_generation_key(provider: str, model: str, question: str, schema_prompt: str) -> str:
+    """Cache key for one generation request"""
+    schema_hash = hashlib.sha256(schema_prompt.encode("utf-8")).hexdigest()
+    raw = "\x1f".join([provider, model, normalize_question(question), schema_hash])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class GenerationCache:
+    """Thread-safe LRU + TTL cache with an optional on-disk SQLite backend"""
+
+    def __init__(self, max_entries: int = 256, ttl: float = 86400.0, disk_path: Path = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_path = Path(disk_path) if disk_path else None
+        self._memory = OrderedDict()  # key -> (created_at, value)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "disk_hits": 0, "evictions": 0}
+
+        if self.disk_path:
+            self.disk_path.parent.mkdir(parents=True, exist_ok=True)
+            with self._disk() as db:
+                db.execute(
+                    "CREATE TABLE IF NOT EXISTS generations ("
+                    "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                    "created_at REAL NOT NULL, last_access REAL NOT NULL)"
+                )
+
+    @contextmanager
+    def _disk(self):
+        db = sqlite3.connect(self.disk_path, timeout=5)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def _expired(self, created_at: float) -> bool:
+        return time.time() - created_at > self.ttl
+
+    def _remember(self, key: str, created_at: float, value: dict):
+        """Insert into the memory tier, evicting least recently used entries (lock held)"""
+        self._memory[key] = (created_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def get(self, key: str):
+        """Return the cached value or None"""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and not self._expired(entry[0]):
+                self._memory.move_to_end(key)
+                self._stats["hits"] += 1
+                return entry[1]
+            if entry:
+                del self._memory[key]
+
+        if self.disk_path:
+            with self._disk() as db:
+                row = db.execute(
+                    "SELECT value, created_at FROM generations WHERE key = ?", (key,)
+                ).fetchone()
+                if row and not self._expired(row[1]):
+                    db.execute("UPDATE generations SET last_access = ? WHERE key = ?", (time.time(), key))
+                    value = json.loads(row[0])
+                    with self._lock:
+                        self._remember(key, row[1], value)
+                        self._stats["hits"] += 1
+                        self._stats["disk_hits"] += 1
+                    return value
+                if row:
+                    db.execute("DELETE FROM generations WHERE key = ?", (key,))
+
+        with self._lock:
+            self._stats["misses"] += 1
+        return None
+
+    def put(self, key: str, value: dict):
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, value)
+
+        if self.disk_path:
+            with self._disk() as db:
+                db.execute(
+                    "INSERT OR REPLACE INTO generations (key, value, created_at, last_access) "
+                    "VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(value), now, now)
+                )
+                # Same bounds on disk: drop expired rows, then least recently used beyond the cap
+                db.execute("DELETE FROM generations WHERE created_at < ?", (now - self.ttl,))
+                db.execute(
+                    "DELETE FROM generations WHERE key NOT IN ("
+                    "SELECT key FROM generations ORDER BY last_access DESC LIMIT ?)",
+                    (self.max_entries,)
+                )
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        if self.disk_path:
+            with self._disk() as db:
+                db.execute("DELETE FROM generations")
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._memory)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
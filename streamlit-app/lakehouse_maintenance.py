@@ -0,0 +1,224 @@
+"""
+Iceberg table maintenance through Trino
+
+Compacts small files (optimize), drops old snapshots (expire_snapshots) and
+deletes files no snapshot references (remove_orphan_files) for every Iceberg
+table in the given lakehouse schemas. File count and size are reported before
+and after each table.
+
+Partition specs and sort orders of dbt models are set in dbt/dbt_project.yml
+and applied on a full refresh. Tables dbt does not manage (the raw user
+events) get theirs from TABLE_LAYOUTS with --apply-layouts, which evolves the
+spec in place; the next optimize rewrites small files under it.
+
+    python lakehouse_maintenance.py                          # all schemas, once
+    python lakehouse_maintenance.py --dry-run                # report only
+    python lakehouse_maintenance.py --apply-layouts          # also set TABLE_LAYOUTS
+    python lakehouse_maintenance.py --interval 24h           # keep running daily
+
+Connects with the app's TRINO_* settings (.env).
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+import trino.dbapi
+from dotenv import load_dotenv
+
+from cost_gate import format_bytes
+
+load_dotenv()
+
+TRINO_HOST = os.getenv("TRINO_HOST", "localhost")
+TRINO_PORT = int(os.getenv("TRINO_PORT", "8080"))
+TRINO_USER = os.getenv("TRINO_USER", "admin")
+TRINO_CATALOG = os.getenv("TRINO_CATALOG", "lakehouse")
+
+DEFAULT_SCHEMAS = ["raw_data", "dbt_staging", "dbt_intermediate", "dbt_marts"]
+
+# Files below this size are rewritten by optimize
+DEFAULT_FILE_SIZE_THRESHOLD = "128MB"
+# Must be at least the catalog's iceberg.expire-snapshots.min-retention /
+# iceberg.remove-orphan-files.min-retention (7d by default)
+DEFAULT_RETENTION = "7d"
+
+# Layouts of tables dbt does not create ("schema.table")
+TABLE_LAYOUTS = {
+    "raw_data.user_events": {
+        "partitioning": ["day(event_timestamp)"],
+        "sorted_by": ["event_timestamp"],
+    },
+}
+
+
+def connect():
+    return trino.dbapi.connect(host=TRINO_HOST, port=TRINO_PORT, user=TRINO_USER, catalog=TRINO_CATALOG)
+
+
+def _query(cursor, sql: str) -> list:
+    cursor.execute(sql)
+    return cursor.fetchall()
+
+
+def _array(values: list) -> str:
+    return "ARRAY[" + ", ".join(f"'{value}'" for value in values) + "]"
+
+
+def _table(schema: str, table: str) -> str:
+    return f'{TRINO_CATALOG}."{schema}"."{table}"'
+
+
+def _metadata_table(schema: str, table: str, suffix: str) -> str:
+    return f'{TRINO_CATALOG}."{schema}"."{table}${suffix}"'
+
+
+def parse_interval(value: str) -> float:
+    """Seconds in "90s", "30m", "6h" or "1d" """
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([smhd]?)\s*", value)
+    if not match:
+        raise argparse.ArgumentTypeError(f"invalid interval: {value}")
+    return float(match.group(1)) * {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400}[match.group(2)]
+
+
+def iceberg_tables(cursor, schemas: list) -> list:
+    """(schema, table) of the base tables in the given schemas"""
+    placeholders = ", ".join(f"'{schema}'" for schema in schemas)
+    return [
+        (schema, table) for schema, table in _query(
+            cursor,
+            f"SELECT table_schema, table_name FROM {TRINO_CATALOG}.information_schema.tables "
+            f"WHERE table_schema IN ({placeholders}) AND table_type = 'BASE TABLE' "
+            f"ORDER BY table_schema, table_name"
+        )
+    ]
+
+
+def file_stats(cursor, schema: str, table: str, small_file_bytes: int) -> dict:
+    """Data file count and size of the current snapshot, plus the snapshot count"""
+    files, size, small = _query(
+        cursor,
+        f"SELECT count(*), coalesce(sum(file_size_in_bytes), 0), "
+        f"count_if(file_size_in_bytes < {small_file_bytes}) "
+        f"FROM {_metadata_table(schema, table, 'files')}"
+    )[0]
+    snapshots = _query(cursor, f"SELECT count(*) FROM {_metadata_table(schema, table, 'snapshots')}")[0][0]
+    return {"files": files, "bytes": size, "small_files": small, "snapshots": snapshots}
+
+
+def apply_layout(cursor, schema: str, table: str, layout: dict):
+    """Evolve the partition spec and sort order in place (existing files keep their old spec)"""
+    properties = ", ".join(f"{name} = {_array(values)}" for name, values in layout.items())
+    _query(cursor, f"ALTER TABLE {_table(schema, table)} SET PROPERTIES {properties}")
+
+
+def maintain_table(cursor, schema: str, table: str, file_size_threshold: str, retention: str):
+    """optimize, expire_snapshots and remove_orphan_files for one table"""
+    name = _table(schema, table)
+    _query(cursor, f"ALTER TABLE {name} EXECUTE optimize(file_size_threshold => '{file_size_threshold}')")
+    _query(cursor, f"ALTER TABLE {name} EXECUTE expire_snapshots(retention_threshold => '{retention}')")
+    _query(cursor, f"ALTER TABLE {name} EXECUTE remove_orphan_files(retention_threshold => '{retention}')")
+
+
+def _data_size_bytes(value: str) -> int:
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMGT]?B)\s*", value.upper())
+    if not match:
+        raise argparse.ArgumentTypeError(f"invalid data size: {value}")
+    return int(float(match.group(1)) * 1024 ** ["B", "KB", "MB", "GB", "TB"].index(match.group(2)))
+
+
+def run_maintenance(schemas: list, tables: list = None, file_size_threshold: str = DEFAULT_FILE_SIZE_THRESHOLD,
+                    retention: str = DEFAULT_RETENTION, apply_layouts: bool = False, dry_run: bool = False) -> list:
+    """Maintain every table and return one report row per table"""
+    small_file_bytes = _data_size_bytes(file_size_threshold)
+    conn = connect()
+    cursor = conn.cursor()
+    report = []
+    try:
+        for schema, table in iceberg_tables(cursor, schemas):
+            if tables and f"{schema}.{table}" not in tables and table not in tables:
+                continue
+            row = {"table": f"{schema}.{table}", "error": None, "layout": False}
+            start_time = time.time()
+            try:
+                row["before"] = file_stats(cursor, schema, table, small_file_bytes)
+                if not dry_run:
+                    layout = TABLE_LAYOUTS.get(f"{schema}.{table}")
+                    if apply_layouts and layout:
+                        apply_layout(cursor, schema, table, layout)
+                        row["layout"] = True
+                    maintain_table(cursor, schema, table, file_size_threshold, retention)
+                row["after"] = file_stats(cursor, schema, table, small_file_bytes)
+            except Exception as e:
+                # One broken table must not stop the others
+                row["error"] = str(e).splitlines()[0]
+            row["seconds"] = time.time() - start_time
+            report.append(row)
+    finally:
+        cursor.close()
+        conn.close()
+    return report
+
+
+def print_report(report: list, dry_run: bool = False):
+    """Before → after per table"""
+    print(f"Iceberg maintenance · {TRINO_CATALOG} @ {TRINO_HOST}:{TRINO_PORT}{' · dry run' if dry_run else ''}")
+    print(f"{'table':<42} {'files':>13} {'small':>11} {'size':>21} {'snapshots':>11} {'time':>7}")
+    for row in report:
+        if row["error"] and "after" not in row:
+            print(f"{row['table']:<42} error: {row['error'][:100]}")
+            continue
+        before, after = row["before"], row["after"]
+        print(
+            f"{row['table']:<42} "
+            f"{before['files']:>5} → {after['files']:<5} "
+            f"{before['small_files']:>4} → {after['small_files']:<4} "
+            f"{format_bytes(before['bytes']):>9} → {format_bytes(after['bytes']):<9} "
+            f"{before['snapshots']:>4} → {after['snapshots']:<4} "
+            f"{row['seconds']:>6.1f}s"
+            + (" · layout applied" if row["layout"] else "")
+        )
+        if row["error"]:
+            print(f"  error: {row['error'][:120]}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--schemas", default=",".join(DEFAULT_SCHEMAS), help="comma-separated lakehouse schemas")
+    parser.add_argument("--tables", default="", help="comma-separated tables (table or schema.table) to limit to")
+    parser.add_argument("--file-size-threshold", default=DEFAULT_FILE_SIZE_THRESHOLD,
+                        help=f"optimize rewrites files smaller than this (default {DEFAULT_FILE_SIZE_THRESHOLD})")
+    parser.add_argument("--retention", default=DEFAULT_RETENTION,
+                        help=f"snapshot and orphan file retention (default {DEFAULT_RETENTION})")
+    parser.add_argument("--apply-layouts", action="store_true", help="set the partitioning/sort order in TABLE_LAYOUTS")
+    parser.add_argument("--dry-run", action="store_true", help="only report file counts and sizes")
+    parser.add_argument("--interval", type=parse_interval, help="repeat every interval, e.g. 24h (default: run once)")
+    args = parser.parse_args(argv)
+
+    schemas = [schema.strip() for schema in args.schemas.split(",") if schema.strip()]
+    tables = [table.strip() for table in args.tables.split(",") if table.strip()]
+    while True:
+        try:
+            report = run_maintenance(
+                schemas,
+                tables,
+                file_size_threshold=args.file_size_threshold,
+                retention=args.retention,
+                apply_layouts=args.apply_layouts,
+                dry_run=args.dry_run
+            )
+            print_report(report, dry_run=args.dry_run)
+            failed = any(row["error"] for row in report)
+        except Exception as e:
+            # Trino unreachable: report it and, when scheduled, try again next interval
+            print(f"Maintenance failed: {str(e).splitlines()[0]}")
+            failed = True
+        if not args.interval:
+            return 1 if failed else 0
+        sys.stdout.flush()
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
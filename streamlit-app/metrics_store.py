@@ -0,0 +1,280 @@
+"""
+Persistent per-provider run metrics with incrementally maintained aggregates
+
+Every provider run is appended to a SQLite file. In the same transaction the
+run is folded into hourly aggregates (counts, sums and log-spaced latency
+histograms per provider/model), so dashboards read a few aggregate rows
+instead of rescanning the raw history. Percentiles come from the histograms
+and are accurate to about LATENCY_BIN_GROWTH. Runs answered from the
+generation or result cache are counted but kept out of the latency
+aggregates, which describe the providers and Trino only.
+"""
+import math
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+BUCKET_SECONDS = 3600
+# Latency histogram bins grow by 10%: bin n holds latencies up to 1.1**n ms
+LATENCY_BIN_GROWTH = 1.1
+LATENCY_METRICS = ("gen", "exec", "total")
+# Result cache statuses whose exec_time is a cache lookup or a wait on another run
+CACHED_RESULT_STATUSES = ("hit", "shared")
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS runs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        ts REAL NOT NULL,
+        provider TEXT NOT NULL,
+        model TEXT NOT NULL,
+        question TEXT,
+        success INTEGER NOT NULL,
+        blocked INTEGER NOT NULL,
+        error TEXT,
+        gen_time REAL,
+        exec_time REAL,
+        total_time REAL,
+        rows INTEGER,
+        input_tokens INTEGER,
+        cached_tokens INTEGER,
+        generation_cached INTEGER NOT NULL,
+        result_cache TEXT
+    )""",
+    "CREATE INDEX IF NOT EXISTS runs_ts ON runs (ts)",
+    """CREATE TABLE IF NOT EXISTS hourly_stats (
+        bucket INTEGER NOT NULL,
+        provider TEXT NOT NULL,
+        model TEXT NOT NULL,
+        runs INTEGER NOT NULL,
+        errors INTEGER NOT NULL,
+        blocked INTEGER NOT NULL,
+        cached_runs INTEGER NOT NULL DEFAULT 0,
+        gen_runs INTEGER NOT NULL DEFAULT 0,
+        gen_time_sum REAL NOT NULL,
+        exec_runs INTEGER NOT NULL,
+        exec_time_sum REAL NOT NULL,
+        rows_sum INTEGER NOT NULL,
+        token_runs INTEGER NOT NULL,
+        input_tokens_sum INTEGER NOT NULL,
+        cached_tokens_sum INTEGER NOT NULL,
+        PRIMARY KEY (bucket, provider, model)
+    )""",
+    """CREATE TABLE IF NOT EXISTS latency_bins (
+        bucket INTEGER NOT NULL,
+        provider TEXT NOT NULL,
+        model TEXT NOT NULL,
+        metric TEXT NOT NULL,
+        bin INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (bucket, provider, model, metric, bin)
+    )""",
+]
+
+# Columns added to existing files: (table, column, definition, backfill)
+MIGRATIONS = [
+    ("hourly_stats", "cached_runs", "INTEGER NOT NULL DEFAULT 0", None),
+    ("hourly_stats", "gen_runs", "INTEGER NOT NULL DEFAULT 0", "UPDATE hourly_stats SET gen_runs = runs"),
+]
+
+
+def latency_bin(seconds: float) -> int:
+    """Histogram bin of a latency; bin 0 holds everything up to 1 ms"""
+    ms = seconds * 1000
+    if ms <= 1:
+        return 0
+    return math.ceil(math.log(ms) / math.log(LATENCY_BIN_GROWTH))
+
+
+def bin_upper_bound(bin_index: int) -> float:
+    """Largest latency in seconds counted in a bin"""
+    return LATENCY_BIN_GROWTH ** bin_index / 1000
+
+
+def histogram_percentile(histogram: dict, percentile: float):
+    """Percentile (0-100) of {bin: count}, or None for an empty histogram"""
+    total = sum(histogram.values())
+    if not total:
+        return None
+    rank = percentile / 100 * total
+    seen = 0
+    for bin_index in sorted(histogram):
+        seen += histogram[bin_index]
+        if seen >= rank:
+            return bin_upper_bound(bin_index)
+    return bin_upper_bound(max(histogram))
+
+
+class MetricsStore:
+    """Thread-safe SQLite store of provider runs and their hourly aggregates"""
+
+    def __init__(self, path: Path, retention_days: float = None):
+        self.path = Path(path)
+        self.retention_days = retention_days
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._db() as db:
+            for statement in SCHEMA:
+                db.execute(statement)
+            for table, column, definition, backfill in MIGRATIONS:
+                if column not in [row[1] for row in db.execute(f"PRAGMA table_info({table})")]:
+                    db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+                    if backfill:
+                        db.execute(backfill)
+
+    @contextmanager
+    def _db(self):
+        db = sqlite3.connect(self.path, timeout=5)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def record(self, run: dict):
+        """Append one provider run and fold it into the aggregates
+
+        ``run`` holds provider, model and optionally ts, question, success,
+        blocked, error, gen_time, exec_time, total_time, rows, input_tokens,
+        cached_tokens, generation_cached and result_cache. The raw run keeps
+        every timing; cached generations and result cache hits are left out
+        of the latency aggregates.
+        """
+        ts = run.get("ts") or time.time()
+        bucket = int(ts // BUCKET_SECONDS * BUCKET_SECONDS)
+        key = (bucket, run["provider"], run["model"])
+        failed = not run.get("success") and not run.get("blocked")
+        generation_cached = bool(run.get("generation_cached"))
+        result_cached = run.get("result_cache") in CACHED_RESULT_STATUSES
+        gen_time = None if generation_cached else run.get("gen_time")
+        exec_time = None if result_cached else run.get("exec_time")
+        total_time = None if generation_cached or result_cached else run.get("total_time")
+        latencies = {"gen": gen_time, "exec": exec_time, "total": total_time}
+
+        with self._lock, self._db() as db:
+            db.execute(
+                "INSERT INTO runs (ts, provider, model, question, success, blocked, error, gen_time, "
+                "exec_time, total_time, rows, input_tokens, cached_tokens, generation_cached, result_cache) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    ts, run["provider"], run["model"], run.get("question"),
+                    int(bool(run.get("success"))), int(bool(run.get("blocked"))), run.get("error"),
+                    run.get("gen_time"), run.get("exec_time"), run.get("total_time"), run.get("rows"),
+                    run.get("input_tokens"), run.get("cached_tokens"),
+                    int(generation_cached), run.get("result_cache")
+                )
+            )
+            db.execute(
+                "INSERT INTO hourly_stats (bucket, provider, model, runs, errors, blocked, cached_runs, gen_runs, "
+                "gen_time_sum, exec_runs, exec_time_sum, rows_sum, token_runs, input_tokens_sum, cached_tokens_sum) "
+                "VALUES (?, ?, ?, 1, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (bucket, provider, model) DO UPDATE SET "
+                "runs = runs + 1, errors = errors + excluded.errors, blocked = blocked + excluded.blocked, "
+                "cached_runs = cached_runs + excluded.cached_runs, gen_runs = gen_runs + excluded.gen_runs, "
+                "gen_time_sum = gen_time_sum + excluded.gen_time_sum, "
+                "exec_runs = exec_runs + excluded.exec_runs, "
+                "exec_time_sum = exec_time_sum + excluded.exec_time_sum, "
+                "rows_sum = rows_sum + excluded.rows_sum, "
+                "token_runs = token_runs + excluded.token_runs, "
+                "input_tokens_sum = input_tokens_sum + excluded.input_tokens_sum, "
+                "cached_tokens_sum = cached_tokens_sum + excluded.cached_tokens_sum",
+                key + (
+                    int(failed), int(bool(run.get("blocked"))), int(generation_cached or result_cached),
+                    int(gen_time is not None), gen_time or 0.0,
+                    int(exec_time is not None), exec_time or 0.0, (run.get("rows") or 0) if exec_time is not None else 0,
+                    int(run.get("input_tokens") is not None), run.get("input_tokens") or 0,
+                    run.get("cached_tokens") or 0
+                )
+            )
+            db.executemany(
+                "INSERT INTO latency_bins VALUES (?, ?, ?, ?, ?, 1) "
+                "ON CONFLICT (bucket, provider, model, metric, bin) DO UPDATE SET count = count + 1",
+                [key + (metric, latency_bin(value)) for metric, value in latencies.items() if value is not None]
+            )
+            if self.retention_days:
+                # Raw runs expire; the aggregates are kept
+                db.execute("DELETE FROM runs WHERE ts < ?", (ts - self.retention_days * 86400,))
+
+    def _histograms(self, db, since: float, bucket_seconds: int = None) -> dict:
+        """{(period, provider, model, metric): {bin: count}} since a timestamp"""
+        period = f"bucket / {int(bucket_seconds)} * {int(bucket_seconds)}" if bucket_seconds else "0"
+        rows = db.execute(
+            f"SELECT {period}, provider, model, metric, bin, SUM(count) FROM latency_bins "
+            "WHERE bucket >= ? GROUP BY 1, 2, 3, 4, 5",
+            (self._bucket_floor(since),)
+        ).fetchall()
+        histograms = {}
+        for period_start, provider, model, metric, bin_index, count in rows:
+            histograms.setdefault((period_start, provider, model, metric), {})[bin_index] = count
+        return histograms
+
+    @staticmethod
+    def _bucket_floor(since: float) -> int:
+        return int((since or 0) // BUCKET_SECONDS * BUCKET_SECONDS)
+
+    @staticmethod
+    def _row(period_start, provider, model, runs, errors, blocked, cached_runs, gen_runs, gen_sum, exec_runs,
+             exec_sum, rows_sum, token_runs, tokens_sum, cached_sum, histograms, hours: float) -> dict:
+        row = {
+            "period": period_start,
+            "provider": provider,
+            "model": model,
+            "runs": runs,
+            "errors": errors,
+            "blocked": blocked,
+            "error_rate": errors / runs if runs else 0.0,
+            "cached_runs": cached_runs,
+            "gen_time_avg": gen_sum / gen_runs if gen_runs else None,
+            "exec_time_avg": exec_sum / exec_runs if exec_runs else None,
+            "rows_avg": rows_sum / exec_runs if exec_runs else None,
+            "input_tokens_avg": tokens_sum / token_runs if token_runs else None,
+            "cached_tokens_sum": cached_sum,
+            "runs_per_hour": runs / hours if hours else None,
+        }
+        for metric in LATENCY_METRICS:
+            histogram = histograms.get((period_start, provider, model, metric), {})
+            row[f"{metric}_p50"] = histogram_percentile(histogram, 50)
+            row[f"{metric}_p95"] = histogram_percentile(histogram, 95)
+        return row
+
+    def summary(self, since: float = None) -> list:
+        """One row per provider/model over the aggregates since a timestamp (all time if None)"""
+        with self._db() as db:
+            rows = db.execute(
+                "SELECT 0, provider, model, SUM(runs), SUM(errors), SUM(blocked), SUM(cached_runs), "
+                "SUM(gen_runs), SUM(gen_time_sum), "
+                "SUM(exec_runs), SUM(exec_time_sum), SUM(rows_sum), SUM(token_runs), SUM(input_tokens_sum), "
+                "SUM(cached_tokens_sum), MIN(bucket), MAX(bucket) FROM hourly_stats WHERE bucket >= ? "
+                "GROUP BY provider, model ORDER BY provider, model",
+                (self._bucket_floor(since),)
+            ).fetchall()
+            histograms = self._histograms(db, since)
+        summary = []
+        for row in rows:
+            first, last = row[-2:]
+            hours = (last - first + BUCKET_SECONDS) / 3600
+            summary.append(self._row(*row[:-2], histograms=histograms, hours=hours))
+        return summary
+
+    def timeseries(self, since: float = None, bucket_seconds: int = BUCKET_SECONDS) -> list:
+        """Rows per period (hourly aggregates merged into ``bucket_seconds``) and provider/model"""
+        bucket_seconds = max(BUCKET_SECONDS, int(bucket_seconds))
+        with self._db() as db:
+            rows = db.execute(
+                f"SELECT bucket / {bucket_seconds} * {bucket_seconds}, provider, model, SUM(runs), "
+                "SUM(errors), SUM(blocked), SUM(cached_runs), SUM(gen_runs), SUM(gen_time_sum), "
+                "SUM(exec_runs), SUM(exec_time_sum), "
+                "SUM(rows_sum), SUM(token_runs), SUM(input_tokens_sum), SUM(cached_tokens_sum) FROM hourly_stats "
+                "WHERE bucket >= ? GROUP BY 1, 2, 3 ORDER BY 1, 2, 3",
+                (self._bucket_floor(since),)
+            ).fetchall()
+            histograms = self._histograms(db, since, bucket_seconds)
+        return [self._row(*row, histograms=histograms, hours=bucket_seconds / 3600) for row in rows]
+
+    def recent_runs(self, limit: int = 50) -> list:
+        """Latest raw runs, newest first"""
+        with self._db() as db:
+            db.row_factory = sqlite3.Row
+            rows = db.execute("SELECT * FROM runs ORDER BY ts DESC LIMIT ?", (limit,)).fetchall()
+        return [dict(row) for row in rows]
@@ -0,0 +1,117 @@
+import streamlit as st
+import pandas as pd
+import os
+import time
+from pathlib import Path
+from dotenv import load_dotenv
+from metrics_store import MetricsStore
+from schema_cache import default_cache_dir
+
+
+# Load environment variables
+load_dotenv()
+
+# Same location as the main app
+SCHEMA_CACHE_DIR = default_cache_dir()
+METRICS_DB_PATH = Path(os.getenv("METRICS_DB_PATH", SCHEMA_CACHE_DIR / "metrics.sqlite")).expanduser()
+METRICS_RETENTION_DAYS = float(os.getenv("METRICS_RETENTION_DAYS", "90"))
+
+PROVIDER_LABELS = {"claude": "Claude", "mistral": "Mistral", "ollama": "Ollama"}
+
+WINDOWS = {
+    "Last 24 hours": 1,
+    "Last 7 days": 7,
+    "Last 30 days": 30,
+    "All time": None
+}
+
+st.set_page_config(
+    page_title="Provider Metrics",
+    page_icon="📊",
+    layout="wide"
+)
+
+@st.cache_resource
+def get_metrics_store():
+    """Persistent provider metrics written by the main app"""
+    return MetricsStore(METRICS_DB_PATH, retention_days=METRICS_RETENTION_DAYS)
+
+def seconds(value) -> str:
+    return f"{value:.2f}s" if value is not None else "N/A"
+
+def series_label(row: dict) -> str:
+    return f"{PROVIDER_LABELS.get(row['provider'], row['provider'])} · {row['model']}"
+
+st.title("📊 Provider Metrics")
+st.caption(f"Every provider run recorded by the assistant · `{METRICS_DB_PATH}`")
+
+col1, col2 = st.columns(2)
+with col1:
+    window = st.selectbox("Window", list(WINDOWS), index=1)
+with col2:
+    granularity = st.radio("Granularity", ["Hourly", "Daily"], horizontal=True, index=1)
+
+days = WINDOWS[window]
+since = time.time() - days * 86400 if days else None
+store = get_metrics_store()
+
+summary = store.summary(since=since)
+if not summary:
+    st.info("No runs recorded yet. Ask a question in the main page first.")
+    st.stop()
+
+# Latency percentiles come from the stored histograms (accurate to ~10%) and leave out cached runs
+st.subheader("Per provider and model")
+st.dataframe(
+    pd.DataFrame([
+        {
+            "Provider": PROVIDER_LABELS.get(row["provider"], row["provider"]),
+            "Model": row["model"],
+            "Runs": row["runs"],
+            "Runs / hour": round(row["runs_per_hour"], 2),
+            "Error Rate": f"{row['error_rate']*100:.0f}%",
+            "Blocked": row["blocked"],
+            "Cached": row["cached_runs"],
+            "Gen p50": seconds(row["gen_p50"]),
+            "Gen p95": seconds(row["gen_p95"]),
+            "Exec p50": seconds(row["exec_p50"]),
+            "Exec p95": seconds(row["exec_p95"]),
+            "Total p95": seconds(row["total_p95"]),
+            "Avg Input Tokens": round(row["input_tokens_avg"]) if row["input_tokens_avg"] is not None else None
+        }
+        for row in summary
+    ]),
+    hide_index=True,
+    use_container_width=True
+)
+
+# Over time
+timeseries = pd.DataFrame(
+    store.timeseries(since=since, bucket_seconds=3600 if granularity == "Hourly" else 86400)
+)
+timeseries["period"] = pd.to_datetime(timeseries["period"], unit="s")
+timeseries["series"] = timeseries.apply(series_label, axis=1)
+
+def chart_data(column: str) -> pd.DataFrame:
+    return timeseries.pivot_table(index="period", columns="series", values=column, aggfunc="first")
+
+st.subheader("Generation latency p95 (s)")
+st.line_chart(chart_data("gen_p95"))
+
+col1, col2 = st.columns(2)
+with col1:
+    st.subheader("Throughput (runs / hour)")
+    st.bar_chart(chart_data("runs_per_hour"))
+with col2:
+    st.subheader("Error rate")
+    st.line_chart(chart_data("error_rate"))
+
+st.subheader("Execution latency p95 (s)")
+st.line_chart(chart_data("exec_p95"))
+
+recent = store.recent_runs(limit=50)
+if recent:
+    with st.expander("🧾 Recent runs"):
+        recent = pd.DataFrame(recent)
+        recent["ts"] = pd.to_datetime(recent["ts"], unit="s")
+        st.dataframe(recent.drop(columns=["id"]), hide_index=True, use_container_width=True)
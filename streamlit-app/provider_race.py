@@ -0,0 +1,144 @@
+"""
+Race several providers and keep the first valid answer
+
+Every provider pipeline runs on its own thread with a CancelToken. The first
+outcome that passes validation wins, unless the preferred provider is still
+running: it then gets a short grace period to finish and take the win. Once
+the race is decided, or a provider exceeds its timeout, the remaining tokens
+are cancelled. Their callbacks cancel running Trino queries, and token
+streams check the token between chunks and close the LLM connection.
+"""
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class Cancelled(Exception):
+    """Raised inside a pipeline whose token was cancelled"""
+
+
+class CancelToken:
+    """Thread-safe cancellation flag with callbacks for in-flight work"""
+
+    def __init__(self):
+        self.reason = None
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = "cancelled"):
+        """Set the flag and run the registered callbacks (once)"""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                # Best effort: the work being cancelled may already have finished
+                pass
+
+    def on_cancel(self, callback):
+        """Run callback on cancellation (immediately if already cancelled); returns an unregister function"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._unregister(callback)
+        callback()
+        return lambda: None
+
+    def _unregister(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise Cancelled(f"Cancelled: {self.reason}")
+
+
+def race(run_fn, providers: list, is_valid, timeouts: dict = None,
+         preferred: str = None, grace: float = 0.0) -> dict:
+    """Run ``run_fn(provider, token)`` for every provider and pick the first valid outcome
+
+    Returns a dict with the winner (None if nothing was valid), the outcomes of
+    the providers that finished, each provider's status ('won', 'outranked',
+    'failed', 'timeout' or 'cancelled') and the seconds after the start at
+    which each finished or was given up on. Abandoned threads are not joined:
+    they exit at their next cancellation check.
+    """
+    timeouts = timeouts or {}
+    tokens = {provider: CancelToken() for provider in providers}
+    result = {"winner": None, "outcomes": {}, "status": {}, "finished": {}}
+
+    start = time.monotonic()
+    executor = ThreadPoolExecutor(max_workers=len(providers))
+    futures = {executor.submit(run_fn, provider, tokens[provider]): provider for provider in providers}
+    pending = set(futures)
+    grace_deadline = None
+
+    def elapsed():
+        return time.monotonic() - start
+
+    try:
+        while pending:
+            deadlines = [
+                start + timeouts[futures[future]] for future in pending
+                if timeouts.get(futures[future])
+            ]
+            if grace_deadline is not None:
+                deadlines.append(grace_deadline)
+            wait_time = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+            done, pending = wait(pending, timeout=wait_time, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                provider = futures[future]
+                outcome = future.result()
+                result["outcomes"][provider] = outcome
+                result["finished"][provider] = elapsed()
+                if not is_valid(outcome):
+                    result["status"][provider] = "failed"
+                elif result["winner"] is None or provider == preferred:
+                    if result["winner"] is not None:
+                        result["status"][result["winner"]] = "outranked"
+                    result["winner"] = provider
+                    result["status"][provider] = "won"
+                else:
+                    result["status"][provider] = "outranked"
+
+            winner = result["winner"]
+            preferred_running = any(futures[future] == preferred for future in pending)
+            if winner is not None:
+                if winner == preferred or not preferred_running:
+                    break
+                # Bias: give the preferred provider a little longer to take the win
+                if grace_deadline is None:
+                    grace_deadline = time.monotonic() + grace
+                if time.monotonic() >= grace_deadline:
+                    break
+
+            for future in list(pending):
+                provider = futures[future]
+                timeout = timeouts.get(provider)
+                if timeout and elapsed() >= timeout:
+                    tokens[provider].cancel(f"timed out after {timeout:.0f}s")
+                    result["status"][provider] = "timeout"
+                    result["finished"][provider] = elapsed()
+                    pending.discard(future)
+    finally:
+        for future in pending:
+            provider = futures[future]
+            tokens[provider].cancel("another provider answered first")
+            result["status"][provider] = "cancelled"
+            result["finished"][provider] = elapsed()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    result["wall_time"] = elapsed()
+    return result
@@ -0,0 +1,97 @@
+"""
+Per-query latency breakdown
+
+Combines the statistics Trino reports for a query (queueing, elapsed and CPU
+time, processed data, peak memory) with client-side spans around connection
+checkout, submission, fetching and DataFrame construction, so a slow answer
+can be attributed to the LLM, Trino or the app.
+"""
+import time
+from contextlib import contextmanager
+
+# Trino statement stats copied into the breakdown (milliseconds become seconds)
+TRINO_TIMES = {
+    "queued": "queuedTimeMillis",
+    "elapsed": "elapsedTimeMillis",
+    "cpu": "cpuTimeMillis",
+    "wall": "wallTimeMillis",
+}
+TRINO_COUNTERS = {
+    "processed_rows": "processedRows",
+    "processed_bytes": "processedBytes",
+    "physical_input_bytes": "physicalInputBytes",
+    "peak_memory_bytes": "peakMemoryBytes",
+    "spilled_bytes": "spilledBytes",
+    "nodes": "nodes",
+    "splits": "totalSplits",
+}
+
+
+class QueryTiming:
+    """Client spans and Trino stats for one query execution"""
+
+    def __init__(self):
+        self.spans = {}
+        self.query_id = None
+        self.info_uri = None
+        self.state = None
+        self.trino = {}
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def span(self, name: str):
+        """Time a client-side step; repeated spans with the same name add up"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.spans[name] = self.spans.get(name, 0.0) + time.perf_counter() - start
+
+    def capture(self, cursor):
+        """Take the query id and the latest statement stats from a Trino cursor"""
+        self.query_id = getattr(cursor, "query_id", None)
+        self.info_uri = getattr(cursor, "info_uri", None)
+        stats = getattr(cursor, "stats", None) or {}
+        self.state = stats.get("state")
+        for key, field in TRINO_TIMES.items():
+            if stats.get(field) is not None:
+                self.trino[key] = stats[field] / 1000
+        for key, field in TRINO_COUNTERS.items():
+            if stats.get(field) is not None:
+                self.trino[key] = stats[field]
+
+    def as_dict(self) -> dict:
+        """JSON-serializable breakdown (stored in df.attrs and the query history)"""
+        return {
+            "query_id": self.query_id,
+            "info_uri": self.info_uri,
+            "state": self.state,
+            "client": dict(self.spans, total=time.perf_counter() - self._start),
+            "trino": dict(self.trino),
+        }
+
+
+def latency_stages(timing: dict, gen_time: float = None) -> list:
+    """[(stage, seconds)] from LLM generation to DataFrame, for one answer
+
+    Trino's elapsed time minus its queued time is planning plus execution;
+    whatever the client waited beyond Trino's elapsed time is transfer and
+    client overhead.
+    """
+    client = timing.get("client", {})
+    trino = timing.get("trino", {})
+    stages = []
+    if gen_time is not None:
+        stages.append(("LLM generation", gen_time))
+    stages.append(("Connection checkout", client.get("checkout", 0.0)))
+
+    waited = client.get("submit", 0.0) + client.get("fetch", 0.0)
+    if "elapsed" in trino:
+        queued = trino.get("queued", 0.0)
+        stages.append(("Trino queued", queued))
+        stages.append(("Trino planning + execution", max(0.0, trino["elapsed"] - queued)))
+        stages.append(("Transfer + client wait", max(0.0, waited - trino["elapsed"])))
+    else:
+        stages.append(("Trino (submit + fetch)", waited))
+    stages.append(("DataFrame build", client.get("build", 0.0)))
+    return stages
@@ -0,0 +1,146 @@
+"""
+Query result cache keyed by canonical SQL, with in-flight deduplication
+
+Providers often produce SQL that differs only in whitespace, keyword case or
+a trailing semicolon. Results are cached under a canonical form of the SQL,
+bounded by a TTL and a total memory budget, and identical queries that are
+already running are merged so Trino executes them only once.
+"""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import sqlparse
+from sqlparse import tokens as T
+
+
+def canonicalize_sql(sql: str) -> str:
+    """Whitespace-, comment- and case-insensitive form of a SQL statement
+
+    Keywords are upper-cased and unquoted identifiers lower-cased (Trino
+    treats them case-insensitively); string literals and quoted identifiers
+    are kept verbatim.
+    """
+    parts = []
+    for statement in sqlparse.parse(sql):
+        for token in statement.flatten():
+            if token.is_whitespace or token.ttype in T.Comment:
+                continue
+            if token.ttype in T.Keyword:
+                parts.append(token.value.upper())
+            elif token.ttype in T.Name:
+                parts.append(token.value.lower())
+            else:
+                parts.append(token.value)
+    while parts and parts[-1] == ';':
+        parts.pop()
+    return " ".join(parts)
+
+
+class ResultCache:
+    """TTL + memory-bounded LRU of query results that merges identical in-flight queries"""
+
+    def __init__(self, ttl: float = 300.0, max_bytes: int = 256 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (created_at, result, nbytes)
+        self._in_flight = {}  # key -> Future
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "shared": 0, "misses": 0, "evictions": 0}
+
+    @staticmethod
+    def _result_size(result) -> int:
+        df = result[0]
+        if df is None:
+            return 0
+        return int(df.memory_usage(deep=True).sum())
+
+    def _store(self, key: str, result):
+        """Insert a result, evicting least recently used entries over the budget (lock held)"""
+        nbytes = self._result_size(result)
+        if nbytes > self.max_bytes:
+            return
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key)[2]
+        self._entries[key] = (time.time(), result, nbytes)
+        self._bytes += nbytes
+        while self._bytes > self.max_bytes and self._entries:
+            _, (_, _, evicted_bytes) = self._entries.popitem(last=False)
+            self._bytes -= evicted_bytes
+            self._stats["evictions"] += 1
+
+    def get_or_execute(self, sql: str, execute_fn, cancel=None) -> tuple:
+        """Return (result, status) where status is 'hit', 'shared' or 'miss'
+
+        ``execute_fn(sql)`` must return (df, elapsed_time, error); only
+        results without an error are cached, but callers waiting on an
+        in-flight query share whatever it returned. ``cancel`` is the token
+        execute_fn runs under: when the query failed because the caller that
+        started it was cancelled, waiters with another token run it again
+        instead of sharing that error.
+        """
+        key = canonicalize_sql(sql)
+
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry and time.time() - entry[0] <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return entry[1], "hit"
+                if entry:
+                    self._bytes -= self._entries.pop(key)[2]
+
+                in_flight = self._in_flight.get(key)
+                if in_flight is None:
+                    future = Future()
+                    self._in_flight[key] = (future, cancel)
+                    self._stats["misses"] += 1
+                    break
+                self._stats["shared"] += 1
+
+            future, owner_cancel = in_flight
+            result = future.result()
+            if (result[2] is not None and owner_cancel is not None
+                    and owner_cancel is not cancel and owner_cancel.cancelled):
+                # Cancelled for the caller that started it, not for this one: run it again
+                continue
+            return result, "shared"
+
+        try:
+            result = execute_fn(sql)
+        except BaseException as e:
+            with self._lock:
+                del self._in_flight[key]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            del self._in_flight[key]
+            if result[2] is None:
+                self._store(key, result)
+        future.set_result(result)
+        return result, "miss"
+
+    def contains(self, sql: str) -> bool:
+        """True if a fresh result for sql is cached or the query is already running"""
+        key = canonicalize_sql(sql)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and time.time() - entry[0] <= self.ttl:
+                return True
+            return key in self._in_flight
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["bytes"] = self._bytes
+        return stats
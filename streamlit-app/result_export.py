@@ -0,0 +1,273 @@
+"""
+CSV and Parquet export of full query results
+
+Rows are written chunk by chunk from a Trino cursor (or from an already
+fetched DataFrame) to a spool file, so an export never builds a DataFrame of
+the whole result. The file stays in a BytesIO while small and moves to a
+temporary file on disk once it passes SPOOL_MAX_BYTES. Parquet gets one row group per
+chunk, with column types taken from the Trino types in cursor.description.
+"""
+import csv
+import io
+import os
+import tempfile
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from result_frame import parse_trino_type
+
+# Exported files larger than this are written to a temporary file on disk
+SPOOL_MAX_BYTES = 16 * 1024 * 1024
+
+EXPORT_FORMATS = {
+    "csv": {"label": "CSV", "mime": "text/csv", "extension": "csv"},
+    "parquet": {"label": "Parquet", "mime": "application/vnd.apache.parquet", "extension": "parquet"},
+}
+
+ARROW_INTEGER_TYPES = {"tinyint": pa.int8(), "smallint": pa.int16(), "integer": pa.int32(), "bigint": pa.int64()}
+
+
+class ExportTooLarge(Exception):
+    """The exported file exceeded its size limit"""
+
+
+def arrow_type(type_name):
+    """Arrow type for a Trino column type; None for types exported as text (arrays, maps, rows, uuid...)"""
+    base, arguments = parse_trino_type(type_name)
+    if base in ARROW_INTEGER_TYPES:
+        return ARROW_INTEGER_TYPES[base]
+    if base == "real":
+        return pa.float32()
+    if base == "double":
+        return pa.float64()
+    if base == "decimal":
+        precision, scale = (arguments + [38, 0][len(arguments):])[:2]
+        return pa.decimal128(precision, scale)
+    if base == "boolean":
+        return pa.bool_()
+    if base in ("varchar", "char", "json"):
+        return pa.string()
+    if base == "varbinary":
+        return pa.binary()
+    if base == "date":
+        return pa.date32()
+    if base == "timestamp":
+        return pa.timestamp("us", tz="UTC" if "with time zone" in str(type_name).lower() else None)
+    if base == "time" and "with time zone" not in str(type_name).lower():
+        return pa.time64("us")
+    return None
+
+
+def _column_array(values: tuple, field: pa.Field) -> pa.Array:
+    if field.metadata and b"trino_type" in field.metadata:
+        values = [None if value is None else str(value) for value in values]
+    return pa.array(values, type=field.type)
+
+
+def _frame_array(series, field: pa.Field) -> pa.Array:
+    """Arrow array of a frame column in the type of its Trino column (dates were datetime64, categories strings)"""
+    if field.metadata and b"trino_type" in field.metadata:
+        return pa.array([None if value is None else str(value) for value in series], type=field.type)
+    return pa.array(series, from_pandas=True).cast(field.type)
+
+
+class _SpoolFile(io.BufferedIOBase):
+    """Binary file kept in a BytesIO up to max_size bytes, then in a temporary file on disk
+
+    Unlike tempfile.SpooledTemporaryFile, the underlying file can be handed
+    out as a type st.download_button accepts (see release()).
+    """
+
+    def __init__(self, max_size: int = SPOOL_MAX_BYTES):
+        super().__init__()
+        self.max_size = max_size
+        self._file = io.BytesIO()
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def write(self, data) -> int:
+        if isinstance(self._file, io.BytesIO) and self._file.tell() + memoryview(data).nbytes > self.max_size:
+            position = self._file.tell()
+            rolled = tempfile.TemporaryFile()
+            rolled.write(self._file.getvalue())
+            rolled.seek(position)
+            self._file = rolled
+        return self._file.write(data)
+
+    def read(self, size: int = -1) -> bytes:
+        return self._file.read(size)
+
+    def tell(self) -> int:
+        return self._file.tell()
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        return self._file.seek(offset, whence)
+
+    def flush(self):
+        if not self.closed:
+            self._file.flush()
+
+    def close(self):
+        if not self.closed:
+            super().close()
+            self._file.close()
+
+    def release(self):
+        """The contents rewound as a BytesIO or a BufferedReader; closes this spool file
+
+        Returning the file itself instead of its bytes avoids holding a second
+        copy of the export.
+        """
+        file, self._file = self._file, io.BytesIO()
+        self.close()
+        if isinstance(file, io.BytesIO):
+            file.seek(0)
+            return file
+        # A TemporaryFile is a BufferedRandom; read it through a BufferedReader on a
+        # duplicate descriptor, which keeps the (already unlinked) file alive
+        reader = open(os.dup(file.fileno()), "rb")
+        file.close()
+        reader.seek(0)
+        return reader
+
+
+class _ExportWriter:
+    """Appends chunks to a spool file and enforces the size limit"""
+
+    def __init__(self, fmt: str, columns: list, max_bytes: int = None):
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format: {fmt}")
+        self.fmt = fmt
+        self.columns = columns
+        self.max_bytes = max_bytes
+        self.rows = 0
+        self.file = _SpoolFile()
+        self._text = None
+        self._csv = None
+        self._parquet = None
+        if fmt == "csv":
+            self._text = io.TextIOWrapper(self.file, encoding="utf-8", newline="")
+            self._csv = csv.writer(self._text, lineterminator="\n")
+            self._csv.writerow(columns)
+
+    def _check_size(self):
+        if self._text is not None:
+            self._text.flush()
+        if self.max_bytes and self.file.tell() > self.max_bytes:
+            raise ExportTooLarge(
+                f"Export exceeds {self.max_bytes / 1024 / 1024:.0f} MB after {self.rows:,} rows; "
+                f"add filters or aggregate the query"
+            )
+
+    def add_rows(self, rows: list, schema: pa.Schema = None):
+        """Write a chunk of cursor rows (tuples)"""
+        if self.fmt == "csv":
+            self._csv.writerows(rows)
+        else:
+            arrays = [_column_array(values, field) for values, field in zip(zip(*rows), schema)]
+            self._write_table(pa.Table.from_arrays(arrays, schema=schema))
+        self.rows += len(rows)
+        self._check_size()
+
+    def add_frame(self, df, schema: pa.Schema = None):
+        """Write a slice of a DataFrame"""
+        if self.fmt == "csv":
+            df.to_csv(self._text, header=False, index=False)
+        else:
+            arrays = [_frame_array(df.iloc[:, i], field) for i, field in enumerate(schema)]
+            self._write_table(pa.Table.from_arrays(arrays, schema=schema))
+        self.rows += len(df)
+        self._check_size()
+
+    def _write_table(self, table: pa.Table):
+        if self._parquet is None:
+            self._parquet = pq.ParquetWriter(self.file, table.schema, compression="snappy")
+        self._parquet.write_table(table)
+
+    def finish(self, schema: pa.Schema = None):
+        """Flush and rewind the file; returns it"""
+        if self._text is not None:
+            self._text.flush()
+            # Keep the binary file open when the text wrapper goes away
+            self._text.detach()
+            self._text = None
+        if self.fmt == "parquet":
+            if self._parquet is None:
+                # Empty result: still a valid file with the column schema
+                self._write_table(schema.empty_table())
+            self._parquet.close()
+        self._check_size()
+        self.file.seek(0)
+        return self.file
+
+    def close(self):
+        self.file.close()
+
+
+def readable_file(file):
+    """The finished export as a file object st.download_button accepts (BytesIO or BufferedReader)
+
+    Takes ownership of ``file``.
+    """
+    return file.release()
+
+
+def cursor_schema(description) -> pa.Schema:
+    """Arrow schema for the columns of an executed cursor; text-exported columns are marked in the field metadata"""
+    fields = []
+    for desc in description or []:
+        type_ = arrow_type(desc[1])
+        if type_ is None:
+            fields.append(pa.field(desc[0], pa.string(), metadata={"trino_type": str(desc[1])}))
+        else:
+            fields.append(pa.field(desc[0], type_))
+    return pa.schema(fields)
+
+
+def export_cursor(cursor, fmt: str, chunk_rows: int = 50000, max_bytes: int = None):
+    """Stream the rows of an executed cursor into a spool file; returns (file, rows)
+
+    Raises ExportTooLarge once the file passes max_bytes (the caller should
+    cancel the query).
+    """
+    columns = [desc[0] for desc in cursor.description or []]
+    schema = cursor_schema(cursor.description) if fmt == "parquet" else None
+    writer = _ExportWriter(fmt, columns, max_bytes=max_bytes)
+    try:
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows:
+                break
+            writer.add_rows(rows, schema)
+        return writer.finish(schema), writer.rows
+    except BaseException:
+        writer.close()
+        raise
+
+
+def export_frame(df, fmt: str, chunk_rows: int = 50000, max_bytes: int = None):
+    """Write an already fetched result (see result_frame.FrameBuilder) in slices; returns (file, rows)"""
+    schema = None
+    if fmt == "parquet":
+        types = df.attrs.get("trino_types", {})
+        schema = cursor_schema([(column, types.get(column)) for column in df.columns])
+        for i, field in enumerate(schema):
+            # Decimals that fit a float64 were converted on fetch
+            if pa.types.is_decimal(field.type) and df.dtypes.iloc[i].kind == "f":
+                schema = schema.set(i, pa.field(field.name, pa.float64()))
+    writer = _ExportWriter(fmt, list(df.columns), max_bytes=max_bytes)
+    try:
+        for start in range(0, len(df), chunk_rows):
+            writer.add_frame(df.iloc[start:start + chunk_rows], schema)
+        return writer.finish(schema), writer.rows
+    except BaseException:
+        writer.close()
+        raise
@@ -0,0 +1,139 @@
+"""
+Typed, memory-compact DataFrames from Trino result sets
+
+Fetched chunks are converted column by column using the Trino types in
+cursor.description instead of building object columns from row tuples.
+The finished frame is compacted: integers are downcast to the narrowest
+width that holds their range and low-cardinality strings become
+categoricals. Floating point columns keep their precision.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+INTEGER_TYPES = {"tinyint", "smallint", "integer", "bigint"}
+FLOAT_DTYPES = {"real": "float32", "double": "float64"}
+STRING_TYPES = {"varchar", "char"}
+DATETIME_TYPES = {"date", "timestamp"}
+
+# Decimals with more digits than a float64 holds exactly stay Decimal objects
+MAX_FLOAT_DECIMAL_PRECISION = 15
+
+# Strings become categoricals when at most this share of values is distinct
+CATEGORY_MAX_UNIQUE_RATIO = 0.5
+CATEGORY_MIN_ROWS = 20
+
+
+def parse_trino_type(type_name) -> tuple:
+    """('decimal', [10, 2]) for 'decimal(10,2)'; nested types keep their outer name"""
+    type_name = str(type_name or "").strip().lower()
+    match = re.match(r"([a-z ]+?)\s*(?:\(([\d,\s]*)\))?(?:\s|$|\()", type_name + " ")
+    if not match:
+        return type_name, []
+    arguments = [int(a) for a in (match.group(2) or "").split(",") if a.strip()]
+    return match.group(1).strip(), arguments
+
+
+def _kind(type_name) -> str:
+    base, arguments = parse_trino_type(type_name)
+    if base in INTEGER_TYPES:
+        return "integer"
+    if base in FLOAT_DTYPES:
+        return base
+    if base == "decimal":
+        precision = arguments[0] if arguments else 38
+        return "decimal" if precision <= MAX_FLOAT_DECIMAL_PRECISION else "object"
+    if base == "boolean":
+        return "boolean"
+    if base in DATETIME_TYPES:
+        return "datetime"
+    if base in STRING_TYPES:
+        return "string"
+    return "object"
+
+
+def _convert(kind: str, values: tuple):
+    """Typed array for one column of a chunk"""
+    if kind == "integer":
+        if None in values:
+            return pd.array(values, dtype="Int64")
+        return np.array(values, dtype=np.int64)
+    if kind in FLOAT_DTYPES:
+        return np.array(values, dtype=FLOAT_DTYPES[kind])
+    if kind == "decimal":
+        return np.array(values, dtype=np.float64)
+    if kind == "boolean":
+        if None in values:
+            return pd.array(values, dtype="boolean")
+        return np.array(values, dtype=bool)
+    if kind == "datetime":
+        try:
+            return pd.to_datetime(list(values))
+        except (ValueError, TypeError, OverflowError):
+            # Out of range or mixed time zones
+            pass
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+
+def _array_bytes(array) -> int:
+    if isinstance(array, np.ndarray) and array.dtype != object:
+        return array.nbytes
+    return int(pd.Series(array, copy=False).memory_usage(index=False, deep=True))
+
+
+def _compact(series: pd.Series, kind: str) -> pd.Series:
+    if kind == "integer" and len(series):
+        return pd.to_numeric(series, downcast="integer")
+    if kind == "string" and len(series) >= CATEGORY_MIN_ROWS:
+        if series.nunique(dropna=True) <= len(series) * CATEGORY_MAX_UNIQUE_RATIO:
+            return series.astype("category")
+    return series
+
+
+class FrameBuilder:
+    """Accumulates fetched rows as typed column chunks
+
+    ``nbytes`` tracks the converted size so far, so callers can stop fetching
+    at a memory ceiling before the frame is assembled.
+    """
+
+    def __init__(self, description):
+        description = description or []
+        self.columns = [desc[0] for desc in description]
+        self.types = [desc[1] for desc in description]
+        self._kinds = [_kind(type_name) for type_name in self.types]
+        self._chunks = [[] for _ in self.columns]
+        self.rows = 0
+        self.nbytes = 0
+
+    def add(self, rows: list) -> int:
+        """Convert a chunk of rows; returns its size in bytes"""
+        if not rows:
+            return 0
+        size = 0
+        for i, values in enumerate(zip(*rows)):
+            array = _convert(self._kinds[i], values)
+            self._chunks[i].append(array)
+            size += _array_bytes(array)
+        self.rows += len(rows)
+        self.nbytes += size
+        return size
+
+    def build(self) -> pd.DataFrame:
+        """Assemble and compact the frame; its deep memory size is in df.attrs["memory_bytes"]"""
+        series = []
+        for kind, chunks in zip(self._kinds, self._chunks):
+            chunks = chunks or [_convert(kind, ())]
+            column = pd.Series(chunks[0], copy=False) if len(chunks) == 1 else pd.concat(
+                [pd.Series(chunk, copy=False) for chunk in chunks], ignore_index=True
+            )
+            series.append(_compact(column, kind))
+        # Positional keys keep duplicate column names (e.g. two joined "id" columns)
+        df = pd.DataFrame(dict(enumerate(series)), index=pd.RangeIndex(self.rows))
+        df.columns = self.columns
+        df.attrs["trino_types"] = dict(zip(self.columns, self.types))
+        df.attrs["memory_bytes"] = int(df.memory_usage(deep=True).sum())
+        return df
@@ -0,0 +1,153 @@
+"""
+Persistent schema cache shared by the Streamlit app and the MCP server
+
+The cache is a JSON file on disk holding the {schema: {table: [columns]}}
+structure and a content fingerprint. Within the TTL it is served straight
+from disk; after that, the whole catalog is re-read with the bulk
+information_schema query (see schema_loader) and compared with the cached
+copy, so the fingerprint only changes when a table was added, removed or
+altered.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from schema_loader import load_schema_context
+
+CACHE_DIR_FALLBACK = Path.home() / ".cache" / "modern-data-stack"
+
+CACHE_FORMAT_VERSION = 1
+
+
+def default_cache_dir() -> Path:
+    """SCHEMA_CACHE_DIR, read when called so a .env loaded after import is honoured"""
+    return Path(os.getenv("SCHEMA_CACHE_DIR", CACHE_DIR_FALLBACK)).expanduser()
+
+
+def default_ttl() -> float:
+    return float(os.getenv("SCHEMA_CACHE_TTL", "900"))
+
+
+def schema_fingerprint(schema_context: dict) -> str:
+    """Stable content hash of a schema context (independent of dict ordering)"""
+    canonical = json.dumps(schema_context or {}, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+
+def latest_snapshot_id(cursor, schema: str, table: str):
+    """Latest Iceberg snapshot id for a table (None if it has no snapshot yet)"""
+    cursor.execute(
+        f'SELECT snapshot_id FROM "{schema}"."{table}$snapshots" '
+        f'ORDER BY committed_at DESC LIMIT 1'
+    )
+    row = cursor.fetchone()
+    return str(row[0]) if row else None
+
+
+class SchemaCache:
+    """On-disk, TTL-bound schema cache"""
+
+    def __init__(self, catalog: str, source: str, cache_dir: Path = None,
+                 ttl: float = None, max_workers: int = 4):
+        self.catalog = catalog
+        self.source = source
+        self.ttl = default_ttl() if ttl is None else ttl
+        self.max_workers = max_workers
+        self.path = Path(cache_dir or default_cache_dir()) / f"schema_{catalog}.json"
+        self._lock = threading.Lock()
+        self.last_refresh = {}
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if (data.get("format") != CACHE_FORMAT_VERSION
+                or data.get("catalog") != self.catalog
+                or data.get("source") != self.source):
+            return None
+        # Reject files whose content no longer matches the stored fingerprint
+        if schema_fingerprint(data.get("schemas")) != data.get("fingerprint"):
+            return None
+        return data
+
+    def _write(self, schemas: dict) -> dict:
+        data = {
+            "format": CACHE_FORMAT_VERSION,
+            "catalog": self.catalog,
+            "source": self.source,
+            "loaded_at": time.time(),
+            "fingerprint": schema_fingerprint(schemas),
+            "schemas": schemas,
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Atomic replace so concurrent readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=self.path.parent, prefix=".schema_", suffix=".json")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return data
+
+    def _full_load(self, pool) -> tuple:
+        schemas, skipped, warnings = load_schema_context(pool, self.catalog, max_workers=self.max_workers)
+        data = self._write(schemas)
+        self.last_refresh = {"mode": "full", "reloaded_tables": sum(len(tables) for tables in schemas.values())}
+        return data, skipped, warnings
+
+    def _refresh(self, pool, cached: dict) -> tuple:
+        """Re-read the catalog and report which tables differ from the cached copy"""
+        schemas, skipped, warnings = load_schema_context(pool, self.catalog, max_workers=self.max_workers)
+        old = cached["schemas"]
+        changed = sum(
+            1 for schema, tables in schemas.items() for table, columns in tables.items()
+            if old.get(schema, {}).get(table) != columns
+        )
+        removed = sum(
+            1 for schema, tables in old.items() for table in tables
+            if table not in schemas.get(schema, {})
+        )
+        data = self._write(schemas)
+        self.last_refresh = {"mode": "refresh", "reloaded_tables": changed, "removed_tables": removed}
+        return data, skipped, warnings
+
+    def get(self, pool, force_refresh: bool = False) -> tuple:
+        """Return (schema_context, fingerprint, skipped_schemas, warnings)
+
+        Served from disk while younger than the TTL. Otherwise (or when
+        ``force_refresh`` is set) the catalog is re-read; last_refresh
+        reports how many tables changed since the cached copy.
+        """
+        with self._lock:
+            cached = self._read()
+            if cached and not force_refresh and time.time() - cached["loaded_at"] < self.ttl:
+                self.last_refresh = {"mode": "disk"}
+                return cached["schemas"], cached["fingerprint"], [], []
+
+            if cached:
+                data, skipped, warnings = self._refresh(pool, cached)
+            else:
+                data, skipped, warnings = self._full_load(pool)
+            return data["schemas"], data["fingerprint"], skipped, warnings
+
+    def age(self):
+        """Seconds since the cache file was last refreshed, or None if absent"""
+        cached = self._read()
+        return time.time() - cached["loaded_at"] if cached else None
+
+    def invalidate(self):
+        """Delete the cache file so the next get() performs a full load"""
+        with self._lock:
+            try:
+                self.path.unlink()
+            except FileNotFoundError:
+                pass
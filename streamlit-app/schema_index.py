@@ -0,0 +1,325 @@
+"""
+Relevance-ranked schema pruning for LLM prompts
+
+Builds a small BM25 index over schema, table and column names (plus dbt model
+descriptions when a manifest is available) and uses it to describe only the
+tables a question is likely to need, within a token budget.
+"""
+import json
+import math
+import re
+import threading
+from collections import Counter, OrderedDict
+from pathlib import Path
+
+PROMPT_HEADER = "Available schemas and tables in the Trino lakehouse:\n\n"
+
+# Weight of each field when building a table's term frequencies
+TABLE_NAME_WEIGHT = 3
+SCHEMA_NAME_WEIGHT = 1
+COLUMN_NAME_WEIGHT = 1
+DESCRIPTION_WEIGHT = 1
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "each", "for", "from", "give",
+    "how", "in", "is", "it", "list", "me", "many", "much", "of", "on", "or", "per",
+    "show", "table", "tables", "the", "to", "top", "was", "were", "what", "which",
+    "who", "with", "all", "get", "find", "rows", "row",
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token for English and SQL)"""
+    return math.ceil(len(text) / 4)
+
+
+def _stem(word: str) -> str:
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def tokenize(text: str) -> list:
+    """Lower-cased, singularized terms; snake_case and camelCase are split"""
+    text = re.sub(r"([a-z])([A-Z])", r"\1 \2", text or "")
+    words = re.findall(r"[a-z0-9]+", text.lower())
+    return [_stem(w) for w in words if w not in STOPWORDS and not w.isdigit()]
+
+
+def load_dbt_descriptions(manifest_path) -> dict:
+    """Return {table_name: {"description": str, "columns": {column: str}}} from a dbt manifest
+
+    Missing or unreadable manifests yield an empty dict.
+    """
+    try:
+        with open(Path(manifest_path).expanduser()) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError, TypeError):
+        return {}
+
+    descriptions = {}
+    nodes = list(manifest.get("nodes", {}).values()) + list(manifest.get("sources", {}).values())
+    for node in nodes:
+        if node.get("resource_type") not in ("model", "seed", "snapshot", "source"):
+            continue
+        name = node.get("alias") or node.get("identifier") or node.get("name")
+        if not name:
+            continue
+        columns = {
+            column: info.get("description", "")
+            for column, info in (node.get("columns") or {}).items()
+            if info.get("description")
+        }
+        if node.get("description") or columns:
+            descriptions[name.lower()] = {"description": node.get("description", ""), "columns": columns}
+    return descriptions
+
+
+def _format_table(table: str, columns: list, description: str = "", omitted: int = 0) -> str:
+    text = f"  Table: {table}"
+    if description:
+        text += f" -- {description.splitlines()[0][:200]}"
+    text += "\n"
+    for col in columns:
+        text += f"    - {col['name']} ({col['type']})\n"
+    if omitted:
+        text += f"    ... and {omitted} more columns\n"
+    return text
+
+
+def format_schema(blocks: list) -> str:
+    """Join [(schema, table, table_text)] sorted by schema and table, so equal selections are byte-identical"""
+    parts = [PROMPT_HEADER]
+    current_schema = None
+    for schema, _, text in sorted(blocks, key=lambda b: (b[0], b[1])):
+        if schema != current_schema:
+            if current_schema is not None:
+                parts.append("\n")
+            parts.append(f"Schema: {schema}\n")
+            current_schema = schema
+        parts.append(text)
+    parts.append("\n")
+    return "".join(parts)
+
+
+class SchemaIndex:
+    """BM25 index over the tables of a schema context
+
+    Build one per schema fingerprint: table descriptions are rendered once
+    here and prompts are assembled from those precompiled blocks.
+    """
+
+    def __init__(self, schema_context: dict, descriptions: dict = None, memo_size: int = 256):
+        descriptions = descriptions or {}
+        self.tables = []  # (schema, table, columns, description, column_descriptions)
+        for schema in sorted(schema_context or {}):
+            for table in sorted(schema_context[schema]):
+                info = descriptions.get(table.lower(), {})
+                self.tables.append((
+                    schema,
+                    table,
+                    schema_context[schema][table],
+                    info.get("description", ""),
+                    info.get("columns", {})
+                ))
+
+        self._term_freqs = [self._table_terms(*entry) for entry in self.tables]
+        self._lengths = [sum(tf.values()) for tf in self._term_freqs]
+        self._avg_length = (sum(self._lengths) / len(self._lengths)) if self._lengths else 0.0
+        document_freq = Counter()
+        for tf in self._term_freqs:
+            document_freq.update(tf.keys())
+        n = len(self.tables)
+        self._idf = {
+            term: math.log(1 + (n - df + 0.5) / (df + 0.5))
+            for term, df in document_freq.items()
+        }
+
+        self._blocks = [
+            _format_table(table, columns, description)
+            for _, table, columns, description, _ in self.tables
+        ]
+        self.full_prompt = format_schema([
+            (entry[0], entry[1], block) for entry, block in zip(self.tables, self._blocks)
+        ])
+        self.full_tokens = estimate_tokens(self.full_prompt)
+
+        # prune() results by (question terms, budget, top_k, excluded tables)
+        self._memo = OrderedDict()
+        self._memo_size = memo_size
+        self._memo_lock = threading.Lock()
+        # core_prompt() results by (budget, preferred schema)
+        self._core_prompts = {}
+
+    @staticmethod
+    def _table_terms(schema, table, columns, description, column_descriptions) -> Counter:
+        tf = Counter()
+        for term in tokenize(table):
+            tf[term] += TABLE_NAME_WEIGHT
+        for term in tokenize(schema):
+            tf[term] += SCHEMA_NAME_WEIGHT
+        for col in columns:
+            for term in tokenize(col["name"]):
+                tf[term] += COLUMN_NAME_WEIGHT
+        for text in [description] + list(column_descriptions.values()):
+            for term in tokenize(text):
+                tf[term] += DESCRIPTION_WEIGHT
+        return tf
+
+    def score(self, question: str) -> list:
+        """BM25 score of every table for the question, in index order"""
+        terms = set(tokenize(question))
+        scores = []
+        for tf, length in zip(self._term_freqs, self._lengths):
+            total = 0.0
+            for term in terms:
+                freq = tf.get(term)
+                if not freq:
+                    continue
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * length / (self._avg_length or 1))
+                total += self._idf[term] * freq * (BM25_K1 + 1) / (freq + norm)
+            scores.append(total)
+        return scores
+
+    @staticmethod
+    def _column_order(columns: list, column_descriptions: dict, terms: set) -> list:
+        """Column indexes, those matching the question first"""
+        def relevance(i):
+            col = columns[i]
+            col_terms = set(tokenize(col["name"])) | set(tokenize(column_descriptions.get(col["name"], "")))
+            return -len(col_terms & terms)
+        return sorted(range(len(columns)), key=lambda i: (relevance(i), i))
+
+    @staticmethod
+    def _omitted_note(count: int) -> str:
+        return f"({count} less relevant tables not shown)\n"
+
+    def _fit_table(self, i: int, order: list, overhead: int, remaining: int) -> tuple:
+        """(cost, block) keeping as many columns as fit in ``remaining`` tokens, or (0, None)"""
+        schema, table, columns, description, _ = self.tables[i]
+
+        cost = overhead + estimate_tokens(self._blocks[i])
+        if cost <= remaining:
+            return cost, (schema, table, self._blocks[i])
+
+        def cost_of(keep):
+            kept = [columns[j] for j in sorted(order[:keep])]
+            text = _format_table(table, kept, description, len(columns) - keep)
+            return overhead + estimate_tokens(text), (schema, table, text)
+
+        # Binary search on the column count; the cost grows with every column kept
+        low, high = min(1, len(columns)), len(columns) - 1
+        cost, fitted = cost_of(low)
+        if cost > remaining:
+            return 0, None
+        while low < high:
+            mid = (low + high + 1) // 2
+            mid_cost, mid_fitted = cost_of(mid)
+            if mid_cost <= remaining:
+                low, cost, fitted = mid, mid_cost, mid_fitted
+            else:
+                high = mid - 1
+        return cost, fitted
+
+    def core_prompt(self, token_budget: int, preferred_schema: str = None) -> tuple:
+        """Return (schema_prompt, tables) for a question-independent schema prefix within the budget
+
+        The whole schema when it fits, otherwise whole tables of
+        ``preferred_schema`` first and then the others in index order until the
+        budget is used. The text only depends on the fingerprint and the
+        arguments, so it can serve as a prompt-cache prefix; ``tables`` is the
+        set of (schema, table) it describes.
+        """
+        core_key = (token_budget, preferred_schema)
+        with self._memo_lock:
+            if core_key in self._core_prompts:
+                return self._core_prompts[core_key]
+
+        if self.full_tokens <= token_budget:
+            result = (self.full_prompt, frozenset((entry[0], entry[1]) for entry in self.tables))
+        else:
+            order = sorted(range(len(self.tables)), key=lambda i: (self.tables[i][0] != preferred_schema, i))
+            selected = []
+            used = estimate_tokens(PROMPT_HEADER)
+            schemas_seen = set()
+            for i in order:
+                schema = self.tables[i][0]
+                cost = estimate_tokens(self._blocks[i])
+                if schema not in schemas_seen:
+                    cost += estimate_tokens(f"Schema: {schema}\n\n")
+                if used + cost > token_budget:
+                    break
+                selected.append((schema, self.tables[i][1], self._blocks[i]))
+                schemas_seen.add(schema)
+                used += cost
+            result = (format_schema(selected), frozenset((schema, table) for schema, table, _ in selected))
+
+        with self._memo_lock:
+            self._core_prompts[core_key] = result
+        return result
+
+    def prune(self, question: str, token_budget: int = 2000, top_k: int = 8, exclude: frozenset = None) -> tuple:
+        """Return (schema_prompt, stats) describing the most relevant tables within the budget
+
+        Tables are taken in relevance order (up to ``top_k``, padded with
+        unmatched tables when fewer match). A table that does not fit whole is
+        included with its most relevant columns only; selection stops once
+        not even that fits. Tables in ``exclude`` (schema, table) are skipped,
+        e.g. those already described by core_prompt().
+        """
+        if not self.tables:
+            return "No schema information available.", {
+                "tables": 0, "total_tables": 0, "tokens": 0, "full_tokens": 0, "saved_pct": 0.0
+            }
+
+        terms = set(tokenize(question))
+        exclude = frozenset(exclude or ())
+        memo_key = (frozenset(terms), token_budget, top_k, exclude)
+        with self._memo_lock:
+            if memo_key in self._memo:
+                self._memo.move_to_end(memo_key)
+                prompt, stats = self._memo[memo_key]
+                return prompt, dict(stats)
+
+        scores = self.score(question)
+        ranked = sorted(range(len(self.tables)), key=lambda i: (-scores[i], i))
+        candidates = [i for i in ranked if self.tables[i][:2] not in exclude][:top_k]
+
+        selected = []
+        # Reserve room for the trailing "tables not shown" note
+        used = estimate_tokens(PROMPT_HEADER) + estimate_tokens(self._omitted_note(len(self.tables)))
+        schemas_seen = set()
+        for i in candidates:
+            schema, _, columns, _, column_descriptions = self.tables[i]
+            overhead = 0 if schema in schemas_seen else estimate_tokens(f"Schema: {schema}\n\n")
+            order = self._column_order(columns, column_descriptions, terms)
+            cost, block = self._fit_table(i, order, overhead, token_budget - used)
+            if block is None:
+                break
+            selected.append(block)
+            schemas_seen.add(schema)
+            used += cost
+
+        prompt = format_schema(selected)
+        omitted_tables = len(self.tables) - len(selected) - len(exclude)
+        if omitted_tables:
+            prompt += self._omitted_note(omitted_tables)
+
+        tokens = estimate_tokens(prompt)
+        stats = {
+            "tables": len(selected),
+            "total_tables": len(self.tables),
+            "tokens": tokens,
+            "full_tokens": self.full_tokens,
+            "saved_pct": max(0.0, 1 - tokens / self.full_tokens) * 100 if self.full_tokens else 0.0,
+        }
+        with self._memo_lock:
+            self._memo[memo_key] = (prompt, stats)
+            while len(self._memo) > self._memo_size:
+                self._memo.popitem(last=False)
+        return prompt, dict(stats)
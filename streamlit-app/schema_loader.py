@@ -0,0 +1,147 @@
+"""
+Bulk schema introspection for Trino catalogs
+
+Reads column metadata from information_schema in a single query instead of
+issuing SHOW TABLES / DESCRIBE for every table. Falls back to one query per
+schema (run in parallel) and finally to per-table DESCRIBE for connectors
+whose information_schema cannot be read.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+SYSTEM_SCHEMAS = ('information_schema', 'system')
+
+
+def _quote_literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _quote_ident(value: str) -> str:
+    return '"' + value.replace('"', '""') + '"'
+
+
+def _columns_query(catalog: str, schema: str = None) -> str:
+    excluded = ", ".join(_quote_literal(s) for s in SYSTEM_SCHEMAS)
+    sql = (
+        f"SELECT table_schema, table_name, column_name, data_type "
+        f"FROM {_quote_ident(catalog)}.information_schema.columns "
+        f"WHERE table_schema NOT IN ({excluded})"
+    )
+    if schema is not None:
+        sql += f" AND table_schema = {_quote_literal(schema)}"
+    return sql + " ORDER BY table_schema, table_name, ordinal_position"
+
+
+def _tables_query(catalog: str, schema: str = None) -> str:
+    excluded = ", ".join(_quote_literal(s) for s in SYSTEM_SCHEMAS)
+    sql = (
+        f"SELECT table_schema, table_name "
+        f"FROM {_quote_ident(catalog)}.information_schema.tables "
+        f"WHERE table_schema NOT IN ({excluded})"
+    )
+    if schema is not None:
+        sql += f" AND table_schema = {_quote_literal(schema)}"
+    return sql + " ORDER BY table_schema, table_name"
+
+
+def _fetch(conn, sql: str) -> list:
+    cursor = conn.cursor()
+    try:
+        cursor.execute(sql)
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+def _group_columns(rows) -> dict:
+    schema_info = {}
+    for table_schema, table_name, column_name, data_type in rows:
+        schema_info.setdefault(table_schema, {}).setdefault(table_name, []).append(
+            {"name": column_name, "type": data_type}
+        )
+    return schema_info
+
+
+def _describe_table(conn, schema: str, table: str) -> list:
+    rows = _fetch(conn, f"DESCRIBE {_quote_ident(schema)}.{_quote_ident(table)}")
+    return [{"name": col[0], "type": col[1]} for col in rows]
+
+
+def _fill_missing_tables(conn, schema_info: dict, table_rows, warnings: list):
+    """DESCRIBE tables that are listed but whose columns information_schema omitted"""
+    for table_schema, table_name in table_rows:
+        if table_name in schema_info.get(table_schema, {}):
+            continue
+        try:
+            columns = _describe_table(conn, table_schema, table_name)
+        except Exception as e:
+            warnings.append(f"Could not describe {table_schema}.{table_name}: {str(e)}")
+            continue
+        schema_info.setdefault(table_schema, {})[table_name] = columns
+
+
+def _load_schema_per_table(conn, schema: str, warnings: list) -> dict:
+    """Slow path: SHOW TABLES + DESCRIBE for every table in one schema"""
+    tables = [row[0] for row in _fetch(conn, f"SHOW TABLES FROM {_quote_ident(schema)}")]
+    tables_info = {}
+    for table in tables:
+        try:
+            tables_info[table] = _describe_table(conn, schema, table)
+        except Exception as e:
+            warnings.append(f"Could not describe {schema}.{table}: {str(e)}")
+    return tables_info
+
+
+def _load_one_schema(pool, catalog: str, schema: str) -> tuple:
+    """Load a single schema via information_schema, falling back to DESCRIBE"""
+    warnings = []
+    with pool.connection() as conn:
+        try:
+            tables = _group_columns(_fetch(conn, _columns_query(catalog, schema))).get(schema, {})
+            _fill_missing_tables(conn, {schema: tables}, _fetch(conn, _tables_query(catalog, schema)), warnings)
+        except Exception:
+            tables = _load_schema_per_table(conn, schema, warnings)
+    return tables, warnings
+
+
+def load_schema_context(pool, catalog: str, schemas: list = None, max_workers: int = 4) -> tuple:
+    """Return ({schema: {table: [{name, type}]}}, skipped_schemas, warnings)
+
+    ``pool`` is anything exposing a ``connection()`` context manager (see
+    TrinoConnectionPool). When ``schemas`` is given only those schemas are
+    loaded, one query per schema in parallel.
+    """
+    warnings = []
+    skipped_schemas = []
+
+    if schemas is None:
+        # Fast path: the whole catalog in two queries
+        try:
+            with pool.connection() as conn:
+                schema_info = _group_columns(_fetch(conn, _columns_query(catalog)))
+                _fill_missing_tables(conn, schema_info, _fetch(conn, _tables_query(catalog)), warnings)
+            return _drop_empty(schema_info), skipped_schemas, warnings
+        except (ConnectionError, OSError):
+            raise
+        except Exception:
+            with pool.connection() as conn:
+                schemas = [row[0] for row in _fetch(conn, "SHOW SCHEMAS")]
+
+    schemas = [s for s in schemas if s not in SYSTEM_SCHEMAS]
+    schema_info = {}
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(schemas) or 1))) as executor:
+        futures = {schema: executor.submit(_load_one_schema, pool, catalog, schema) for schema in schemas}
+        for schema, future in futures.items():
+            try:
+                tables, schema_warnings = future.result()
+            except Exception as e:
+                skipped_schemas.append(f"{schema} ({str(e)})")
+                continue
+            warnings.extend(schema_warnings)
+            schema_info[schema] = tables
+
+    return _drop_empty(schema_info), skipped_schemas, warnings
+
+
+def _drop_empty(schema_info: dict) -> dict:
+    return {schema: tables for schema, tables in schema_info.items() if tables}
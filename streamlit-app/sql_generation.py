@@ -0,0 +1,477 @@
+"""
+SQL generation with Claude, Mistral and a local Ollama model
+
+Builds the prompts, calls the providers (optionally streaming), parses the
+EXPLANATION/SQL reply and runs the result through the SQL guard. Kept free of
+Streamlit so the app and the offline benchmark drive the same code.
+"""
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import ollama
+from anthropic import Anthropic
+from dotenv import load_dotenv
+from mistralai import Mistral
+
+from schema_cache import schema_fingerprint
+from schema_index import SchemaIndex, estimate_tokens, load_dbt_descriptions
+from sql_guard import guard_sql, sql_diff
+from sql_stream import StreamingSQLParser, parse_llm_response
+
+load_dotenv()
+
+TRINO_SCHEMA = os.getenv("TRINO_SCHEMA", "dbt_marts")
+
+# Schema description sent to the LLMs: a question-independent block of up to
+# SCHEMA_PROMPT_CORE_TOKENS, then the question's other relevant tables within a token budget
+SCHEMA_PROMPT_CORE_TOKENS = int(os.getenv("SCHEMA_PROMPT_CORE_TOKENS", "8000"))
+SCHEMA_PROMPT_TOKEN_BUDGET = int(os.getenv("SCHEMA_PROMPT_TOKEN_BUDGET", "2000"))
+SCHEMA_PROMPT_TOP_K = int(os.getenv("SCHEMA_PROMPT_TOP_K", "8"))
+DBT_MANIFEST_PATH = os.getenv(
+    "DBT_MANIFEST_PATH",
+    str(Path(__file__).resolve().parent.parent / "dbt" / "target" / "manifest.json")
+)
+
+# Generated SQL is rewritten to a single read-only statement with at most this many rows
+SQL_MAX_LIMIT = int(os.getenv("SQL_MAX_LIMIT", "100"))
+# SELECT * over tables wider than this is narrowed to the columns the question mentions
+SQL_WIDE_TABLE_COLUMNS = int(os.getenv("SQL_WIDE_TABLE_COLUMNS", "20"))
+
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "qwen2.5-coder:7b")
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+# Keep the model (and its prompt-prefix KV cache) loaded between questions
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+# Fixed context window large enough for the schema prompt; changing it per request reloads the model
+OLLAMA_NUM_CTX = int(os.getenv(
+    "OLLAMA_NUM_CTX",
+    str(SCHEMA_PROMPT_CORE_TOKENS + SCHEMA_PROMPT_TOKEN_BUDGET + 2048)
+))
+
+CLAUDE_MODEL = os.getenv("CLAUDE_MODEL", "claude-sonnet-4-20250514")
+ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
+ANTHROPIC_BASE_URL = os.getenv("ANTHROPIC_BASE_URL")
+CLAUDE_PROMPT_CACHING = os.getenv("CLAUDE_PROMPT_CACHING", "true").lower() == "true"
+
+MISTRAL_MODEL = os.getenv("MISTRAL_MODEL", "mistral-small-latest")
+MISTRAL_API_KEY = os.getenv("MISTRAL_API_KEY")
+MISTRAL_SERVER_URL = os.getenv("MISTRAL_SERVER_URL")
+# Chunks read past the end of the SQL while waiting for the streamed usage block
+MISTRAL_USAGE_LOOKAHEAD_CHUNKS = 3
+
+# Initialize clients
+if ANTHROPIC_API_KEY:
+    anthropic_client = Anthropic(api_key=ANTHROPIC_API_KEY, base_url=ANTHROPIC_BASE_URL)
+else:
+    anthropic_client = None
+
+if MISTRAL_API_KEY:
+    mistral_client = Mistral(api_key=MISTRAL_API_KEY, server_url=MISTRAL_SERVER_URL)
+else:
+    mistral_client = None
+
+ollama_client = ollama.Client(host=OLLAMA_HOST)
+
+# Prompts are laid out as [fixed instructions][core schema][question's other
+# tables][question]: the instructions and the core schema block only change with
+# the schema fingerprint, so that prefix is byte-identical between questions and
+# can be served from the providers' prompt caches (Ollama's KV cache, Anthropic's
+# cache_control breakpoint).
+CHAT_INSTRUCTIONS = """You are a SQL expert specializing in Trino SQL. Based on user questions, provide:
+1. A brief explanation of your query approach (1 sentence)
+2. The SQL query
+
+Format your response exactly like this:
+EXPLANATION: [one sentence explaining the query approach]
+SQL:
+[the SQL query without markdown or code blocks, ending with a semicolon]
+
+Always use schema.table format. Return only SELECT statements."""
+
+OLLAMA_INSTRUCTIONS = """You are a SQL expert specializing in Trino SQL. Based on the user's question, provide:
+1. A brief explanation of what you'll query (1 sentence)
+2. The SQL query
+
+Format your response exactly like this:
+EXPLANATION: [one sentence explaining the query approach]
+SQL:
+[the SQL query without any markdown or code blocks, ending with a semicolon]
+
+Requirements for SQL:
+- Use proper Trino SQL syntax
+- Always specify schema.table format (e.g., dbt_marts.customers)
+- Return only SELECT statements
+- Use appropriate WHERE clauses, JOINs, and aggregations as needed
+- Limit results to 100 rows unless user specifies otherwise"""
+
+# Schema indexes by fingerprint; rebuilt only when the schema changes
+SCHEMA_INDEX_MAX_ENTRIES = 4
+_schema_indexes = OrderedDict()
+_schema_indexes_lock = threading.Lock()
+
+def get_schema_index(schema_context: dict) -> SchemaIndex:
+    """Relevance index over the schema, rebuilt only when the schema fingerprint changes"""
+    fingerprint = schema_fingerprint(schema_context)
+    with _schema_indexes_lock:
+        index = _schema_indexes.get(fingerprint)
+        if index is not None:
+            _schema_indexes.move_to_end(fingerprint)
+            return index
+    
+    index = SchemaIndex(schema_context, load_dbt_descriptions(DBT_MANIFEST_PATH))
+    with _schema_indexes_lock:
+        _schema_indexes[fingerprint] = index
+        while len(_schema_indexes) > SCHEMA_INDEX_MAX_ENTRIES:
+            _schema_indexes.popitem(last=False)
+    return index
+
+def format_schema_for_prompt(schema_context: dict, user_query: str) -> tuple:
+    """Describe the tables most relevant to user_query within SCHEMA_PROMPT_TOKEN_BUDGET
+
+    Returns (schema_desc, stats); stats compares the pruned prompt with the full schema.
+    """
+    if not schema_context:
+        return "No schema information available.", {}
+    
+    index = get_schema_index(schema_context)
+    return index.prune(user_query, token_budget=SCHEMA_PROMPT_TOKEN_BUDGET, top_k=SCHEMA_PROMPT_TOP_K)
+
+def schema_prompt_for(provider: str, schema_context: dict, user_query: str) -> tuple:
+    """Schema description generate_sql_with_<provider> sends for user_query
+
+    Returns (core_desc, extra_desc, stats). core_desc only changes with the
+    schema fingerprint (the whole schema, or when it exceeds
+    SCHEMA_PROMPT_CORE_TOKENS the tables of TRINO_SCHEMA first and then the
+    others until the budget is used); extra_desc describes the question's other
+    relevant tables within SCHEMA_PROMPT_TOKEN_BUDGET, or is empty. Claude
+    without prompt caching only gets the pruned description. stats covers both.
+    """
+    if provider == "claude" and not CLAUDE_PROMPT_CACHING:
+        schema_desc, stats = format_schema_for_prompt(schema_context, user_query)
+        return schema_desc, "", stats
+    if not schema_context:
+        return "No schema information available.", "", {}
+    
+    index = get_schema_index(schema_context)
+    core_desc, core_tables = index.core_prompt(SCHEMA_PROMPT_CORE_TOKENS, preferred_schema=TRINO_SCHEMA)
+    extra_desc = ""
+    extra_tables = 0
+    if len(core_tables) < len(index.tables):
+        pruned_desc, pruned_stats = index.prune(
+            user_query,
+            token_budget=SCHEMA_PROMPT_TOKEN_BUDGET,
+            top_k=SCHEMA_PROMPT_TOP_K,
+            exclude=core_tables
+        )
+        extra_desc = "Other tables relevant to this question:\n" + pruned_desc
+        extra_tables = pruned_stats["tables"]
+    
+    tokens = estimate_tokens(core_desc + extra_desc)
+    stats = {
+        "tables": len(core_tables) + extra_tables,
+        "total_tables": len(index.tables),
+        "tokens": tokens,
+        "full_tokens": index.full_tokens,
+        "saved_pct": max(0.0, 1 - tokens / index.full_tokens) * 100 if index.full_tokens else 0.0
+    }
+    return core_desc, extra_desc, stats
+
+def consume_token_stream(chunks, start_time: float, on_token=None, cancel=None) -> tuple:
+    """Accumulate streamed text, stopping as soon as a complete SQL statement is parsed
+
+    Returns (explanation, sql, metrics) where metrics holds time-to-first-token
+    and time-to-SQL in seconds since start_time. A cancelled ``cancel`` token
+    (see provider_race.CancelToken) raises between chunks, so the caller
+    closes the stream.
+    """
+    parser = StreamingSQLParser()
+    metrics = {"streamed": True, "ttft": None, "time_to_sql": None}
+    
+    for text in chunks:
+        if cancel is not None:
+            cancel.raise_if_cancelled()
+        if not text:
+            continue
+        if metrics["ttft"] is None:
+            metrics["ttft"] = time.time() - start_time
+        parser.feed(text)
+        if on_token:
+            on_token(parser.explanation, parser.sql)
+        if parser.sql_complete:
+            metrics["time_to_sql"] = time.time() - start_time
+            break
+    
+    explanation, sql = parser.result()
+    if metrics["time_to_sql"] is None:
+        metrics["time_to_sql"] = time.time() - start_time
+    return explanation, sql, metrics
+
+def finalize_sql(raw_sql: str, user_query: str, schema_context: dict) -> tuple:
+    """Run generated SQL through the SQL guard; returns (sql, guard_info, error)"""
+    sql, changes, error = guard_sql(
+        raw_sql,
+        max_limit=SQL_MAX_LIMIT,
+        schema_context=schema_context,
+        question=user_query,
+        default_schema=TRINO_SCHEMA,
+        wide_table_columns=SQL_WIDE_TABLE_COLUMNS
+    )
+    if error:
+        return None, {}, f"SQL Guard: {error}"
+    guard_info = {"changes": changes, "diff": sql_diff(raw_sql, sql) if changes else ""}
+    # Exports fetch the full result: same checks and rewrites, but no display LIMIT
+    export_sql, _, _ = guard_sql(
+        raw_sql,
+        schema_context=schema_context,
+        question=user_query,
+        default_schema=TRINO_SCHEMA,
+        wide_table_columns=SQL_WIDE_TABLE_COLUMNS
+    )
+    if export_sql != sql:
+        guard_info["export_sql"] = export_sql
+    return sql, guard_info, None
+
+def claude_usage(usage) -> dict:
+    """Input token accounting from an Anthropic usage block"""
+    cached = getattr(usage, "cache_read_input_tokens", None) or 0
+    written = getattr(usage, "cache_creation_input_tokens", None) or 0
+    return {
+        "input_tokens": (usage.input_tokens or 0) + cached + written,
+        "cached_tokens": cached,
+        "cache_write_tokens": written
+    }
+
+def mistral_usage(usage) -> dict:
+    """Input token accounting from a Mistral usage block (no prompt caching)"""
+    if usage is None:
+        return {}
+    return {"input_tokens": usage.prompt_tokens or 0, "cached_tokens": 0, "cache_write_tokens": 0}
+
+def ollama_usage(response) -> dict:
+    """Input token accounting from a final Ollama response
+
+    Ollama does not report cache hits directly; prompt_eval_count only counts
+    tokens that had to be evaluated, and prompt_eval_ms shows the saving.
+    """
+    evaluated = response.get('prompt_eval_count')
+    if evaluated is None:
+        return {}
+    return {
+        "input_tokens": evaluated,
+        "cached_tokens": None,
+        "cache_write_tokens": 0,
+        "prompt_eval_ms": (response.get('prompt_eval_duration') or 0) / 1e6
+    }
+
+def generate_sql_with_ollama(user_query: str, schema_context: dict, stream: bool = False,
+                             on_token=None, cancel=None) -> tuple:
+    """Use Ollama to generate SQL from natural language"""
+    start_time = time.time()
+    
+    core_desc, extra_desc, schema_stats = schema_prompt_for("ollama", schema_context, user_query)
+    
+    # Only the question's own tables and the question follow the instructions +
+    # core schema prefix, so Ollama can reuse its KV cache for that prefix
+    prompt = f"""{OLLAMA_INSTRUCTIONS}
+
+{core_desc}{extra_desc}
+User question: {user_query}
+
+Response:"""
+
+    try:
+        options = {
+            "temperature": 0.1,
+            "num_predict": 500,
+            "num_ctx": OLLAMA_NUM_CTX
+        }
+        
+        if stream:
+            chunks = ollama_client.generate(
+                model=OLLAMA_MODEL,
+                prompt=prompt,
+                options=options,
+                keep_alive=OLLAMA_KEEP_ALIVE,
+                stream=True
+            )
+            final_chunks = []
+            
+            def texts():
+                for chunk in chunks:
+                    if chunk.get('done'):
+                        final_chunks.append(chunk)
+                    yield chunk['response']
+            
+            try:
+                explanation, sql, metrics = consume_token_stream(texts(), start_time, on_token, cancel)
+            finally:
+                # Closing the generator aborts the HTTP stream, which stops generation
+                chunks.close()
+            # Token counts only arrive with the final chunk, i.e. when generation was not cut short
+            if final_chunks:
+                metrics["usage"] = ollama_usage(final_chunks[0])
+        else:
+            response = ollama_client.generate(
+                model=OLLAMA_MODEL,
+                prompt=prompt,
+                options=options,
+                keep_alive=OLLAMA_KEEP_ALIVE
+            )
+            explanation, sql = parse_llm_response(response['response'])
+            metrics = {
+                "streamed": False,
+                "ttft": None,
+                "time_to_sql": time.time() - start_time,
+                "usage": ollama_usage(response)
+            }
+        
+        # The schema description actually sent, for the prompt caption and the generation cache key
+        metrics["schema_prompt"] = schema_stats
+        metrics["schema_desc"] = core_desc + extra_desc
+        
+        # Drops explanatory text before/after the SQL and enforces a single bounded SELECT
+        sql, metrics["guard"], guard_error = finalize_sql(sql, user_query, schema_context)
+        
+        elapsed_time = time.time() - start_time
+        if guard_error:
+            return None, elapsed_time, guard_error, explanation, metrics
+        return sql, elapsed_time, None, explanation, metrics
+        
+    except Exception as e:
+        elapsed_time = time.time() - start_time
+        return None, elapsed_time, str(e), None, {}
+
+def generate_sql_with_claude(user_query: str, schema_context: dict, stream: bool = False,
+                             on_token=None, cancel=None) -> tuple:
+    """Use Claude to generate SQL from natural language"""
+    
+    if not anthropic_client:
+        return None, 0, "Anthropic API key not configured", None, {}
+    
+    start_time = time.time()
+    
+    core_desc, extra_desc, schema_stats = schema_prompt_for("claude", schema_context, user_query)
+    core_block = {"type": "text", "text": core_desc}
+    if CLAUDE_PROMPT_CACHING:
+        # Cache breakpoint after the core schema block; the question's other tables follow it
+        core_block["cache_control"] = {"type": "ephemeral"}
+    system = [{"type": "text", "text": CHAT_INSTRUCTIONS}, core_block]
+    if extra_desc:
+        system.append({"type": "text", "text": extra_desc})
+    
+    request = dict(
+        model=CLAUDE_MODEL,
+        max_tokens=1000,
+        temperature=0.1,
+        system=system,
+        messages=[
+            {"role": "user", "content": user_query}
+        ]
+    )
+    
+    try:
+        if stream:
+            # Leaving the context manager early closes the connection and stops generation
+            with anthropic_client.messages.stream(**request) as response_stream:
+                explanation, sql, metrics = consume_token_stream(
+                    response_stream.text_stream,
+                    start_time,
+                    on_token,
+                    cancel
+                )
+                # Input usage (including cache reads/writes) arrives with message_start
+                metrics["usage"] = claude_usage(response_stream.current_message_snapshot.usage)
+        else:
+            response = anthropic_client.messages.create(**request)
+            explanation, sql = parse_llm_response(response.content[0].text)
+            metrics = {
+                "streamed": False,
+                "ttft": None,
+                "time_to_sql": time.time() - start_time,
+                "usage": claude_usage(response.usage)
+            }
+        
+        metrics["schema_prompt"] = schema_stats
+        metrics["schema_desc"] = core_desc + extra_desc
+        sql, metrics["guard"], guard_error = finalize_sql(sql, user_query, schema_context)
+        
+        elapsed_time = time.time() - start_time
+        if guard_error:
+            return None, elapsed_time, guard_error, explanation, metrics
+        return sql, elapsed_time, None, explanation, metrics
+        
+    except Exception as e:
+        elapsed_time = time.time() - start_time
+        return None, elapsed_time, str(e), None, {}
+
+def generate_sql_with_mistral(user_query: str, schema_context: dict, stream: bool = False,
+                              on_token=None, cancel=None) -> tuple:
+    """Use Mistral to generate SQL from natural language"""
+    
+    if not mistral_client:
+        return None, 0, "Mistral API key not configured", None, {}
+    
+    start_time = time.time()
+    
+    core_desc, extra_desc, schema_stats = schema_prompt_for("mistral", schema_context, user_query)
+    
+    system_prompt = f"{CHAT_INSTRUCTIONS}\n\n{core_desc}{extra_desc}"
+    
+    request = dict(
+        model=MISTRAL_MODEL,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_query}
+        ],
+        temperature=0.1,
+        max_tokens=1000
+    )
+    
+    try:
+        if stream:
+            # Leaving the context manager early closes the connection and stops generation
+            with mistral_client.chat.stream(**request) as response_stream:
+                usage_chunks = []
+                
+                def texts():
+                    for event in response_stream:
+                        if event.data.usage is not None:
+                            usage_chunks.append(event.data.usage)
+                        if event.data.choices:
+                            yield event.data.choices[0].delta.content
+                
+                explanation, sql, metrics = consume_token_stream(texts(), start_time, on_token, cancel)
+                # Usage only arrives with the final chunk, which follows right after the SQL
+                # when the reply ends there; look a few chunks ahead for it before closing
+                if not usage_chunks:
+                    for event in itertools.islice(response_stream, MISTRAL_USAGE_LOOKAHEAD_CHUNKS):
+                        if event.data.usage is not None:
+                            usage_chunks.append(event.data.usage)
+                            break
+            if usage_chunks:
+                metrics["usage"] = mistral_usage(usage_chunks[-1])
+        else:
+            response = mistral_client.chat.complete(**request)
+            explanation, sql = parse_llm_response(response.choices[0].message.content)
+            metrics = {
+                "streamed": False,
+                "ttft": None,
+                "time_to_sql": time.time() - start_time,
+                "usage": mistral_usage(response.usage)
+            }
+        
+        metrics["schema_prompt"] = schema_stats
+        metrics["schema_desc"] = core_desc + extra_desc
+        sql, metrics["guard"], guard_error = finalize_sql(sql, user_query, schema_context)
+        
+        elapsed_time = time.time() - start_time
+        if guard_error:
+            return None, elapsed_time, guard_error, explanation, metrics
+        return sql, elapsed_time, None, explanation, metrics
+        
+    except Exception as e:
+        elapsed_time = time.time() - start_time
+        return None, elapsed_time, str(e), None, {}
@@ -0,0 +1,189 @@
+"""
+Guard and rewrite generated SQL before it reaches Trino
+
+Extracts a single statement from model output, rejects anything that is not
+a read-only query, injects or tightens the outer LIMIT and, for simple
+single-table queries, narrows ``SELECT *`` on wide tables to the columns the
+question mentions. Used by every generator and by the MCP server.
+"""
+import difflib
+import re
+
+import sqlparse
+from sqlparse import sql as S
+from sqlparse import tokens as T
+
+from schema_index import tokenize
+from sql_stream import find_statement_end
+
+# First words that start a new SQL statement (anything else after ';' is prose)
+STATEMENT_KEYWORDS = {
+    "SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "MERGE", "CREATE", "DROP", "ALTER",
+    "TRUNCATE", "GRANT", "REVOKE", "CALL", "EXECUTE", "PREPARE", "DEALLOCATE", "SET",
+    "RESET", "USE", "COMMIT", "ROLLBACK", "START", "SHOW", "DESCRIBE", "EXPLAIN",
+    "ANALYZE", "COMMENT", "REFRESH", "VALUES",
+}
+
+
+def extract_statement(text: str) -> tuple:
+    """Pull the SQL statement out of model output; returns (sql, error)
+
+    Leading prose is skipped up to the first line starting with SELECT/WITH,
+    and trailing prose after the terminating semicolon is dropped. A second
+    statement after the semicolon is an error.
+    """
+    text = text.replace("```sql", "").replace("```", "").strip()
+    lines = text.split("\n")
+    for i, line in enumerate(lines):
+        if line.strip().upper().startswith(("SELECT", "WITH", "(")):
+            text = "\n".join(lines[i:])
+            break
+
+    end = find_statement_end(text)
+    if end == -1:
+        return text.strip(), None
+    rest = text[end + 1:].strip()
+    first_word = re.match(r"[A-Za-z]+", rest)
+    if first_word and first_word.group(0).upper() in STATEMENT_KEYWORDS:
+        return None, "Only a single SQL statement is allowed"
+    return text[:end].strip(), None
+
+
+def _significant(tokens: list) -> list:
+    return [t for t in tokens if not t.is_whitespace and t.ttype not in T.Comment]
+
+
+def _check_read_only(statement) -> str:
+    """Error message if the statement could modify anything, else None"""
+    tokens = _significant(statement.tokens)
+    if not tokens:
+        return "Empty SQL statement"
+    first = tokens[0]
+    if not (first.ttype in T.Keyword.DML and first.normalized == "SELECT"
+            or first.ttype in T.Keyword.CTE
+            or isinstance(first, S.Parenthesis)):
+        return f"Only SELECT queries are allowed (got {first.normalized.split()[0]})"
+    for token in statement.flatten():
+        if token.ttype in T.Keyword.DDL or (token.ttype in T.Keyword.DML and token.normalized != "SELECT"):
+            return f"Only read-only queries are allowed ({token.normalized} found)"
+    return None
+
+
+def _apply_limit(statement, max_limit: int, changes: list) -> str:
+    """Tighten an existing top-level LIMIT/FETCH FIRST or append one"""
+    tokens = _significant(statement.tokens)
+    for i, token in enumerate(tokens):
+        if token.ttype in T.Keyword and token.normalized in ("LIMIT", "FETCH"):
+            count = next(
+                (t for t in tokens[i + 1:i + 3] if t.ttype in T.Literal.Number.Integer
+                 or (t.ttype in T.Keyword and t.normalized == "ALL")),
+                None
+            )
+            if count is None:
+                return str(statement)
+            if count.ttype in T.Keyword or int(count.value) > max_limit:
+                changes.append(f"Tightened {token.normalized} {count.value} to {max_limit}")
+                count.value = str(max_limit)
+            return str(statement)
+    changes.append(f"Added LIMIT {max_limit}")
+    return f"{str(statement).rstrip()}\nLIMIT {max_limit}"
+
+
+def _table_parts(identifier) -> list:
+    """['schema', 'table'] style name parts of a FROM identifier (alias excluded)"""
+    parts = []
+    for token in identifier.tokens:
+        if token.is_whitespace or isinstance(token, S.Identifier) or token.ttype in T.Keyword:
+            break
+        if token.ttype in T.Name:
+            parts.append(token.value)
+        elif token.ttype in T.Literal.String.Symbol:
+            parts.append(token.value[1:-1].replace('""', '"'))
+    return parts
+
+
+def _quote_column(name: str) -> str:
+    if re.fullmatch(r"[a-z_][a-z0-9_]*", name):
+        return name
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _expand_wildcard(statement, schema_context: dict, question: str, default_schema: str,
+                     wide_table_columns: int, changes: list):
+    """Replace SELECT * on a wide table with the columns the question refers to"""
+    tokens = _significant(statement.tokens)
+    if len(tokens) < 4 or not (tokens[0].ttype in T.Keyword.DML and tokens[0].normalized == "SELECT"):
+        return
+    wildcard, from_kw, source = tokens[1], tokens[2], tokens[3]
+    if wildcard.ttype is not T.Wildcard or not (from_kw.ttype in T.Keyword and from_kw.normalized == "FROM"):
+        return
+    if not isinstance(source, S.Identifier):
+        return
+    if any(t.ttype in T.Keyword and "JOIN" in t.normalized for t in tokens):
+        return
+
+    parts = _table_parts(source)
+    if not parts:
+        return
+    table = parts[-1].lower()
+    schema = parts[-2].lower() if len(parts) > 1 else (default_schema or "").lower()
+    columns = next(
+        (cols for s, tables in (schema_context or {}).items() if s.lower() == schema
+         for t, cols in tables.items() if t.lower() == table),
+        None
+    )
+    if not columns or len(columns) <= wide_table_columns:
+        return
+
+    terms = set(tokenize(question or ""))
+    needed = [col["name"] for col in columns if set(tokenize(col["name"])) & terms]
+    if not needed:
+        return
+    wildcard.value = ", ".join(_quote_column(name) for name in needed)
+    changes.append(
+        f"Expanded SELECT * on {schema}.{table} ({len(columns)} columns) "
+        f"to {len(needed)} columns mentioned in the question"
+    )
+
+
+def guard_sql(sql: str, max_limit: int = None, schema_context: dict = None, question: str = None,
+              default_schema: str = None, wide_table_columns: int = 20) -> tuple:
+    """Validate and rewrite generated SQL; returns (sql, changes, error)
+
+    ``changes`` lists human readable rewrites. With ``max_limit`` set the
+    outer LIMIT is injected or tightened; with ``schema_context`` and
+    ``question`` set, ``SELECT *`` over tables wider than
+    ``wide_table_columns`` is narrowed to the columns the question mentions.
+    """
+    if not sql or not sql.strip():
+        return None, [], "Empty SQL statement"
+
+    statement_sql, error = extract_statement(sql)
+    if error:
+        return None, [], error
+    statement_sql = sqlparse.format(statement_sql, strip_comments=True).strip().rstrip(";").strip()
+    statements = [s for s in sqlparse.parse(statement_sql) if str(s).strip()]
+    if len(statements) != 1:
+        return None, [], "Only a single SQL statement is allowed"
+    statement = statements[0]
+
+    error = _check_read_only(statement)
+    if error:
+        return None, [], error
+
+    changes = []
+    if schema_context and question:
+        _expand_wildcard(statement, schema_context, question, default_schema, wide_table_columns, changes)
+    rewritten = _apply_limit(statement, max_limit, changes) if max_limit else str(statement)
+    return rewritten.strip(), changes, None
+
+
+def sql_diff(original: str, rewritten: str) -> str:
+    """Unified diff between the model's SQL and the SQL that will run"""
+    return "\n".join(difflib.unified_diff(
+        (original or "").strip().splitlines(),
+        (rewritten or "").strip().splitlines(),
+        fromfile="generated",
+        tofile="executed",
+        lineterm=""
+    ))
@@ -0,0 +1,123 @@
+"""
+Incremental parsing of "EXPLANATION: ... SQL: ..." LLM responses
+
+Lets the generators show the explanation and SQL while tokens are still
+arriving, and stop generation as soon as a complete SQL statement has been
+received (terminating semicolon or closing code fence).
+"""
+
+
+def parse_llm_response(full_response: str) -> tuple:
+    """Split a complete response into (explanation, sql)"""
+    full_response = full_response.strip()
+
+    if "EXPLANATION:" in full_response and "SQL:" in full_response:
+        parts = full_response.split("SQL:", 1)
+        explanation = parts[0].replace("EXPLANATION:", "").strip()
+        sql = parts[1].strip()
+    else:
+        # Fallback if format not followed
+        explanation = ""
+        sql = full_response
+
+    # Clean up formatting
+    sql = sql.replace('```sql', '').replace('```', '').strip().rstrip(';')
+    return explanation, sql
+
+
+def find_statement_end(sql: str) -> int:
+    """Index of the first top-level ';' in sql, or -1 if the statement is not terminated
+
+    Semicolons inside string literals, quoted identifiers and comments are ignored.
+    """
+    i = 0
+    n = len(sql)
+    while i < n:
+        ch = sql[i]
+        if ch in ("'", '"'):
+            # Skip quoted text; doubled quotes are escapes
+            j = i + 1
+            while j < n:
+                if sql[j] == ch:
+                    if j + 1 < n and sql[j + 1] == ch:
+                        j += 2
+                        continue
+                    break
+                j += 1
+            if j >= n:
+                return -1
+            i = j + 1
+            continue
+        if sql.startswith('--', i):
+            newline = sql.find('\n', i)
+            if newline == -1:
+                return -1
+            i = newline + 1
+            continue
+        if sql.startswith('/*', i):
+            close = sql.find('*/', i + 2)
+            if close == -1:
+                return -1
+            i = close + 2
+            continue
+        if ch == ';':
+            return i
+        i += 1
+    return -1
+
+
+class StreamingSQLParser:
+    """Accumulate streamed tokens and detect when the SQL statement is complete"""
+
+    def __init__(self):
+        self.text = ""
+        self.sql_complete = False
+
+    def feed(self, chunk: str):
+        if self.sql_complete:
+            return
+        self.text += chunk
+        if self._sql_body() is not None and self._complete_sql() is not None:
+            self.sql_complete = True
+
+    def _sql_body(self):
+        if "SQL:" not in self.text:
+            return None
+        body = self.text.split("SQL:", 1)[1].lstrip()
+        if body.startswith("```"):
+            # Drop the opening fence (and optional language tag)
+            newline = body.find("\n")
+            body = body[newline + 1:] if newline != -1 else ""
+        return body
+
+    def _complete_sql(self):
+        body = self._sql_body()
+        if body is None or not body.strip():
+            return None
+        end = find_statement_end(body)
+        fence = body.find("```")
+        if end != -1 and (fence == -1 or end < fence):
+            return body[:end]
+        if fence != -1:
+            return body[:fence]
+        return None
+
+    @property
+    def explanation(self) -> str:
+        head = self.text.split("SQL:", 1)[0]
+        return head.replace("EXPLANATION:", "").strip()
+
+    @property
+    def sql(self) -> str:
+        """SQL received so far (the full statement once sql_complete is set)"""
+        complete = self._complete_sql()
+        if complete is not None:
+            return complete.strip()
+        body = self._sql_body()
+        return body.strip() if body else ""
+
+    def result(self) -> tuple:
+        """(explanation, sql) for whatever has been received"""
+        if self.sql_complete:
+            return self.explanation, self.sql.rstrip(';')
+        return parse_llm_response(self.text)
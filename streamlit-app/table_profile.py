@@ -0,0 +1,159 @@
+"""
+Column profiles of lakehouse tables, cached per Iceberg snapshot
+
+A profile is the row count plus, per column, the null ratio, approximate
+distinct count and min/max, computed in one aggregate query over the table.
+Profiles are stored in SQLite under the table's latest snapshot id and reused
+until a new snapshot is committed. Tables without snapshots (non-Iceberg
+connectors) are re-profiled after the TTL.
+"""
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime
+from pathlib import Path
+
+from result_frame import parse_trino_type
+from schema_cache import latest_snapshot_id
+
+# Only the null ratio is computed for these (no ordering, or too costly to hash)
+UNPROFILED_TYPES = {"array", "map", "row", "json", "varbinary"}
+
+
+def _quote_ident(value: str) -> str:
+    return '"' + value.replace('"', '""') + '"'
+
+
+def _json_value(value):
+    """Min/max values as JSON: numbers stay numbers, decimals and dates become strings"""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+def profile_query(schema: str, table: str, columns: list) -> str:
+    """One aggregate query for the whole profile; ``columns`` are {"name", "type"} dicts"""
+    expressions = ["count(*)"]
+    for column in columns:
+        name = _quote_ident(column["name"])
+        expressions.append(f"count({name})")
+        if parse_trino_type(column["type"])[0] not in UNPROFILED_TYPES:
+            expressions += [f"approx_distinct({name})", f"min({name})", f"max({name})"]
+    select = ",\n    ".join(expressions)
+    return f"SELECT\n    {select}\nFROM {_quote_ident(schema)}.{_quote_ident(table)}"
+
+
+def profile_table(cursor, schema: str, table: str, columns: list) -> dict:
+    """Run the profile query and shape its single row"""
+    start_time = time.time()
+    cursor.execute(profile_query(schema, table, columns))
+    values = iter(cursor.fetchone())
+    rows = next(values)
+    profiled = []
+    for column in columns:
+        non_null = next(values)
+        entry = {
+            "name": column["name"],
+            "type": column["type"],
+            "null_ratio": (rows - non_null) / rows if rows else 0.0,
+        }
+        if parse_trino_type(column["type"])[0] not in UNPROFILED_TYPES:
+            entry["distinct"] = next(values)
+            entry["min"] = _json_value(next(values))
+            entry["max"] = _json_value(next(values))
+        profiled.append(entry)
+    return {
+        "table": f"{schema}.{table}",
+        "rows": rows,
+        "columns": profiled,
+        "profiled_at": time.time(),
+        "elapsed": time.time() - start_time,
+    }
+
+
+class ProfileCache:
+    """Thread-safe SQLite store of table profiles keyed by table and snapshot id"""
+
+    def __init__(self, catalog: str, disk_path: Path, ttl: float = 86400.0):
+        self.catalog = catalog
+        self.disk_path = Path(disk_path)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._table_locks = {}
+        self.disk_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._disk() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS profiles ("
+                "key TEXT PRIMARY KEY, snapshot_id TEXT, profile TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+
+    @contextmanager
+    def _disk(self):
+        db = sqlite3.connect(self.disk_path, timeout=5)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def _key(self, schema: str, table: str) -> str:
+        return f"{self.catalog}.{schema}.{table}"
+
+    def _table_lock(self, key: str) -> threading.Lock:
+        with self._lock:
+            return self._table_locks.setdefault(key, threading.Lock())
+
+    def peek(self, schema: str, table: str):
+        """Last stored profile (possibly for an older snapshot) without touching Trino, or None"""
+        with self._disk() as db:
+            row = db.execute(
+                "SELECT profile, snapshot_id FROM profiles WHERE key = ?", (self._key(schema, table),)
+            ).fetchone()
+        if not row:
+            return None
+        profile = json.loads(row[0])
+        profile["snapshot_id"] = row[1]
+        return profile
+
+    def get(self, cursor, schema: str, table: str, columns: list, check=None) -> tuple:
+        """Return (profile, cached) for the table's current snapshot, profiling it on a miss
+
+        ``check(sql)`` is called with the profile query before it runs and may
+        raise to prevent it (e.g. a cost budget). Concurrent calls for the same
+        table wait for one profile query.
+        """
+        try:
+            snapshot_id = latest_snapshot_id(cursor, schema, table)
+        except (ConnectionError, OSError):
+            raise
+        except Exception:
+            # Not an Iceberg table: fall back to the TTL
+            snapshot_id = None
+
+        key = self._key(schema, table)
+        with self._table_lock(key):
+            with self._disk() as db:
+                row = db.execute(
+                    "SELECT profile, snapshot_id, created_at FROM profiles WHERE key = ?", (key,)
+                ).fetchone()
+            if row and row[1] == snapshot_id and (snapshot_id or time.time() - row[2] < self.ttl):
+                profile = json.loads(row[0])
+                # Adding a column does not commit a snapshot
+                if [c["name"] for c in profile["columns"]] == [c["name"] for c in columns]:
+                    profile["snapshot_id"] = snapshot_id
+                    return profile, True
+
+            if check is not None:
+                check(profile_query(schema, table, columns))
+            profile = profile_table(cursor, schema, table, columns)
+            with self._disk() as db:
+                db.execute(
+                    "INSERT OR REPLACE INTO profiles (key, snapshot_id, profile, created_at) VALUES (?, ?, ?, ?)",
+                    (key, snapshot_id, json.dumps(profile), profile["profiled_at"])
+                )
+        profile["snapshot_id"] = snapshot_id
+        return profile, False
@@ -0,0 +1,167 @@
+"""
+Bounded, thread-safe pool of Trino connections shared by all Streamlit sessions
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+
+class PoolTimeoutError(ConnectionError):
+    """Raised when no connection becomes available within the checkout timeout"""
+
+
+class TrinoConnectionPool:
+    """Reuse Trino connections (and their HTTP sessions) across queries.
+
+    Connections are created lazily up to ``max_size``. Idle connections older
+    than ``idle_timeout`` are evicted, and connections that have been idle for
+    longer than ``health_check_interval`` are pinged with ``SELECT 1`` before
+    being handed out again.
+    """
+
+    def __init__(self, connect_fn, max_size: int = 8, idle_timeout: float = 300.0,
+                 health_check_interval: float = 30.0, checkout_timeout: float = 30.0):
+        self._connect_fn = connect_fn
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.checkout_timeout = checkout_timeout
+
+        self._idle = []  # list of (connection, last_used_timestamp)
+        self._in_use = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+        self._stats = {
+            "checkouts": 0,
+            "created": 0,
+            "reconnects": 0,
+            "evicted": 0,
+            "timeouts": 0,
+            "total_wait_time": 0.0,
+            "max_wait_time": 0.0,
+        }
+
+    def _evict_idle(self):
+        """Close connections idle for longer than idle_timeout (lock held)"""
+        now = time.time()
+        keep = []
+        for conn, last_used in self._idle:
+            if now - last_used > self.idle_timeout:
+                self._close_quietly(conn)
+                self._stats["evicted"] += 1
+            else:
+                keep.append((conn, last_used))
+        self._idle = keep
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    @staticmethod
+    def _is_healthy(conn) -> bool:
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchall()
+            cursor.close()
+            return True
+        except Exception:
+            return False
+
+    def acquire(self):
+        """Check out a connection, waiting up to checkout_timeout if the pool is exhausted"""
+        start = time.time()
+        deadline = start + self.checkout_timeout
+
+        with self._cond:
+            if self._closed:
+                raise ConnectionError("Trino connection pool is closed")
+
+            while True:
+                self._evict_idle()
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    break
+                if self._in_use < self.max_size:
+                    conn, last_used = None, None
+                    break
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeoutError(
+                        f"No Trino connection available after {self.checkout_timeout:.0f}s "
+                        f"(pool size {self.max_size})"
+                    )
+                self._cond.wait(remaining)
+
+            # Reserve the slot before doing any I/O outside the lock
+            self._in_use += 1
+            wait_time = time.time() - start
+            self._stats["checkouts"] += 1
+            self._stats["total_wait_time"] += wait_time
+            self._stats["max_wait_time"] = max(self._stats["max_wait_time"], wait_time)
+
+        try:
+            if conn is None:
+                conn = self._connect_fn()
+                with self._cond:
+                    self._stats["created"] += 1
+            elif time.time() - last_used > self.health_check_interval and not self._is_healthy(conn):
+                self._close_quietly(conn)
+                conn = self._connect_fn()
+                with self._cond:
+                    self._stats["reconnects"] += 1
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+        return conn
+
+    def release(self, conn, discard: bool = False):
+        """Return a connection to the pool, or close it if it is broken"""
+        with self._cond:
+            self._in_use -= 1
+            if discard or self._closed:
+                self._close_quietly(conn)
+            else:
+                self._idle.append((conn, time.time()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Context manager that checks a connection out and returns it afterwards"""
+        conn = self.acquire()
+        broken = False
+        try:
+            yield conn
+        except (ConnectionError, OSError):
+            broken = True
+            raise
+        finally:
+            self.release(conn, discard=broken)
+
+    def close(self):
+        """Close every idle connection and refuse further checkouts"""
+        with self._cond:
+            self._closed = True
+            for conn, _ in self._idle:
+                self._close_quietly(conn)
+            self._idle = []
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        """Snapshot of pool metrics for display"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats["in_use"] = self._in_use
+            stats["idle"] = len(self._idle)
+            stats["max_size"] = self.max_size
+        checkouts = stats["checkouts"]
+        stats["avg_wait_time"] = stats["total_wait_time"] / checkouts if checkouts else 0.0
+        return stats